@@ -9,9 +9,12 @@ from io import BytesIO
 
 # --- IMPORT MODUL SENDIRI ---
 import pendapatan_analyzer as pend_analyzer
+import pendapatan_tren as pend_tren
+import ingestion as ingest
 from helpers import (generate_laporan_pendapatan_xlsx, generate_laporan_pendapatan_docx, 
-                      generate_template_pendapatan)
-from belanja_dashboard import dashboard_belanja
+                      generate_template_pendapatan, konversi_kolom_nilai)
+from belanja_dashboard import dashboard_belanja, parquet_options_ui
+from pendapatan_panel import PanelPendapatan, pivot_long_pendapatan
 
 
 st.set_page_config(page_title="Dashboard Sampling Audit", layout="wide")
@@ -31,7 +34,8 @@ st.markdown("---")
 if jenis_sampling == "Pendapatan":
     # ===== DASHBOARD PENDAPATAN =====
     st.subheader("📊 Analisis Anomali Pendapatan Wajib Pajak")
-    st.write("Unggah data pelaporan untuk mengidentifikasi WP dengan pelaporan identik atau variasi rendah (<=20%).")
+    st.write("Unggah data pelaporan untuk mengidentifikasi WP dengan pelaporan identik atau variasi rendah "
+             "(default <=5%, ambang dapat diatur pada Pengaturan Aturan Anomali).")
     
     # Download Template
     st.markdown("---")
@@ -55,38 +59,214 @@ if jenis_sampling == "Pendapatan":
         type=['xlsx', 'csv', 'parquet'],
         key='pend_uploader'
     )
+    mode_hemat_pend = st.checkbox(
+        "🗜️ Mode Hemat Memori",
+        value=False,
+        key='pend_compact',
+        help="Teks berulang disimpan sebagai kategori, teks lain sebagai string Arrow, "
+             "dan angka di-downcast bila aman."
+    )
+    
+    bulan_list = ['JANUARI', 'FEBRUARI', 'MARET', 'APRIL', 'MEI', 'JUNI',
+                  'JULI', 'AGUSTUS', 'SEPTEMBER', 'OKTOBER', 'NOVEMBER', 'DESEMBER']
     
     if uploaded_file_pend:
-        # Load data berdasarkan ekstensi
+        # Parquet: hanya kolom template yang dibaca (bisa diubah) + filter opsional
+        pq_options_pend = None
+        if uploaded_file_pend.name.endswith('.parquet'):
+            kolom_template = ['NOMOR', 'NAMA WP', 'NPWPD'] + bulan_list
+            schema_cols = ingest.read_parquet_schema(uploaded_file_pend)
+            pq_options_pend = parquet_options_ui(
+                uploaded_file_pend, key_prefix='pend',
+                default_columns=[c for c in kolom_template if c in schema_cols])
+        
+        # Kunci data untuk cache turunan (pivot, panel) di session state
+        data_key_pend = (ingest.content_hash(uploaded_file_pend), repr(pq_options_pend))
+        
+        def muat_data_pend():
+            """Load data berdasarkan ekstensi (di-cache berdasarkan hash konten file).
+            Mode hemat tidak menyimpan DataFrame di cache memori karena yang
+            dipakai hanya panel WP x bulan."""
+            if pq_options_pend is not None:
+                return ingest.load_parquet_filtered(
+                    uploaded_file_pend, *pq_options_pend, convert_rupiah=False, compact=mode_hemat_pend,
+                    use_cache=not mode_hemat_pend)
+            return ingest.load_uploaded_dataframe(
+                uploaded_file_pend, sniff_csv=False, convert_rupiah=False, compact=mode_hemat_pend,
+                use_cache=not mode_hemat_pend)
+        
+        def pivot_pend(df_long, kolom_npwpd, kolom_bulan, kolom_nilai, kolom_nama):
+            df_long = df_long.assign(**{kolom_nilai: konversi_kolom_nilai(df_long[kolom_nilai])})
+            return pivot_long_pendapatan(df_long, kolom_npwpd, kolom_bulan, kolom_nilai,
+                                         None if kolom_nama == '(tidak ada)' else kolom_nama)
+        
         try:
-            if uploaded_file_pend.name.endswith('.csv'):
-                df_pend = pd.read_csv(uploaded_file_pend)
-            elif uploaded_file_pend.name.endswith('.parquet'):
-                df_pend = pd.read_parquet(uploaded_file_pend)
-            else:
-                df_pend = pd.read_excel(uploaded_file_pend)
+            # Mode hemat: setelah panel terbentuk yang disimpan hanya ringkasan
+            # sumber (kolom, jumlah baris, preview); file dimuat ulang hanya bila
+            # panel perlu dibangun ulang
+            sumber_pend = st.session_state.get('pend_sumber') if mode_hemat_pend else None
+            df_pend = None
+            if sumber_pend is None or sumber_pend['key'] != data_key_pend:
+                df_pend, load_info_pend = muat_data_pend()
+                sumber_pend = {'key': data_key_pend, 'columns': list(df_pend.columns), 'n_rows': len(df_pend),
+                               'preview': df_pend.head(), 'load_info': load_info_pend}
+                if mode_hemat_pend:
+                    st.session_state['pend_sumber'] = sumber_pend
+            load_info_pend = sumber_pend['load_info']
             
-            st.success(f"✅ Data berhasil dimuat: {len(df_pend)} baris")
+            st.success(f"✅ Data berhasil dimuat: {sumber_pend['n_rows']} baris")
+            if 'bytes_before' in load_info_pend:
+                st.caption(f"🗜️ Memori data: {load_info_pend['bytes_before'] / 1e6:,.1f} MB → "
+                           f"{load_info_pend['bytes_after'] / 1e6:,.1f} MB")
             
             # Preview Data
             with st.expander("👁️ Preview Data", expanded=False):
-                st.dataframe(df_pend.head())
+                st.dataframe(sumber_pend['preview'])
+            
+            # Format long (satu baris per transaksi) diagregasi menjadi WP x bulan
+            ada_kolom_bulan = any(b in sumber_pend['columns'] for b in bulan_list)
+            format_pend = st.radio(
+                "Format Data",
+                ["Wide (kolom JANUARI - DESEMBER)", "Long (satu baris per transaksi)"],
+                index=0 if ada_kolom_bulan else 1,
+                horizontal=True,
+                key='pend_format'
+            )
+            kolom_pend = sumber_pend['columns']
+            pivot_key = None
+            if format_pend.startswith("Long"):
+                kolom_long = sumber_pend['columns']
+                col_l1, col_l2, col_l3, col_l4 = st.columns(4)
+                with col_l1:
+                    kolom_npwpd = st.selectbox("Kolom NPWPD", kolom_long, key='long_npwpd')
+                with col_l2:
+                    kolom_bulan = st.selectbox("Kolom Bulan / Tanggal", kolom_long, key='long_bulan',
+                                               index=min(1, len(kolom_long) - 1))
+                with col_l3:
+                    kolom_nilai = st.selectbox("Kolom Nilai", kolom_long, key='long_nilai',
+                                               index=len(kolom_long) - 1)
+                with col_l4:
+                    kolom_nama = st.selectbox("Kolom Nama WP (opsional)", ['(tidak ada)'] + kolom_long,
+                                              key='long_nama')
+                kolom_pivot = (kolom_npwpd, kolom_bulan, kolom_nilai, kolom_nama)
+                
+                pivot_key = (data_key_pend,) + kolom_pivot
+                pivot_tersimpan = st.session_state.get('pend_pivot', (None, None))[0] is not None
+                if st.session_state.get('pend_pivot_key') != pivot_key or not (mode_hemat_pend or pivot_tersimpan):
+                    if df_pend is None:
+                        df_pend, _ = muat_data_pend()
+                    with st.spinner("Mengagregasi transaksi per WP dan bulan..."):
+                        st.session_state['pend_pivot'] = pivot_pend(df_pend, *kolom_pivot)
+                    st.session_state['pend_pivot_key'] = pivot_key
+                df_pend, info_pivot = st.session_state['pend_pivot']
+                kolom_pend = info_pivot['columns'] if df_pend is None else list(df_pend.columns)
+                st.success(f"✅ {info_pivot['n_transaksi']:,} transaksi diagregasi menjadi "
+                           f"{info_pivot['n_wp']:,} WP x 12 bulan")
+                if info_pivot['n_diabaikan']:
+                    st.warning(f"⚠️ {info_pivot['n_diabaikan']:,} transaksi diabaikan "
+                               "(NPWPD kosong atau bulan tidak dikenali)")
             
             # Tentukan kolom bulan yang tersedia
-            bulan_list = ['JANUARI', 'FEBRUARI', 'MARET', 'APRIL', 'MEI', 'JUNI',
-                          'JULI', 'AGUSTUS', 'SEPTEMBER', 'OKTOBER', 'NOVEMBER', 'DESEMBER']
-            available_bulan = [b for b in bulan_list if b in df_pend.columns]
+            available_bulan = [b for b in bulan_list if b in kolom_pend]
             
             if available_bulan:
                 st.info(f"📅 Kolom bulan terdeteksi: {', '.join(available_bulan)}")
+                # Kolom non-bulan di luar identitas WP: kandidat kelompok peer analisis tren
+                kolom_grup_pend = [c for c in kolom_pend
+                                   if c not in available_bulan and c not in pend_analyzer.KOLOM_IDENTITAS]
+                
+                # Mode hemat: analisis memakai panel WP x bulan ringkas, bukan DataFrame wide
+                data_pend = df_pend
+                if mode_hemat_pend:
+                    panel_key = (data_key_pend, format_pend, pivot_key, tuple(available_bulan))
+                    if st.session_state.get('panel_pend_key') != panel_key:
+                        if df_pend is None:
+                            df_pend, _ = muat_data_pend()
+                            if pivot_key is not None:
+                                df_pend, _ = pivot_pend(df_pend, *kolom_pivot)
+                        st.session_state['panel_pend'] = PanelPendapatan.from_dataframe(
+                            df_pend, available_bulan, kolom_tambahan=kolom_grup_pend)
+                        st.session_state['panel_pend_key'] = panel_key
+                    data_pend = st.session_state['panel_pend']
+                    # DataFrame wide tidak disimpan lagi setelah panel terbentuk
+                    df_pend = None
+                    if pivot_key is not None and st.session_state['pend_pivot'][0] is not None:
+                        st.session_state['pend_pivot'] = (None, dict(info_pivot, columns=kolom_pend))
+                    st.caption(f"🧮 Panel WP x bulan: {data_pend.nbytes / 1e6:,.1f} MB "
+                               f"({'sparse' if data_pend.is_sparse else 'dense'}, nilai {data_pend.encoding})")
+                
+                # Pengaturan aturan anomali (ambang dalam persen di UI, rasio di analyzer)
+                aturan_pend = pend_analyzer.susun_aturan()
+                with st.expander("⚙️ Pengaturan Aturan Anomali", expanded=False):
+                    col_a1, col_a2 = st.columns(2)
+                    with col_a1:
+                        aturan_pend['identik']['aktif'] = st.checkbox(
+                            "Pelaporan Identik", value=True, key='aturan_identik')
+                        aturan_pend['variasi_rendah']['aktif'] = st.checkbox(
+                            "Variasi Rendah", value=True, key='aturan_variasi')
+                        aturan_pend['variasi_rendah']['threshold'] = st.number_input(
+                            "Batas Variasi Rendah (%)", min_value=0.0, max_value=100.0, value=5.0,
+                            step=0.5, key='aturan_variasi_thr') / 100
+                        aturan_pend['cv_rendah']['aktif'] = st.checkbox(
+                            "Koefisien Variasi Rendah", value=False, key='aturan_cv')
+                        aturan_pend['cv_rendah']['threshold'] = st.number_input(
+                            "Batas CV (%)", min_value=0.0, max_value=100.0, value=2.0,
+                            step=0.5, key='aturan_cv_thr') / 100
+                    with col_a2:
+                        aturan_pend['bulan_kosong']['aktif'] = st.checkbox(
+                            "Bulan Kosong / Nihil", value=False, key='aturan_kosong')
+                        aturan_pend['bulan_kosong']['threshold'] = st.number_input(
+                            "Minimal Bulan Kosong", min_value=1, max_value=len(available_bulan),
+                            value=len(available_bulan), key='aturan_kosong_thr')
+                        aturan_pend['penurunan_tajam']['aktif'] = st.checkbox(
+                            "Penurunan Tajam", value=False, key='aturan_turun')
+                        aturan_pend['penurunan_tajam']['threshold'] = st.number_input(
+                            "Batas Penurunan (%)", min_value=0.0, max_value=100.0, value=50.0,
+                            step=5.0, key='aturan_turun_thr') / 100
+                        aturan_pend['lonjakan']['aktif'] = st.checkbox(
+                            "Lonjakan", value=False, key='aturan_lonjak')
+                        aturan_pend['lonjakan']['threshold'] = st.number_input(
+                            "Batas Kenaikan (%)", min_value=0.0, value=100.0,
+                            step=10.0, key='aturan_lonjak_thr') / 100
+                    
+                    # Klaster deret identik antar WP (indikasi pelaporan seragam/templat)
+                    klaster_pend = pend_analyzer.susun_klaster()
+                    col_k1, col_k2, col_k3 = st.columns(3)
+                    with col_k1:
+                        klaster_pend['aktif'] = st.checkbox(
+                            "Klaster Deret Identik antar WP", value=True, key='klaster_aktif')
+                    with col_k2:
+                        klaster_pend['min_anggota'] = st.number_input(
+                            "Minimal Anggota Klaster", min_value=2, value=3, key='klaster_min_anggota')
+                    with col_k3:
+                        pembulatan_opsi = {'Tanpa Pembulatan': None, 'Ratusan': -2, 'Ribuan': -3, 'Puluhan Ribu': -4}
+                        klaster_pend['pembulatan'] = pembulatan_opsi[st.selectbox(
+                            "Pembulatan Sebelum Dibandingkan", list(pembulatan_opsi), key='klaster_pembulatan')]
+                
+                mode_inkremental = st.checkbox(
+                    "♻️ Analisis Inkremental (per NPWPD)",
+                    value=False,
+                    key='pend_inkremental',
+                    help="Untuk file revisi: hanya WP yang baru atau berubah dibanding analisis "
+                         "sebelumnya yang dianalisis ulang. Membutuhkan kolom NPWPD yang unik."
+                )
                 
                 # Jalankan analisis
                 if st.button("🔍 Lakukan Analisis Anomali", key="btn_analisis_pend"):
                     with st.spinner("Menganalisis anomali pendapatan..."):
-                        anomali_results = pend_analyzer.detect_anomali_pendapatan(df_pend, available_bulan)
-                    
-                    st.session_state['anomali_results'] = anomali_results
-                    st.session_state['df_pendapatan'] = df_pend
+                        # Register besar dibagi per shard dan dianalisis paralel
+                        progress_pend = st.progress(0.0, text="Menyiapkan shard...")
+                        analisis_pend = pend_analyzer.analisis_pendapatan(
+                            data_pend, available_bulan, aturan_pend,
+                            progress_callback=lambda done, total: progress_pend.progress(
+                                done / total, text=f"Shard {done} dari {total} selesai"),
+                            sebelumnya=st.session_state.get('analisis_pend') if mode_inkremental else None,
+                            klaster=klaster_pend)
+                        progress_pend.empty()
+
+                    st.session_state['analisis_pend'] = analisis_pend
+                    st.session_state['anomali_results'] = analisis_pend['anomali']
+                    st.session_state['df_pendapatan'] = data_pend
                     st.session_state['bulan_cols_pend'] = available_bulan
                 
                 # Tampilkan hasil jika sudah ada
@@ -94,12 +274,19 @@ if jenis_sampling == "Pendapatan":
                     anomali_results = st.session_state['anomali_results']
                     df_pend = st.session_state['df_pendapatan']
                     available_bulan = st.session_state.get('bulan_cols_pend', available_bulan)
+                    analisis_pend = st.session_state['analisis_pend']
                     
                     st.markdown("---")
                     st.subheader("📈 Hasil Analisis")
                     
-                    # Hitung statistik untuk display
-                    stat_pend = pend_analyzer.hitung_statistik_pendapatan(df_pend, available_bulan)
+                    # Statistik dari hasil analisis bersama (tidak dihitung ulang saat rerun)
+                    stat_pend = analisis_pend['statistik']
+                    
+                    info_ink = analisis_pend.get('inkremental')
+                    if info_ink:
+                        st.info(f"♻️ Analisis inkremental: {info_ink['baru']} WP baru dan "
+                                f"{info_ink['berubah']} WP berubah dianalisis ulang, {info_ink['dihapus']} WP "
+                                f"dihapus; {info_ink['tetap']} WP tetap memakai hasil sebelumnya.")
                     
                     # Metrics
                     col_m1, col_m2, col_m3, col_m4, col_m5 = st.columns(5)
@@ -108,33 +295,34 @@ if jenis_sampling == "Pendapatan":
                     with col_m2:
                         st.metric("WP dengan Anomali", len(anomali_results))
                     with col_m3:
-                        pct_anomali = (len(anomali_results) / stat_pend['total_wp'] * 100) if stat_pend['total_wp'] > 0 else 0
-                        st.metric("% Anomali", f"{pct_anomali:.2f}%")
+                        st.metric("% Anomali", f"{analisis_pend['pct_wp_anomali']:.2f}%")
                     with col_m4:
                         st.metric("Total Pendapatan", f"Rp {stat_pend['total_pendapatan']:,.0f}")
                     with col_m5:
-                        anomalous_total = sum([item.get('total_realisasi', 0) for item in anomali_results]) if anomali_results else 0
-                        anomalous_pct = (anomalous_total / stat_pend['total_pendapatan'] * 100) if stat_pend['total_pendapatan'] > 0 else 0
-                        st.metric("Total Realisasi Anomali", f"Rp {anomalous_total:,.0f}", delta=f"{anomalous_pct:.2f}%")
+                        st.metric("Total Realisasi Anomali", f"Rp {analisis_pend['total_anomali']:,.0f}",
+                                  delta=f"{analisis_pend['pct_realisasi_anomali']:.2f}%")
                     
                     # Daftar Anomali
                     st.subheader("📋 Daftar WP dengan Anomali")
-                    if anomali_results:
-                        df_anomali_display = pd.DataFrame(anomali_results)[['nomor', 'nama_wp', 'npwpd', 'jenis_anomali', 'rata_rata', 'total_realisasi']]
-                        df_anomali_display = df_anomali_display.rename(columns={
+                    if len(anomali_results):
+                        df_anomali_display = anomali_results[['nomor', 'nama_wp', 'npwpd', 'jenis_anomali', 'skor_risiko', 'rata_rata', 'total_realisasi']].rename(columns={
                             'nomor': 'No',
                             'nama_wp': 'Nama WP',
                             'npwpd': 'NPWPD',
                             'jenis_anomali': 'Jenis Anomali',
+                            'skor_risiko': 'Skor Risiko',
                             'rata_rata': 'Rata-rata Pendapatan',
                             'total_realisasi': 'Total Realisasi'
                         })
-                        # Format angka
-                        if 'Total Realisasi' in df_anomali_display.columns:
-                            df_anomali_display['Total Realisasi'] = df_anomali_display['Total Realisasi'].apply(lambda x: f"Rp {x:,.0f}" if pd.notna(x) else "Rp 0")
-                        if 'Rata-rata Pendapatan' in df_anomali_display.columns:
-                            df_anomali_display['Rata-rata Pendapatan'] = df_anomali_display['Rata-rata Pendapatan'].apply(lambda x: f"Rp {x:,.2f}" if pd.notna(x) else "-")
-                        st.dataframe(df_anomali_display, use_container_width=True)
+                        # Angka tetap numerik; format Rupiah dilakukan di sisi tampilan
+                        st.dataframe(df_anomali_display, use_container_width=True, hide_index=True, column_config={
+                            'Skor Risiko': st.column_config.ProgressColumn(
+                                'Skor Risiko', min_value=0, max_value=100, format="%.1f"),
+                            'Rata-rata Pendapatan': st.column_config.NumberColumn(
+                                'Rata-rata Pendapatan (Rp)', format="localized"),
+                            'Total Realisasi': st.column_config.NumberColumn(
+                                'Total Realisasi (Rp)', format="localized"),
+                        })
                         
                         # Download Laporan
                         st.markdown("---")
@@ -144,7 +332,7 @@ if jenis_sampling == "Pendapatan":
                         
                         with col_dl1:
                             laporan_xlsx_pend = generate_laporan_pendapatan_xlsx(
-                                df_pend, anomali_results, available_bulan
+                                df_pend, anomali_results, available_bulan, analisis=analisis_pend
                             )
                             st.download_button(
                                 label="📊 Download Laporan (.xlsx)",
@@ -155,7 +343,7 @@ if jenis_sampling == "Pendapatan":
                         
                         with col_dl2:
                             laporan_docx_pend = generate_laporan_pendapatan_docx(
-                                df_pend, anomali_results, available_bulan
+                                df_pend, anomali_results, available_bulan, analisis=analisis_pend
                             )
                             st.download_button(
                                 label="📄 Download Laporan (.docx)",
@@ -165,6 +353,101 @@ if jenis_sampling == "Pendapatan":
                             )
                     else:
                         st.success("✅ Tidak ditemukan anomali berdasarkan kriteria analisis.")
+                    
+                    # Klaster WP dengan deret bulanan identik
+                    hasil_klaster = analisis_pend.get('klaster')
+                    if hasil_klaster is not None:
+                        st.subheader("🧬 Klaster Deret Pelaporan Identik antar WP")
+                        ringkasan_klaster = hasil_klaster['ringkasan']
+                        if len(ringkasan_klaster):
+                            st.warning(f"⚠️ {len(ringkasan_klaster)} klaster ditemukan, mencakup "
+                                       f"{len(hasil_klaster['anggota'])} WP dengan total realisasi "
+                                       f"Rp {ringkasan_klaster['total_realisasi'].sum():,.0f}.")
+                            st.dataframe(ringkasan_klaster.rename(columns={
+                                'klaster': 'Klaster',
+                                'jumlah_wp': 'Jumlah WP',
+                                'bulan_terisi': 'Bulan Terisi',
+                                'total_per_wp': 'Total per WP',
+                                'total_realisasi': 'Total Realisasi'
+                            }), use_container_width=True, hide_index=True)
+                            with st.expander("Anggota Klaster"):
+                                st.dataframe(hasil_klaster['anggota'].rename(columns={
+                                    'klaster': 'Klaster',
+                                    'nomor': 'No',
+                                    'nama_wp': 'Nama WP',
+                                    'npwpd': 'NPWPD',
+                                    'total_realisasi': 'Total Realisasi'
+                                }), use_container_width=True, hide_index=True)
+                        else:
+                            st.success("✅ Tidak ditemukan klaster deret identik antar WP.")
+                
+                # Analisis tren & musiman: tren menurun, penurunan bulanan, dan
+                # penyimpangan dari profil bulanan median kelompok peer
+                st.markdown("---")
+                st.subheader("📉 Analisis Tren & Musiman")
+                col_t1, col_t2 = st.columns(2)
+                with col_t1:
+                    grup_tren = st.selectbox(
+                        "Kelompok Peer", ['(Semua WP)'] + kolom_grup_pend, key='tren_grup',
+                        help="Profil bulanan WP dibandingkan dengan median profil kelompoknya "
+                             "(mis. jenis pajak atau kecamatan).")
+                    min_bulan_tren = st.number_input(
+                        "Minimal Bulan Terisi", min_value=3, max_value=len(available_bulan),
+                        value=min(pend_tren.MIN_BULAN_TREN, len(available_bulan)), key='tren_min_bulan')
+                aturan_tren = pend_tren.susun_aturan_tren()
+                with col_t2:
+                    aturan_tren['tren_turun']['aktif'] = st.checkbox(
+                        "Tren Menurun", value=True, key='tren_turun')
+                    aturan_tren['tren_turun']['threshold'] = st.number_input(
+                        "Batas Slope (% per bulan)", min_value=0.0, max_value=100.0, value=5.0,
+                        step=0.5, key='tren_turun_thr') / 100
+                    aturan_tren['penurunan_mom']['aktif'] = st.checkbox(
+                        "Penurunan Bulanan", value=False, key='tren_mom')
+                    aturan_tren['penurunan_mom']['threshold'] = st.number_input(
+                        "Batas Penurunan Bulanan (%)", min_value=0.0, max_value=100.0, value=50.0,
+                        step=5.0, key='tren_mom_thr') / 100
+                    aturan_tren['deviasi_profil']['aktif'] = st.checkbox(
+                        "Menyimpang dari Profil Peer", value=True, key='tren_deviasi')
+                    aturan_tren['deviasi_profil']['threshold'] = st.number_input(
+                        "Batas Deviasi Profil (%)", min_value=0.0, max_value=100.0, value=35.0,
+                        step=5.0, key='tren_deviasi_thr') / 100
+                
+                # Hasil tren hanya berlaku untuk data dan kolom yang sama
+                tren_key = (data_key_pend, format_pend, pivot_key, tuple(available_bulan))
+                if st.session_state.get('tren_pend_key') != tren_key:
+                    st.session_state.pop('tren_pend', None)
+                
+                if st.button("📉 Analisis Tren", key="btn_tren_pend"):
+                    grup_values = (None if grup_tren == '(Semua WP)'
+                                   else data_pend[grup_tren].to_numpy(dtype=object))
+                    with st.spinner("Menganalisis tren pendapatan..."):
+                        st.session_state['tren_pend'] = pend_tren.deteksi_tren_pendapatan(
+                            data_pend, available_bulan, grup=grup_values,
+                            aturan=aturan_tren, min_bulan=int(min_bulan_tren))
+                    st.session_state['tren_pend_key'] = tren_key
+                
+                if 'tren_pend' in st.session_state:
+                    tabel_tren, profil_tren = st.session_state['tren_pend']
+                    st.metric("WP dengan Tren Tidak Wajar", len(tabel_tren))
+                    if len(tabel_tren):
+                        df_tren_display = tabel_tren[['nomor', 'nama_wp', 'npwpd', 'grup', 'jenis_tren',
+                                                      'bulan_terisi', 'total_realisasi']].rename(columns={
+                            'nomor': 'No',
+                            'nama_wp': 'Nama WP',
+                            'npwpd': 'NPWPD',
+                            'grup': 'Kelompok',
+                            'jenis_tren': 'Jenis Tren',
+                            'bulan_terisi': 'Bulan Terisi',
+                            'total_realisasi': 'Total Realisasi'
+                        })
+                        df_tren_display['Total Realisasi'] = 'Rp ' + df_tren_display['Total Realisasi'].map('{:,.0f}'.format)
+                        st.dataframe(df_tren_display, use_container_width=True)
+                    else:
+                        st.success("✅ Tidak ditemukan tren tidak wajar berdasarkan kriteria analisis.")
+                    with st.expander("Profil Bulanan Median per Kelompok (% dari total tahunan)"):
+                        profil_display = profil_tren.copy()
+                        profil_display[available_bulan] = profil_display[available_bulan] * 100
+                        st.dataframe(profil_display.round(2), use_container_width=True)
             else:
                 st.error("❌ Kolom bulan (JANUARI - DESEMBER) tidak ditemukan dalam file. Silakan gunakan template yang tersedia.")
         
@@ -5,13 +5,15 @@ Dashboard Belanja/Lainnya - Sampling dengan berbagai metode
 import streamlit as st
 import pandas as pd
 import numpy as np
-import math
 from io import BytesIO
 
+import altair as alt
+
 import calculations as calc
 import selections as sel
-from helpers import (detect_csv_delimiter, convert_rupiah_to_numeric, 
-                      generate_laporan_xlsx, generate_laporan_docx)
+import ingestion as ingest
+from helpers import (detect_csv_delimiter, generate_laporan_xlsx,
+                      generate_laporan_docx)
 
 
 def dashboard_belanja():
@@ -58,59 +60,111 @@ def dashboard_belanja():
 
     # 1. UPLOAD
     st.sidebar.header("1. Upload Data")
-    uploaded_file = st.sidebar.file_uploader("Upload Tabel Data (Excel/CSV/Parquet)",
-                                             type=['xlsx', 'csv', 'parquet'])
+    mode_multi = st.sidebar.checkbox(
+        "Gabungkan banyak file / sheet",
+        value=False,
+        help="Upload beberapa workbook (misal satu per SKPD) atau satu file ZIP. "
+             "Semua file/sheet dibaca paralel lalu digabung dengan kolom sumber."
+    )
+    uploaded_files = []
+    semua_sheet = True
+    if mode_multi:
+        uploaded_files = st.sidebar.file_uploader("Upload File Data (Excel/CSV/Parquet/ZIP)",
+                                                  type=['xlsx', 'csv', 'parquet', 'zip'],
+                                                  accept_multiple_files=True) or []
+        semua_sheet = st.sidebar.checkbox("Baca semua sheet pada file Excel", value=True)
+        uploaded_file = None
+    else:
+        uploaded_file = st.sidebar.file_uploader("Upload Tabel Data (Excel/CSV/Parquet)",
+                                                 type=['xlsx', 'csv', 'parquet'])
 
-    if uploaded_file is not None:
-        # Load Data
-        if uploaded_file.name.endswith('.csv'):
-            try:
-                # Deteksi delimiter dan encoding
-                delimiter, encoding = detect_csv_delimiter(uploaded_file)
-                df = pd.read_csv(uploaded_file, sep=delimiter, encoding=encoding)
-                
-                # 🔥 KONVERSI FORMAT RUPIAH KE NUMERIK
-                df = convert_rupiah_to_numeric(df)
-                
-                st.info(f"📌 Delimiter: **'{delimiter}'** | Encoding: **{encoding}**")
-            except Exception as e:
-                st.error(f"❌ Gagal membaca file CSV: {e}")
-                st.stop()
-        
-        elif uploaded_file.name.endswith('.parquet'):
-            try:
-                df = pd.read_parquet(uploaded_file)
-                st.info("✅ File Parquet berhasil dibaca")
-            except Exception as e:
-                st.error(f"❌ Gagal membaca file Parquet: {e}")
-                st.stop()
-        
-        else:  # Excel (.xlsx)
+    mode_streaming = False
+    if uploaded_file is not None and uploaded_file.name.endswith(('.csv', '.parquet')):
+        mode_streaming = st.sidebar.checkbox(
+            "Mode Streaming (CSV/Parquet sangat besar)",
+            value=False,
+            help="Baca file per chunk / row group tanpa memuat seluruh tabel ke memori. "
+                 "Hanya mendukung MUS dan Unstratified MPU."
+        )
+
+    parquet_options = None
+    if uploaded_file is not None and uploaded_file.name.endswith('.parquet'):
+        parquet_options = parquet_options_ui(uploaded_file, key_prefix='belanja')
+
+    mode_hemat = False
+    if (uploaded_file is not None or uploaded_files) and not mode_streaming:
+        mode_hemat = st.sidebar.checkbox(
+            "Mode Hemat Memori",
+            value=False,
+            help="Kolom teks berulang (SKPD, jenis belanja, rekening) disimpan sebagai kategori, "
+                 "teks lain sebagai string Arrow, dan angka di-downcast bila aman."
+        )
+
+    if uploaded_file is not None and mode_streaming:
+        dashboard_belanja_streaming(uploaded_file, parquet_options)
+
+    elif uploaded_file is not None or uploaded_files:
+        file_format = ingest.detect_file_format(uploaded_file.name) if uploaded_file is not None else None
+        mode_excel_cepat = file_format == 'xlsx' and st.sidebar.checkbox(
+            "Mode Excel Cepat (hanya kolom terpilih)",
+            value=False,
+            help="Baca header sheet dulu, lalu muat hanya kolom ID, nilai dan kolom tampilan. "
+                 "Baris lengkap baru dimuat saat ekspor sampel."
+        )
+
+        if mode_excel_cepat:
+            df, id_col, value_col = _load_excel_cepat(uploaded_file, compact=mode_hemat)
+        else:
+            # Load Data (hasil parsing di-cache berdasarkan hash konten file)
             try:
-                df = pd.read_excel(uploaded_file)
-                st.info("✅ File Excel berhasil dibaca")
+                if mode_multi:
+                    with st.spinner(f"Membaca {len(uploaded_files)} file secara paralel..."):
+                        df, load_info = ingest.load_multi_population(uploaded_files, all_sheets=semua_sheet,
+                                                                     compact=mode_hemat)
+                elif file_format == 'parquet':
+                    pq_columns, pq_filters = parquet_options
+                    df, load_info = ingest.load_parquet_filtered(uploaded_file, pq_columns, pq_filters,
+                                                                 compact=mode_hemat)
+                else:
+                    df, load_info = ingest.load_uploaded_dataframe(uploaded_file, compact=mode_hemat)
             except Exception as e:
-                st.error(f"❌ Gagal membaca file Excel: {e}")
+                label = "gabungan" if mode_multi else ingest.FORMAT_LABELS[file_format]
+                st.error(f"❌ Gagal membaca file {label}: {e}")
                 st.stop()
 
-        st.success(f"Data dimuat: {len(df)} baris.")
-        
-        # Konversi kolom dengan format Rupiah ke numerik
-        try:
-            df = convert_rupiah_to_numeric(df)
-        except Exception:
-            print("⚠️ Gagal menjalankan convert_rupiah_to_numeric; melewatkan konversi.")
-            pass
-        
-        # 2. PEMETAAN
-        col1, col2 = st.columns(2)
-        numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
-        all_cols = df.columns.tolist()
+            if mode_multi:
+                st.info(f"📚 {load_info['n_sources']} sumber (file/sheet) dari {load_info['n_files']} upload "
+                        f"digabung menggunakan {load_info['n_workers']} proses paralel.")
+            elif file_format == 'csv':
+                st.info(f"📌 Delimiter: **'{load_info['delimiter']}'** | Encoding: **{load_info['encoding']}**")
+            elif file_format == 'parquet':
+                st.info(f"✅ File Parquet berhasil dibaca (row group dibaca: "
+                        f"{load_info['row_groups_read']} dari {load_info['row_groups_total']})")
+            else:
+                st.info(f"✅ File {ingest.FORMAT_LABELS[file_format]} berhasil dibaca")
+            if load_info['from_cache']:
+                st.caption(f"⚡ Data diambil dari cache {load_info.get('cache_source', 'memori')} "
+                           "(tanpa parsing ulang).")
+            if 'bytes_before' in load_info:
+                st.caption(f"🗜️ Memori data: {load_info['bytes_before'] / 1e6:,.1f} MB → "
+                           f"{load_info['bytes_after'] / 1e6:,.1f} MB")
+
+            st.success(f"Data dimuat: {len(df)} baris.")
 
-        with col1:
-            id_col = st.selectbox("Kolom ID Sampel", all_cols)
-        with col2:
-            value_col = st.selectbox("Kolom Nilai Rupiah", numeric_cols)
+            # 2. PEMETAAN
+            col1, col2 = st.columns(2)
+            numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+            all_cols = df.columns.tolist()
+
+            with col1:
+                id_col = st.selectbox("Kolom ID Sampel", all_cols)
+            with col2:
+                value_col = st.selectbox("Kolom Nilai Rupiah", numeric_cols)
+
+        # Kunci data (hash konten upload) untuk cache turunan di session state
+        sumber = uploaded_files if mode_multi else [uploaded_file]
+        data_key = (tuple(ingest.content_hash(f) for f in sumber), semua_sheet if mode_multi else None,
+                    repr(parquet_options), mode_hemat)
 
         total_nilai_buku = df[value_col].sum()
         st.info(f"💰 Total Nilai Buku: Rp {total_nilai_buku:,.2f}")
@@ -134,14 +188,19 @@ def dashboard_belanja():
 
         n_res = 0
         error_msg = None
+        strata_summary = []
 
         # --- PANGGIL FUNGSI DARI MODUL CALCULATIONS ---
         if metode_sampling == "Monetary Unit Sampling (MUS)":
             with col_in3:
                 dss = st.number_input("Dugaan Salah Saji (DSS)", value=0.0)
+                expected_errors = st.number_input(
+                    "Jumlah Kesalahan Diharapkan", min_value=0, max_value=calc.RF_MAKS_KESALAHAN, value=0,
+                    help="RF nol kesalahan mengikuti Juknis; selain itu batas atas Poisson.")
             with col_in4:
                 expansion = st.selectbox("Expansion Factor", [1, 5, 10, 15, 20, 25, 30, 37], index=1)
-            n_res, error_msg = calc.calculate_mus(total_nilai_buku, confidence, sst, dss, expansion)
+            n_res, error_msg = calc.calculate_mus(total_nilai_buku, confidence, sst, dss, expansion,
+                                                  expected_errors=int(expected_errors))
 
         elif metode_sampling == "Unstratified Mean Per Unit (MPU)":
             with col_in3:
@@ -162,28 +221,50 @@ def dashboard_belanja():
             )
 
         elif metode_sampling == "Stratified Mean Per Unit (MPU)":
-            st.info("ℹ️ Stratifikasi otomatis menggunakan metode Kuantil (Membagi populasi sama rata).")
+            metode_strata = st.radio("Metode Stratifikasi", list(METODE_STRATA_UI), horizontal=True,
+                                     help="Dalenius-Hodges dan Lavallée-Hidiroglou mencari batas strata "
+                                          "yang menekan jumlah sampel untuk data yang menceng.")
+            if METODE_STRATA_UI[metode_strata] is None:
+                st.info("ℹ️ Stratifikasi otomatis menggunakan metode Kuantil (Membagi populasi sama rata).")
+                pakai_take_all = False
+            else:
+                pakai_take_all = st.checkbox("Tambah strata take-all (nilai terbesar diperiksa 100%)", value=True)
             
             n_bins = st.slider("Bagi populasi menjadi berapa bagian? (Default: 4 - Strata)", min_value=3, max_value=10, value=4)
+            col_alok1, col_alok2 = st.columns(2)
+            with col_alok1:
+                metode_alokasi = st.selectbox("Metode Alokasi Sampel", list(METODE_ALOKASI_UI),
+                                              help="Neyman membagi n sebanding N x SD strata; optimum juga "
+                                                   "memperhitungkan biaya pemeriksaan per item.")
+            with col_alok2:
+                n_min_strata = st.number_input("Minimum Sampel per Strata", min_value=0, value=0, step=1)
             
             try:
-                df['Strata'], bin_edges = pd.qcut(df[value_col], q=n_bins, retbins=True, duplicates='drop', precision=0)
-                
-                cat_codes = df['Strata'].cat.categories
-                new_labels = []
-                
-                for cat in cat_codes:
-                    lbl = f"{cat.left:,.0f} s.d {cat.right:,.0f}"
-                    new_labels.append(lbl)
-                
-                df['Strata'] = df['Strata'].cat.rename_categories(new_labels)
+                # Statistik strata dari indeks nilai terurut (tanpa qcut/groupby ulang)
+                indeks = _indeks_nilai_urut(df, value_col, data_key)
+                take_all_label = None
+                if METODE_STRATA_UI[metode_strata] is None:
+                    tepi = indeks.tepi_kuantil(n_bins)
+                    batas, tutup_kanan = tepi[1:-1], True
+                    labels = _label_strata_kuantil(tepi)
+                else:
+                    hasil_strata = calc.optimasi_batas_strata(
+                        indeks.urut, n_bins, confidence, sst,
+                        metode=METODE_STRATA_UI[metode_strata], take_all=pakai_take_all,
+                        hist=indeks.histogram())
+                    batas, tutup_kanan = hasil_strata['batas'], False
+                    labels, take_all_label = _label_strata_optimal(indeks, hasil_strata)
+                    st.info(f"ℹ️ Batas strata optimal ({metode_strata}): perkiraan n = {hasil_strata['n']:,} item.")
                 
-                strata_stats = df.groupby('Strata', observed=True)[value_col].agg(['count', 'std', 'mean']).reset_index()
+                stat = indeks.statistik(batas, tutup_kanan)
+                strata_stats = pd.DataFrame({'Strata': labels, 'count': stat['count'],
+                                             'std': stat['std'], 'mean': stat['mean']})
+                strata_stats = strata_stats[strata_stats['count'] > 0].reset_index(drop=True)
+                if METODE_ALOKASI_UI[metode_alokasi] == 'optimum':
+                    strata_stats['biaya'] = 1.0
                 
                 st.write("📊 Distribusi Populasi per Strata:")
                 
-                strata_stats['std'] = strata_stats['std'].fillna(0)
-                
                 edited_strata = st.data_editor(
                     strata_stats,
                     column_config={
@@ -195,6 +276,13 @@ def dashboard_belanja():
                             help="Standar Deviasi (Bisa diedit)",
                             required=True,
                             format="%.2f"
+                        ),
+                        "biaya": st.column_config.NumberColumn(
+                            "Biaya per Item",
+                            help="Biaya relatif memeriksa satu item (alokasi optimum)",
+                            required=True,
+                            min_value=0.01,
+                            format="%.2f"
                         )
                     },
                     disabled=["Strata", "count", "mean"],
@@ -208,7 +296,9 @@ def dashboard_belanja():
                     strata_summary.append({
                         'strata': row['Strata'],
                         'count': row['count'],
-                        'std_dev': row['std']
+                        'std_dev': row['std'],
+                        'biaya': row.get('biaya', 1.0),
+                        'take_all': row['Strata'] == take_all_label
                     })
                 
                 n_res, error_msg = calc.calculate_mpu_stratified(strata_summary, confidence, sst)
@@ -216,29 +306,23 @@ def dashboard_belanja():
                 if n_res > 0:
                     st.markdown("#### 📍 Alokasi Sampel")
                     
-                    total_weight = sum([s['count'] * s['std_dev'] for s in strata_summary])
-                    allocation_dict_default = {} 
-                    allocation_list_default = []
-                    
-                    for s in strata_summary:
-                        weight = s['count'] * s['std_dev']
-                        
-                        if total_weight > 0:
-                            raw_allocation = (weight / total_weight) * n_res
-                            n_teoritis = math.ceil(raw_allocation)
-                        else:
-                            n_teoritis = 0
-                        
-                        if n_teoritis >= s['count']:
-                            n_final_strata = s['count']
-                        else:
-                            n_final_strata = n_teoritis
-                        
-                        allocation_list_default.append(n_final_strata)
-                        allocation_dict_default[s['strata']] = int(n_final_strata)
+                    # Strata take-all diambil seluruhnya; sisa n dialokasikan ke strata lain
+                    allocation_list_default = calc.alokasi_sampel(
+                        n_res,
+                        [s['count'] for s in strata_summary],
+                        [s['std_dev'] for s in strata_summary],
+                        metode=METODE_ALOKASI_UI[metode_alokasi],
+                        biaya=[s['biaya'] for s in strata_summary],
+                        take_all=[s['take_all'] for s in strata_summary],
+                        n_min=int(n_min_strata)).tolist()
+                    allocation_dict_default = {s['strata']: n for s, n in zip(strata_summary, allocation_list_default)}
                     
-                    if 'allocation_adjustments' not in st.session_state:
+                    # Alokasi manual direset bila susunan strata atau metode alokasi berubah
+                    strata_labels = ([s['strata'] for s in strata_summary], metode_alokasi, int(n_min_strata))
+                    if ('allocation_adjustments' not in st.session_state
+                            or st.session_state.get('allocation_strata') != strata_labels):
                         st.session_state['allocation_adjustments'] = allocation_list_default
+                        st.session_state['allocation_strata'] = strata_labels
                     
                     st.write("🎯 **Sesuaikan alokasi sampel per Strata (opsional)**:")
                     
@@ -264,7 +348,7 @@ def dashboard_belanja():
                             "Alokasi Otomatis": st.column_config.NumberColumn(
                                 "Alokasi Otomatis",
                                 disabled=True,
-                                help="Berdasarkan rumus proporsi"
+                                help="Berdasarkan metode alokasi terpilih"
                             ),
                             "Alokasi Manual": st.column_config.NumberColumn(
                                 "Alokasi Manual",
@@ -300,13 +384,26 @@ def dashboard_belanja():
                     n_res = n_adjusted_total
                     
                     st.session_state['allocation_dict'] = allocation_dict
-                    st.session_state['df_stratified'] = df
+                    st.session_state['strata_batas'] = {'batas': batas, 'tutup_kanan': tutup_kanan,
+                                                        'labels': labels}
                     st.session_state['allocation_adjustments'] = final_allocations
 
             except Exception as e:
                 st.error(f"Gagal membagi kuartil otomatis. Data mungkin terlalu sedikit atau seragam. Error: {e}")
                 n_res = 0
 
+        # Sensitivitas n terhadap SST dan parameter lain (tanpa rerun per kombinasi)
+        if metode_sampling == "Monetary Unit Sampling (MUS)":
+            sensitivitas_sampel_ui(metode_sampling, total_nilai_buku, len(df), confidence, sst,
+                                   dss=dss, expansion=expansion, expected_errors=int(expected_errors))
+        elif metode_sampling == "Unstratified Mean Per Unit (MPU)":
+            sensitivitas_sampel_ui(metode_sampling, total_nilai_buku, len(df), confidence, sst, sd=sd)
+        elif strata_summary:
+            sensitivitas_sampel_ui(metode_sampling, total_nilai_buku, len(df), confidence, sst,
+                                   strata_counts=[s['count'] for s in strata_summary if not s['take_all']],
+                                   strata_sd=[s['std_dev'] for s in strata_summary if not s['take_all']],
+                                   n_take_all=sum([s['count'] for s in strata_summary if s['take_all']]))
+
         # Tampilkan Hasil N
         if error_msg:
             st.error(error_msg)
@@ -336,7 +433,12 @@ def dashboard_belanja():
             if metode_sampling == "Stratified Mean Per Unit (MPU)" and 'allocation_dict' in st.session_state:
                 st.info("Menggunakan pemilihan terdistribusi sesuai Strata...")
                 
-                df_to_use = st.session_state.get('df_stratified', df)
+                df_to_use = df
+                info_strata = st.session_state.get('strata_batas')
+                if info_strata is not None:
+                    # Kode strata baru ditetapkan saat sampel dibuat
+                    kode = calc.tetapkan_strata(df[value_col], info_strata['batas'], info_strata['tutup_kanan'])
+                    df_to_use = df.assign(Strata=pd.Categorical.from_codes(kode, categories=info_strata['labels']))
                 alloc_data = st.session_state['allocation_dict']
 
                 sampled_df = sel.select_stratified_distributed(
@@ -362,6 +464,7 @@ def dashboard_belanja():
             st.session_state['sampled_df'] = sampled_df
             if 'report_docx_bytes' in st.session_state:
                 del st.session_state['report_docx_bytes']
+            st.session_state.pop('sample_full_xlsx_bytes', None)
 
         if 'sampled_df' in st.session_state and not st.session_state['sampled_df'].empty:
             
@@ -394,16 +497,40 @@ def dashboard_belanja():
             col_btn1, col_btn2, col_btn3 = st.columns(3)
             
             with col_btn1:
-                buff_sampel = BytesIO()
-                with pd.ExcelWriter(buff_sampel, engine='openpyxl') as writer:
-                    current_sampled_df.to_excel(writer, index=False, sheet_name='Sampel')
-                buff_sampel.seek(0)
-                st.download_button(
-                    label="📊 Download Sampel (.xlsx)",
-                    data=buff_sampel.getvalue(),
-                    file_name="sampel.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                if mode_excel_cepat:
+                    # Baris lengkap (semua kolom) baru dimuat saat ekspor
+                    def on_prepare_full_sample():
+                        try:
+                            full_sample = ingest.expand_excel_rows(uploaded_file, st.session_state['sampled_df'])
+                            buf = BytesIO()
+                            with pd.ExcelWriter(buf, engine='openpyxl') as writer:
+                                full_sample.to_excel(writer, index=False, sheet_name='Sampel')
+                            st.session_state['sample_full_xlsx_bytes'] = buf.getvalue()
+                        except Exception as exc:
+                            st.error(f"❌ Gagal memuat baris lengkap: {exc}")
+
+                    st.button("📊 Siapkan Sampel Lengkap (.xlsx)", on_click=on_prepare_full_sample,
+                              key="btn_sampel_lengkap")
+
+                    if st.session_state.get('sample_full_xlsx_bytes'):
+                        st.download_button(
+                            label="⬇️ Download Sampel (.xlsx)",
+                            data=st.session_state['sample_full_xlsx_bytes'],
+                            file_name="sampel.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            key="dl_sampel_lengkap"
+                        )
+                else:
+                    buff_sampel = BytesIO()
+                    with pd.ExcelWriter(buff_sampel, engine='openpyxl') as writer:
+                        current_sampled_df.to_excel(writer, index=False, sheet_name='Sampel')
+                    buff_sampel.seek(0)
+                    st.download_button(
+                        label="📊 Download Sampel (.xlsx)",
+                        data=buff_sampel.getvalue(),
+                        file_name="sampel.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
             
             with col_btn2:
                 buff_laporan = generate_laporan_xlsx(
@@ -453,8 +580,459 @@ def dashboard_belanja():
                         key="dl_docx_inline"
                     )
 
+            if metode_sampling == "Monetary Unit Sampling (MUS)":
+                evaluasi_mus_ui(current_sampled_df, value_col, total_nilai_buku, confidence, sst)
+
         elif 'sampled_df' in st.session_state and st.session_state['sampled_df'].empty:
             st.warning("Tidak ada sampel yang terpilih. Cek parameter.")
 
     else:
         st.info("Silakan upload data di sidebar.")
+
+
+
+def _load_excel_cepat(uploaded_file, compact=False):
+    """
+    Mode Excel cepat: baca header sheet, pilih kolom, lalu muat hanya kolom
+    ID, nilai dan kolom tampilan yang dipilih.
+    """
+    try:
+        header = ingest.read_excel_header(uploaded_file)
+    except Exception as e:
+        st.error(f"❌ Gagal membaca file Excel: {e}")
+        st.stop()
+
+    st.info(f"⚡ Mode Excel Cepat ({ingest.excel_engine()}): {len(header)} kolom terdeteksi, "
+            "hanya kolom terpilih yang dimuat.")
+
+    # 2. PEMETAAN
+    col1, col2 = st.columns(2)
+    with col1:
+        id_col = st.selectbox("Kolom ID Sampel", header)
+    with col2:
+        value_col = st.selectbox("Kolom Nilai Rupiah", header,
+                                 index=len(header) - 1 if header else 0)
+    extra_cols = st.multiselect(
+        "Kolom tambahan untuk ditampilkan",
+        [c for c in header if c not in (id_col, value_col)]
+    )
+
+    try:
+        df = ingest.load_excel_projection(uploaded_file, [id_col, value_col] + extra_cols,
+                                          compact=compact)
+    except Exception as e:
+        st.error(f"❌ Gagal membaca file Excel: {e}")
+        st.stop()
+
+    if not pd.api.types.is_numeric_dtype(df[value_col]):
+        st.error(f"❌ Kolom '{value_col}' bukan kolom nilai numerik. Pilih kolom lain.")
+        st.stop()
+
+    st.success(f"Data dimuat: {len(df)} baris.")
+    return df, id_col, value_col
+
+
+# Pilihan metode alokasi sampel antar strata di UI -> metode calculations.alokasi_sampel
+METODE_ALOKASI_UI = {
+    "Neyman (N x SD)": 'neyman',
+    "Proporsional (N)": 'proporsional',
+    "Optimum (N x SD / √biaya)": 'optimum',
+}
+
+# Pilihan metode stratifikasi di UI -> metode calculations.optimasi_batas_strata
+METODE_STRATA_UI = {
+    "Kuantil (Jumlah Sama)": None,
+    "Dalenius-Hodges (cum √f)": 'dh',
+    "Lavallée-Hidiroglou (n minimum)": 'lh',
+}
+
+
+def _indeks_nilai_urut(df, value_col, data_key):
+    """
+    IndeksNilaiUrut kolom nilai, disimpan di session_state (kunci: hash
+    konten data + kolom nilai) agar perubahan jumlah/metode strata tidak
+    mengurutkan ulang populasi.
+    """
+    key = (data_key, value_col)
+    if st.session_state.get('indeks_strata_key') != key:
+        st.session_state['indeks_strata'] = calc.IndeksNilaiUrut(np.asarray(df[value_col]))
+        st.session_state['indeks_strata_key'] = key
+    return st.session_state['indeks_strata']
+
+
+def _label_strata_kuantil(tepi):
+    """Label rentang strata kuantil, sama dengan kategori pd.qcut(precision=0)."""
+    kategori = pd.cut(tepi, tepi, include_lowest=True, precision=0).categories
+    labels = [f"{cat.left:,.0f} s.d {cat.right:,.0f}" for cat in kategori]
+    if len(set(labels)) < len(labels):
+        raise ValueError("Rentang strata kembar setelah pembulatan")
+    return labels
+
+
+def _label_strata_optimal(indeks, hasil_strata):
+    """
+    Label rentang strata dari batas hasil optimasi_batas_strata, beserta
+    label strata take-all (atau None).
+    """
+    tepi = np.concatenate([[indeks.min], hasil_strata['batas'], [indeks.max]])
+    labels = [f"S{i + 1}: {tepi[i]:,.0f} s.d {tepi[i + 1]:,.0f}" for i in range(len(tepi) - 1)]
+    take_all_label = None
+    if hasil_strata['take_all']:
+        labels[-1] += " (Take-all)"
+        take_all_label = labels[-1]
+    return labels, take_all_label
+
+
+def evaluasi_mus_ui(sampled_df, value_col, total_nilai_buku, confidence, sst):
+    """
+    Evaluasi hasil pemeriksaan sampel MUS: pemeriksa mengisi nilai audit
+    per item, lalu batas atas salah saji dihitung dengan calc.evaluasi_mus
+    dan dibandingkan dengan SST.
+    """
+    with st.expander("🧮 Evaluasi Hasil Sampel MUS", expanded=False):
+        st.caption("Isi Nilai Audit untuk item yang mengandung salah saji; item lain dibiarkan sama dengan nilai buku.")
+        nilai_buku = pd.to_numeric(sampled_df[value_col], errors='coerce').fillna(0.0)
+        editor = pd.DataFrame({'Nilai Buku': nilai_buku.to_numpy(), 'Nilai Audit': nilai_buku.to_numpy()},
+                              index=sampled_df.index)
+        hasil_audit = st.data_editor(
+            editor,
+            column_config={
+                "Nilai Buku": st.column_config.NumberColumn("Nilai Buku", format="localized"),
+                "Nilai Audit": st.column_config.NumberColumn("Nilai Audit", required=True, format="localized"),
+            },
+            disabled=["Nilai Buku"],
+            use_container_width=True,
+            key="evaluasi_mus_editor"
+        )
+        salah_saji = hasil_audit['Nilai Buku'] - hasil_audit['Nilai Audit']
+        salah = salah_saji != 0
+
+        try:
+            hasil = calc.evaluasi_mus(total_nilai_buku, len(sampled_df), hasil_audit['Nilai Buku'][salah],
+                                      salah_saji[salah], confidence)
+        except (ValueError, ZeroDivisionError) as e:
+            st.error(f"Gagal mengevaluasi sampel: {e}")
+            return
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Salah Saji Proyeksi", f"Rp {hasil['salah_saji_proyeksi']:,.0f}")
+        col2.metric("Basic Precision", f"Rp {hasil['basic_precision']:,.0f}")
+        col3.metric("Incremental Allowance", f"Rp {hasil['incremental_allowance']:,.0f}")
+        batas_atas = hasil['batas_atas_salah_saji']
+        st.metric("Batas Atas Salah Saji", f"Rp {batas_atas:,.0f}",
+                  help=f"Interval sampling Rp {hasil['interval_sampling']:,.0f}; "
+                       f"{hasil['jumlah_kesalahan']} item tainting.")
+        if batas_atas <= sst:
+            st.success(f"✅ Batas atas salah saji tidak melebihi SST (Rp {sst:,.0f}).")
+        else:
+            st.warning(f"⚠️ Batas atas salah saji melebihi SST (Rp {sst:,.0f}).")
+
+
+SENSITIVITAS_CONFIDENCE = [90, 95, 99]
+SENSITIVITAS_EXPANSION = [1, 5, 10, 15, 20, 25, 30, 37]
+
+
+def sensitivitas_sampel_ui(metode_sampling, total_nilai_buku, population_size, confidence, sst,
+                           dss=0.0, expansion=5, sd=0.0, strata_counts=None, strata_sd=None,
+                           expected_errors=0, n_take_all=0):
+    """
+    Tabel & heatmap sensitivitas jumlah sampel: baris = SST (% nilai buku),
+    kolom = parameter kedua sesuai metode. Seluruh grid dihitung dalam satu
+    panggilan fungsi grid di modul calculations.
+    """
+    with st.expander("📐 Sensitivitas Jumlah Sampel (SST vs Parameter Lain)", expanded=False):
+        if metode_sampling == "Monetary Unit Sampling (MUS)":
+            opsi_kolom = ["DSS (% dari SST)", "Confidence Level", "Expansion Factor"]
+        elif metode_sampling == "Unstratified Mean Per Unit (MPU)":
+            opsi_kolom = ["Estimasi SD (% dari input)", "Confidence Level"]
+        else:
+            opsi_kolom = ["Faktor SD Strata (%)", "Confidence Level"]
+
+        col_s1, col_s2, col_s3 = st.columns(3)
+        with col_s1:
+            sst_pct = st.slider("Rentang SST (% Nilai Buku)", min_value=0.1, max_value=20.0,
+                                value=(1.0, 10.0), step=0.1, key='sens_sst_range')
+        with col_s2:
+            n_titik = st.number_input("Jumlah Titik per Sumbu", min_value=2, max_value=200,
+                                      value=10, key='sens_n_titik')
+        with col_s3:
+            sumbu_kolom = st.selectbox("Parameter Kolom", opsi_kolom, key='sens_kolom')
+
+        sst_grid = np.linspace(sst_pct[0], sst_pct[1], int(n_titik)) / 100 * total_nilai_buku
+        conf_grid = confidence
+        dss_grid = dss
+        ef_grid = expansion
+        sd_grid = sd
+        faktor_sd = 1.0
+        if sumbu_kolom == "Confidence Level":
+            label_kolom = [f"{c}%" for c in SENSITIVITAS_CONFIDENCE]
+            conf_grid = np.array(SENSITIVITAS_CONFIDENCE)[None, :]
+        elif sumbu_kolom == "Expansion Factor":
+            label_kolom = [str(e) for e in SENSITIVITAS_EXPANSION]
+            ef_grid = np.array(SENSITIVITAS_EXPANSION)[None, :]
+        else:
+            if sumbu_kolom.startswith("DSS"):
+                rentang = st.slider("Rentang DSS (% dari SST)", min_value=0.0, max_value=60.0,
+                                    value=(0.0, 50.0), step=1.0, key='sens_dss_range')
+            else:
+                rentang = st.slider("Rentang Faktor SD (%)", min_value=10.0, max_value=300.0,
+                                    value=(50.0, 150.0), step=5.0, key='sens_sd_range')
+            persen = np.linspace(rentang[0], rentang[1], int(n_titik))
+            label_kolom = [f"{p:.1f}%" for p in persen]
+            if sumbu_kolom.startswith("DSS"):
+                dss_grid = sst_grid[:, None] * persen[None, :] / 100
+            elif sumbu_kolom.startswith("Estimasi SD"):
+                sd_grid = sd * persen[None, :] / 100
+            else:
+                faktor_sd = persen / 100
+
+        sst_kolom = sst_grid[:, None]
+        if metode_sampling == "Monetary Unit Sampling (MUS)":
+            n_grid = calc.calculate_mus_grid(total_nilai_buku, conf_grid, sst_kolom, dss_grid, ef_grid,
+                                             expected_errors)
+        elif metode_sampling == "Unstratified Mean Per Unit (MPU)":
+            n_grid = calc.calculate_mpu_unstratified_grid(population_size, conf_grid, sst_kolom, sd_grid)
+        else:
+            # Skenario SD: (titik faktor, strata) lalu di-broadcast ke baris SST
+            sd_skenario = np.atleast_1d(faktor_sd)[:, None] * np.asarray(strata_sd, dtype=float)[None, :]
+            n_grid = calc.calculate_mpu_stratified_grid(
+                strata_counts, sd_skenario[None, :, :], conf_grid, sst_kolom, n_take_all)
+        n_grid = np.broadcast_to(n_grid, (len(sst_grid), len(label_kolom)))
+
+        label_baris = [f"Rp {v:,.0f}" for v in sst_grid]
+        tabel = pd.DataFrame(n_grid, index=pd.Index(label_baris, name="SST"), columns=label_kolom)
+        st.caption("Nilai sel = jumlah sampel (n); 0 berarti parameter tidak valid "
+                   "(misal SST terlalu kecil dibandingkan DSS).")
+
+        data_heatmap = tabel.reset_index().melt(id_vars="SST", var_name=sumbu_kolom, value_name="n")
+        heatmap = alt.Chart(data_heatmap).mark_rect().encode(
+            x=alt.X(f"{sumbu_kolom}:O", sort=label_kolom, title=sumbu_kolom),
+            y=alt.Y("SST:O", sort=label_baris, title="SST"),
+            color=alt.Color("n:Q", scale=alt.Scale(scheme="orangered"), title="n"),
+            tooltip=["SST", sumbu_kolom, "n"],
+        )
+        st.altair_chart(heatmap, use_container_width=True)
+        st.dataframe(tabel, use_container_width=True)
+
+
+def parquet_options_ui(uploaded_file, key_prefix, default_columns=None):
+    """
+    Pilihan proyeksi kolom dan filter untuk file Parquet. Filter didorong
+    ke pembaca sehingga row group yang tidak relevan tidak dibaca.
+
+    Returns:
+        Tuple (columns, filters)
+    """
+    try:
+        schema = ingest.read_parquet_schema(uploaded_file)
+    except Exception as e:
+        st.error(f"❌ Gagal membaca file Parquet: {e}")
+        st.stop()
+    all_cols = list(schema)
+
+    with st.expander("🔎 Filter & Proyeksi Parquet", expanded=False):
+        columns = st.multiselect("Kolom yang dibaca", all_cols,
+                                 default=default_columns or all_cols,
+                                 key=f"{key_prefix}_pq_columns")
+        st.caption("Contoh filter: TAHUN == 2024, SKPD in Dinas A,Dinas B, NILAI > 0. "
+                   "Semua filter digabung dengan AND.")
+        filter_rows = []
+        for i in range(3):
+            col_f1, col_f2, col_f3 = st.columns([2, 1, 2])
+            with col_f1:
+                col = st.selectbox(f"Kolom Filter {i + 1}", ['(tidak ada)'] + all_cols,
+                                   key=f"{key_prefix}_pq_col_{i}")
+            with col_f2:
+                op = st.selectbox("Operator", ingest.PARQUET_FILTER_OPERATORS,
+                                  key=f"{key_prefix}_pq_op_{i}")
+            with col_f3:
+                text = st.text_input("Nilai", key=f"{key_prefix}_pq_val_{i}",
+                                     help="Untuk operator 'in', pisahkan nilai dengan koma")
+            if col != '(tidak ada)':
+                filter_rows.append((col, op, text))
+
+    try:
+        filters = ingest.build_parquet_filters(filter_rows, schema)
+    except ValueError as e:
+        st.error(f"❌ Nilai filter tidak valid: {e}")
+        st.stop()
+    return (columns or all_cols), filters
+
+
+def dashboard_belanja_streaming(uploaded_file, parquet_options=None):
+    """
+    Dashboard Belanja untuk CSV/Parquet sangat besar. Statistik populasi dan
+    pemilihan sampel dihitung per chunk sehingga memori puncak tetap.
+    """
+    if parquet_options is not None:
+        all_cols, pq_filters = parquet_options
+
+        def make_chunks(usecols=None):
+            return ingest.iter_parquet_chunks(uploaded_file, usecols or all_cols, pq_filters)
+
+        source_label = "Parquet"
+        st.info(f"📌 Parquet | Filter: **{len(pq_filters)}** | Mode Streaming aktif")
+    else:
+        try:
+            delimiter, encoding = detect_csv_delimiter(uploaded_file)
+            all_cols = ingest.read_csv_header(uploaded_file, delimiter, encoding)
+        except Exception as e:
+            st.error(f"❌ Gagal membaca file CSV: {e}")
+            st.stop()
+
+        def make_chunks(usecols=None):
+            return ingest.iter_csv_chunks(uploaded_file, delimiter, encoding, usecols=usecols)
+
+        source_label = "CSV"
+        pq_filters = None
+        st.info(f"📌 Delimiter: **'{delimiter}'** | Encoding: **{encoding}** | Mode Streaming aktif")
+
+    # 2. PEMETAAN
+    col1, col2 = st.columns(2)
+    with col1:
+        id_col = st.selectbox("Kolom ID Sampel", all_cols)
+    with col2:
+        value_col = st.selectbox("Kolom Nilai Rupiah", all_cols,
+                                 index=len(all_cols) - 1 if all_cols else 0)
+
+    # Ringkasan streaming disimpan agar rerun widget tidak membaca ulang file
+    summary_key = (getattr(uploaded_file, 'file_id', uploaded_file.name),
+                   uploaded_file.size, value_col, repr(pq_filters))
+    if st.session_state.get('stream_summary_key') != summary_key:
+        # Validasi kolom nilai dari chunk pertama, seperti mode non-streaming
+        try:
+            chunks = make_chunks([value_col])
+            chunk_pertama = next(chunks, None)
+            chunks.close()
+        except Exception as e:
+            st.error(f"❌ Gagal membaca file {source_label}: {e}")
+            st.stop()
+        if chunk_pertama is not None and not pd.api.types.is_numeric_dtype(chunk_pertama[value_col]):
+            st.error(f"❌ Kolom '{value_col}' bukan kolom nilai numerik. Pilih kolom lain.")
+            st.stop()
+        try:
+            with st.spinner("Membaca data per chunk..."):
+                summary = ingest.stream_statistics(make_chunks([value_col]), value_col)
+        except Exception as e:
+            st.error(f"❌ Gagal membaca file {source_label}: {e}")
+            st.stop()
+        st.session_state['stream_summary'] = summary
+        st.session_state['stream_summary_key'] = summary_key
+        st.session_state.pop('sampled_df', None)
+
+    summary = st.session_state['stream_summary']
+    stats = summary['stats']
+    n_rows = summary['n_rows']
+    total_nilai_buku = stats.total
+
+    st.success(f"Data dibaca secara streaming: {n_rows} baris.")
+    if summary.get('n_kosong'):
+        st.warning(f"⚠️ {summary['n_kosong']:,} baris dengan nilai '{value_col}' kosong atau "
+                   "tidak valid diabaikan dalam total nilai buku.")
+    st.info(f"💰 Total Nilai Buku: Rp {total_nilai_buku:,.2f}")
+
+    if n_rows == 0:
+        st.warning("File tidak berisi baris data.")
+        return
+
+    # 3. METODE HITUNG JUMLAH SAMPEL
+    st.markdown("---")
+    st.subheader("Metode Penentuan Jumlah Sampel")
+    st.caption("ℹ️ Stratified MPU membutuhkan seluruh populasi di memori sehingga tidak tersedia pada Mode Streaming.")
+
+    metode_sampling = st.selectbox("Pilih Metode", [
+        "Monetary Unit Sampling (MUS)", "Unstratified Mean Per Unit (MPU)"
+    ])
+
+    col_in1, col_in2, col_in3, col_in4 = st.columns(4)
+    with col_in1:
+        confidence = st.selectbox("Confidence Level", [90, 95, 99], index=1)
+    with col_in2:
+        sst = st.number_input("Salah Saji Tertoleransi (SST)",
+                              value=float(total_nilai_buku) * 0.05)
+
+    if metode_sampling == "Monetary Unit Sampling (MUS)":
+        with col_in3:
+            dss = st.number_input("Dugaan Salah Saji (DSS)", value=0.0)
+            expected_errors = st.number_input(
+                "Jumlah Kesalahan Diharapkan", min_value=0, max_value=calc.RF_MAKS_KESALAHAN, value=0,
+                help="RF nol kesalahan mengikuti Juknis; selain itu batas atas Poisson.")
+        with col_in4:
+            expansion = st.selectbox("Expansion Factor", [1, 5, 10, 15, 20, 25, 30, 37], index=1)
+        n_res, error_msg = calc.calculate_mus(total_nilai_buku, confidence, sst, dss, expansion,
+                                              expected_errors=int(expected_errors))
+    else:
+        with col_in3:
+            current_std_dev = stats.std()
+            st.info(f"💡 SD Populasi saat ini: {current_std_dev:,.2f}")
+            sd = st.number_input(
+                "Estimasi Standar Deviasi (SD)",
+                value=float(current_std_dev),
+                min_value=0.0,
+                format="%.2f"
+            )
+        n_res, error_msg = calc.calculate_mpu_unstratified(n_rows, confidence, sst, sd)
+
+    if error_msg:
+        st.error(error_msg)
+        return
+
+    st.metric("Jumlah Sampel Disarankan (n)", f"{n_res} Item")
+    n_final = st.number_input("Jumlah Sampel Final",
+                              min_value=1,
+                              max_value=n_rows,
+                              value=min(int(n_res), n_rows) if n_res > 0 else min(30, n_rows))
+
+    # 4. TEKNIK EKSEKUSI
+    st.markdown("---")
+    st.subheader("Teknik Pemilihan Sampel")
+
+    teknik = st.selectbox("Teknik Pemilihan", [
+        "Acak Sederhana", "PPS (Wajib untuk MUS)", "Sistematis"
+    ])
+
+    if st.button("🚀 Generate Sampel"):
+        with st.spinner("Memilih sampel per chunk..."):
+            if teknik == "PPS (Wajib untuk MUS)":
+                sampled_df = ingest.select_pps_from_chunks(
+                    make_chunks(), value_col, n_final, summary['total_positive'])
+            else:
+                if teknik == "Acak Sederhana":
+                    positions = ingest.random_positions(n_rows, n_final)
+                else:
+                    positions = ingest.systematic_positions(n_rows, n_final)
+                sampled_df = ingest.select_positions_from_chunks(
+                    make_chunks(), positions, value_col=value_col)
+        st.session_state['sampled_df'] = sampled_df
+
+    if 'sampled_df' in st.session_state and not st.session_state['sampled_df'].empty:
+        current_sampled_df = st.session_state['sampled_df']
+        st.success(f"Terpilih {len(current_sampled_df)} sampel.")
+
+        if value_col in current_sampled_df.columns:
+            total_sampled_value = current_sampled_df[value_col].sum()
+            pct_nilai_sampel = (total_sampled_value / total_nilai_buku * 100) if total_nilai_buku > 0 else 0
+            col_metric1, col_metric2 = st.columns(2)
+            with col_metric1:
+                st.metric("Total Nilai Sampel", f"Rp {total_sampled_value:,.2f}")
+            with col_metric2:
+                st.metric("Persentase Nilai Sampel", f"{pct_nilai_sampel:.2f}%")
+
+        st.dataframe(current_sampled_df)
+
+        buff_sampel = BytesIO()
+        with pd.ExcelWriter(buff_sampel, engine='openpyxl') as writer:
+            current_sampled_df.to_excel(writer, index=False, sheet_name='Sampel')
+        buff_sampel.seek(0)
+        st.download_button(
+            label="📊 Download Sampel (.xlsx)",
+            data=buff_sampel.getvalue(),
+            file_name="sampel.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+        if metode_sampling == "Monetary Unit Sampling (MUS)":
+            evaluasi_mus_ui(current_sampled_df, value_col, total_nilai_buku, confidence, sst)
+
+    elif 'sampled_df' in st.session_state and st.session_state['sampled_df'].empty:
+        st.warning("Tidak ada sampel yang terpilih. Cek parameter.")
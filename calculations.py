@@ -1,13 +1,95 @@
 import math
 
+import numpy as np
+from scipy.special import gammaincinv
 
-def get_reliability_factor(confidence_level):
+
+# --- FAKTOR MUS (RF & EF) ---
+# RF Juknis Hal 28 (Tabel 1.4) untuk nol kesalahan. Nilai lain (confidence
+# level sembarang dan kesalahan > 0) memakai batas atas Poisson:
+# RF(CL, k) = invers gamma regularisasi P(k + 1, CL).
+RF_JUKNIS = {90: 2.40, 95: 3.00, 99: 3.70}
+# Jumlah kesalahan yang disimpan di cache tabel RF; k lebih besar dihitung langsung
+RF_MAKS_KESALAHAN = 20
+# 'juknis': nilai tabel juknis untuk setiap elemen dengan k = 0 (dan confidence
+# level yang ada di tabel), Poisson untuk elemen lain; skalar dan array sama
+# 'poisson': selalu memakai nilai Poisson/gamma eksak
+METODE_RF_DEFAULT = 'juknis'
+
+# EF Juknis Hal 36 per risiko (%)
+EF_JUKNIS = {1: 1.9, 5: 1.6, 10: 1.5, 15: 1.4, 20: 1.3, 25: 1.25, 30: 1.2, 37: 1.15}
+
+# Cache tabel RF: confidence level (dibulatkan 0.01) -> array RF untuk
+# 0..RF_MAKS_KESALAHAN kesalahan. Diisi grid 50.0-99.9 saat pertama dipakai;
+# confidence level lain dihitung sekaligus saat pertama diminta.
+_RF_TABEL = {}
+
+
+def _rf_baris(confidence_levels):
+    """Baris tabel RF untuk setiap confidence level unik (scipy hanya untuk yang belum ada)."""
+    keys = np.round(np.asarray(confidence_levels, dtype=float), 2)
+    if np.any((keys <= 0) | (keys >= 100)):
+        raise ValueError("Confidence level harus di antara 0 dan 100")
+    if not _RF_TABEL:
+        keys_awal = np.round(np.arange(500, 1000) / 10, 2)
+    else:
+        keys_awal = np.array([], dtype=float)
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    baru = [c for c in np.union1d(uniq, keys_awal).tolist() if c not in _RF_TABEL]
+    if baru:
+        k = np.arange(RF_MAKS_KESALAHAN + 1)
+        tabel = gammaincinv(k[None, :] + 1, np.asarray(baru)[:, None] / 100)
+        for c, row in zip(baru, tabel):
+            _RF_TABEL[c] = row
+    return np.stack([_RF_TABEL[c] for c in uniq.tolist()]), inverse.reshape(keys.shape)
+
+
+def get_reliability_factor_array(confidence_level, expected_errors=0, metode=METODE_RF_DEFAULT):
+    """Versi array get_reliability_factor (argumen di-broadcast)."""
+    if metode not in ('juknis', 'poisson'):
+        raise ValueError(f"Metode RF tidak dikenal: {metode}")
+    confidence_level, expected_errors = np.broadcast_arrays(
+        np.asarray(confidence_level, dtype=float), np.asarray(expected_errors))
+    k = expected_errors.astype(np.int64)
+    if np.any((k < 0) | (k != expected_errors)):
+        raise ValueError("Jumlah kesalahan harus bilangan bulat >= 0")
+    rows, inverse = _rf_baris(confidence_level)
+    dalam_tabel = k <= RF_MAKS_KESALAHAN
+    rf = rows[inverse, np.minimum(k, RF_MAKS_KESALAHAN)]
+    if not dalam_tabel.all():
+        # Di luar cache (sampel dengan banyak kesalahan): hitung langsung
+        rf = np.where(dalam_tabel, rf,
+                      gammaincinv(k + 1, np.round(confidence_level, 2) / 100))
+    if metode == 'juknis':
+        juknis = _lookup_array(RF_JUKNIS, confidence_level, np.nan)
+        rf = np.where((k == 0) & ~np.isnan(juknis), juknis, rf)
+    return rf
+
+
+def get_reliability_factor(confidence_level, expected_errors=0, metode=METODE_RF_DEFAULT):
     """
-    Mengambil Reliability Factor (RF) untuk MUS (Zero Errors).
-    Referensi: Juknis Hal 28 (Tabel 1.4).
+    Mengambil Reliability Factor (RF) untuk MUS.
+    Referensi: Juknis Hal 28 (Tabel 1.4) untuk nol kesalahan; confidence
+    level dan jumlah kesalahan lain memakai batas atas Poisson.
     """
-    lookup = {90: 2.40, 95: 3.00, 99: 3.70}
-    return lookup.get(confidence_level, 3.00)
+    # Jalur cepat skalar: langsung dari tabel juknis / cache
+    key = round(float(confidence_level), 2)
+    if metode == 'juknis' and expected_errors == 0 and key in RF_JUKNIS:
+        return RF_JUKNIS[key]
+    row = _RF_TABEL.get(key)
+    if row is None or not isinstance(expected_errors, (int, np.integer)) \
+            or not 0 <= expected_errors <= RF_MAKS_KESALAHAN or metode not in ('juknis', 'poisson'):
+        return float(get_reliability_factor_array(confidence_level, expected_errors, metode))
+    return float(row[expected_errors])
+
+
+def get_expansion_factor_array(expansion_factor):
+    """Versi array get_expansion_factor."""
+    risiko = np.asarray(expansion_factor)
+    ef = _lookup_array(EF_JUKNIS, risiko, np.nan)
+    if np.any(np.isnan(ef)):
+        raise ValueError(f"Expansion factor harus salah satu dari {list(EF_JUKNIS)}")
+    return ef
 
 
 def get_expansion_factor(expansion_factor):
@@ -15,8 +97,9 @@ def get_expansion_factor(expansion_factor):
     Mengambil Expansion Factor (EF) untuk MUS.
     Referensi: Juknis Hal 36.
     """
-    lookup = {1: 1.9, 5: 1.6, 10: 1.5, 15: 1.4, 20: 1.3, 25: 1.25, 30: 1.2, 37: 1.15}
-    return lookup.get(expansion_factor, 1.5)
+    if expansion_factor in EF_JUKNIS:
+        return EF_JUKNIS[expansion_factor]
+    return float(get_expansion_factor_array(expansion_factor))
 
 
 def get_ur_coefficient(confidence_level):
@@ -31,13 +114,15 @@ def get_ur_coefficient(confidence_level):
 # --- FUNGSI UTAMA PERHITUNGAN N ---
 
 
-def calculate_mus(total_nilai_buku, confidence_level, sst, dss, expansion_factor):
+def calculate_mus(total_nilai_buku, confidence_level, sst, dss, expansion_factor,
+                  expected_errors=0):
     """
     Rumus Monetary Unit Sampling (MUS).
     Juknis Hal 47 (Poin 5b).
     n = (NB * RF) / (SST - (DSS * EF))
+    RF untuk expected_errors kesalahan yang diharapkan (default 0).
     """
-    rf = get_reliability_factor(confidence_level)
+    rf = get_reliability_factor(confidence_level, expected_errors)
     ef = get_expansion_factor(expansion_factor)
 
     denominator = sst - (dss * ef)
@@ -82,15 +167,21 @@ def calculate_mpu_stratified(strata_summary, confidence_level, sst):
     """
     Rumus Stratified MPU (Mean Per Unit) dengan FPC Presisi.
     Formula: n = (Sum(Ni * Si))^2 / ( (SST/Ur)^2 + Sum(Ni * Si^2) )
+    Strata dengan 'take_all' True diperiksa seluruhnya: tidak ikut rumus,
+    jumlah populasinya ditambahkan ke n.
     """
     ur = get_ur_coefficient(confidence_level)
 
     # Inisialisasi KEDUA variabel penampung
     sum_ni_sdi = 0
     sum_ni_sdi2 = 0  # <--- PERBAIKAN 1: Harus di-init nol dulu
+    n_take_all = 0
 
     for item in strata_summary:
         ni = item['count']
+        if item.get('take_all'):
+            n_take_all += ni
+            continue
         sdi = item['std_dev']
         
         # Hitung komponen
@@ -112,7 +203,655 @@ def calculate_mpu_stratified(strata_summary, confidence_level, sst):
             return 0, "Denominator 0, cek parameter SST"
 
         n_total = numerator / denominator
-        return math.ceil(n_total), None
+        return math.ceil(n_total) + int(n_take_all), None
 
     except ZeroDivisionError:
         return 0, "SST tidak boleh 0"
+
+
+def evaluasi_mus(total_nilai_buku, n_sampel, nilai_buku_item, salah_saji_item, confidence_level,
+                 metode_rf=METODE_RF_DEFAULT):
+    """
+    Evaluasi hasil sampel MUS: batas atas salah saji (overstatement).
+    Interval J = NB / n. Item >= J: salah saji aktual. Item < J: tainting
+    (salah saji / nilai buku) diproyeksikan x J, diurut menurun, dan diberi
+    incremental allowance (RF(k) - RF(k-1) - 1) x proyeksi. Basic precision
+    memakai RF(0) metode_rf (sama dengan penentuan n); selisih RF untuk
+    incremental allowance selalu dari satu tabel Poisson agar tidak melompat
+    di antara tabel juknis dan Poisson.
+
+    Args:
+        nilai_buku_item, salah_saji_item: nilai buku dan salah saji item
+            sampel yang mengandung kesalahan (salah saji <= 0 diabaikan)
+
+    Returns:
+        Dict interval_sampling, jumlah_kesalahan, basic_precision,
+        salah_saji_proyeksi, incremental_allowance dan batas_atas_salah_saji
+    """
+    interval = total_nilai_buku / n_sampel
+    nilai_buku_item = np.asarray(nilai_buku_item, dtype=float)
+    salah_saji_item = np.asarray(salah_saji_item, dtype=float)
+    lebih_saji = salah_saji_item > 0
+    atas = lebih_saji & (nilai_buku_item >= interval)
+    bawah = lebih_saji & ~atas
+
+    tainting = np.sort(salah_saji_item[bawah] / nilai_buku_item[bawah])[::-1]
+    proyeksi = tainting * interval
+    k = len(proyeksi)
+    rf = get_reliability_factor_array(confidence_level, np.arange(k + 1), 'poisson')
+
+    basic_precision = float(get_reliability_factor(confidence_level, 0, metode_rf) * interval)
+    incremental = float(((np.diff(rf) - 1) * proyeksi).sum())
+    salah_saji_proyeksi = float(proyeksi.sum() + salah_saji_item[atas].sum())
+    return {
+        'interval_sampling': interval,
+        'jumlah_kesalahan': k,
+        'basic_precision': basic_precision,
+        'salah_saji_proyeksi': salah_saji_proyeksi,
+        'incremental_allowance': incremental,
+        'batas_atas_salah_saji': basic_precision + salah_saji_proyeksi + incremental,
+    }
+
+
+# --- VARIAN GRID (BROADCAST NUMPY) ---
+# Semua argumen boleh skalar atau array yang dapat di-broadcast; hasil berupa
+# array n (int64) dengan bentuk hasil broadcast. Kombinasi parameter yang
+# pada versi skalar menghasilkan error bernilai 0.
+
+
+def _lookup_array(lookup, keys, default):
+    """Versi array dari lookup.get(key, default) (dihitung per nilai unik)."""
+    keys = np.asarray(keys)
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    table = np.array([lookup.get(k, default) for k in uniq.tolist()], dtype=float)
+    return table[inverse].reshape(keys.shape)
+
+
+def get_ur_coefficient_array(confidence_level):
+    return _lookup_array({90: 1.65, 95: 1.96, 99: 2.58}, confidence_level, 1.96)
+
+
+def _ceil_valid(n, valid):
+    """Bulatkan ke atas; sel yang tidak valid diisi 0."""
+    return np.where(valid, np.ceil(np.where(valid, n, 0.0)), 0).astype(np.int64)
+
+
+def calculate_mus_grid(total_nilai_buku, confidence_level, sst, dss, expansion_factor,
+                       expected_errors=0):
+    """
+    calculate_mus untuk grid parameter sekaligus.
+    n = (NB * RF) / (SST - (DSS * EF)); 0 bila denominator <= 0.
+    """
+    rf = get_reliability_factor_array(confidence_level, expected_errors)
+    ef = get_expansion_factor_array(expansion_factor)
+    denominator = np.asarray(sst, dtype=float) - (np.asarray(dss, dtype=float) * ef)
+    valid = denominator > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = (np.asarray(total_nilai_buku, dtype=float) * rf) / denominator
+    return _ceil_valid(n, valid)
+
+
+def calculate_mpu_unstratified_grid(population_size, confidence_level, sst, std_dev_est):
+    """
+    calculate_mpu_unstratified untuk grid parameter sekaligus.
+    n = ns / (1 + ns/N), ns = ((UR * SD * N) / SST)^2; 0 bila SST atau N = 0.
+    """
+    ur = get_ur_coefficient_array(confidence_level)
+    population_size = np.asarray(population_size, dtype=float)
+    sst = np.asarray(sst, dtype=float)
+    valid = (sst != 0) & (population_size != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ns = ((ur * np.asarray(std_dev_est, dtype=float) * population_size) / sst)**2
+        n = ns/(1 + (ns / population_size))
+    return _ceil_valid(n, valid & np.isfinite(n))
+
+
+def calculate_mpu_stratified_grid(counts, std_devs, confidence_level, sst, n_take_all=0):
+    """
+    calculate_mpu_stratified untuk grid parameter sekaligus.
+    counts: jumlah populasi per strata (sumbu terakhir = strata)
+    std_devs: estimasi SD per strata, bentuk (..., jumlah strata) sehingga
+        dapat berisi beberapa skenario SD
+    n = (Sum(Ni * Si))^2 / ( (SST/Ur)^2 + Sum(Ni * Si^2) ) + n_take_all
+    (jumlah populasi strata take-all, tidak termasuk counts); 0 bila
+    denominator 0.
+    """
+    ur = get_ur_coefficient_array(confidence_level)
+    counts = np.asarray(counts, dtype=float)
+    std_devs = np.asarray(std_devs, dtype=float)
+    sum_ni_sdi = (counts * std_devs).sum(axis=-1)
+    sum_ni_sdi2 = (counts * std_devs ** 2).sum(axis=-1)
+    sst = np.asarray(sst, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v_allowed = (sst / ur) ** 2
+        denominator = v_allowed + sum_ni_sdi2
+        n = sum_ni_sdi ** 2 / denominator
+    valid = denominator != 0
+    n_grid = _ceil_valid(n, valid & np.isfinite(n))
+    return np.where(valid, n_grid + int(n_take_all), 0)
+
+
+# --- BATAS STRATA OPTIMAL (DALENIUS-HODGES / LAVALLEE-HIDIROGLOU) ---
+# Populasi diringkas menjadi histogram (jumlah, total, total kuadrat per bin)
+# dalam satu lintasan O(N); batas strata dicari pada tepi bin sehingga
+# statistik setiap strata dihitung O(1) dari prefix sum histogram.
+
+STRATA_N_BINS = 2000
+METODE_STRATA = ('dh', 'lh')
+
+
+def histogram_strata(values, n_bins=STRATA_N_BINS):
+    """
+    Histogram populasi untuk optimasi strata. Bin dibuat sama lebar pada skala
+    log1p(x - min) sehingga data belanja yang menceng tetap terurai.
+
+    Returns:
+        Dict 'tepi' (n_bins + 1 tepi bin, skala asli), dan prefix sum
+        'p_count', 'p_sum', 'p_sumsq' (panjang n_bins + 1)
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        raise ValueError("Populasi kosong")
+    x_min = values.min()
+    t = np.log1p(values - x_min)
+    t_max = t.max()
+    if t_max == 0:
+        n_bins = 1
+    idx = np.minimum((t * (n_bins / t_max) if t_max > 0 else np.zeros_like(t)).astype(np.int64), n_bins - 1)
+    # Pusatkan nilai agar total kuadrat tidak kehilangan presisi
+    pusat = values.mean()
+    d = values - pusat
+    count = np.bincount(idx, minlength=n_bins).astype(float)
+    total = np.bincount(idx, weights=d, minlength=n_bins)
+    total_kuadrat = np.bincount(idx, weights=d * d, minlength=n_bins)
+    tepi = x_min + np.expm1(np.linspace(0.0, t_max, n_bins + 1))
+    tepi[-1] = values.max()
+    nol = np.zeros(1)
+    return {
+        'tepi': tepi,
+        'pusat': pusat,
+        'p_count': np.concatenate([nol, np.cumsum(count)]),
+        'p_sum': np.concatenate([nol, np.cumsum(total)]),
+        'p_sumsq': np.concatenate([nol, np.cumsum(total_kuadrat)]),
+    }
+
+
+def _statistik_segmen(hist, awal, akhir):
+    """Jumlah, rata-rata (terpusat) dan SD (ddof 1) segmen bin [awal, akhir) secara vektor."""
+    cnt = hist['p_count'][akhir] - hist['p_count'][awal]
+    jml = hist['p_sum'][akhir] - hist['p_sum'][awal]
+    kdr = hist['p_sumsq'][akhir] - hist['p_sumsq'][awal]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(cnt > 0, jml / cnt, 0.0)
+        var = np.where(cnt > 1, (kdr - cnt * mean * mean) / (cnt - 1), 0.0)
+    return cnt, mean, np.sqrt(np.maximum(var, 0.0))
+
+
+def _n_strata_kandidat(hist, batas, n_take_some, ur, sst):
+    """
+    Jumlah sampel stratified MPU untuk setiap baris kandidat batas (indeks
+    tepi bin, bentuk (C, m)). Strata setelah n_take_some strata pertama adalah
+    take-all (diperiksa seluruhnya).
+    """
+    n_bins = len(hist['tepi']) - 1
+    c = batas.shape[0]
+    tepi = np.concatenate([np.zeros((c, 1), dtype=np.int64), batas,
+                           np.full((c, 1), n_bins, dtype=np.int64)], axis=1)
+    cnt, _, sd = _statistik_segmen(hist, tepi[:, :-1], tepi[:, 1:])
+    ts_cnt, ts_sd = cnt[:, :n_take_some], sd[:, :n_take_some]
+    sum_ni_sdi = (ts_cnt * ts_sd).sum(axis=1)
+    sum_ni_sdi2 = (ts_cnt * ts_sd ** 2).sum(axis=1)
+    denominator = (sst / ur) ** 2 + sum_ni_sdi2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(denominator > 0, sum_ni_sdi ** 2 / denominator, 0.0)
+    n_take_all = cnt[:, n_take_some:].sum(axis=1)
+    return np.ceil(n) + n_take_all
+
+
+def _batas_dh(hist, n_strata, akhir=None):
+    """Batas Dalenius-Hodges (cum sqrt(f x lebar bin)) atas bin [0, akhir)."""
+    n_bins = len(hist['tepi']) - 1
+    akhir = n_bins if akhir is None else akhir
+    f = np.diff(hist['p_count'])[:akhir]
+    cum = np.cumsum(np.sqrt(f * np.diff(hist['tepi'])[:akhir]))
+    if len(cum) == 0 or cum[-1] == 0:
+        return np.arange(1, n_strata, dtype=np.int64)
+    target = cum[-1] * np.arange(1, n_strata) / n_strata
+    batas = np.searchsorted(cum, target, side='left') + 1
+    # Pastikan batas naik tegas agar tidak ada strata kosong
+    batas = np.maximum(batas, np.arange(1, n_strata))
+    batas = np.minimum(batas, akhir - n_strata + np.arange(1, n_strata))
+    return np.maximum.accumulate(batas).astype(np.int64)
+
+
+def optimasi_batas_strata(values, n_strata, confidence_level, sst, metode='lh', take_all=True,
+                          n_bins=STRATA_N_BINS, max_iter=50, hist=None):
+    """
+    Cari batas strata untuk Stratified MPU.
+
+    Args:
+        values: Nilai populasi
+        n_strata: Jumlah strata take-some (diluar strata take-all)
+        metode: 'dh' (Dalenius-Hodges cum sqrt f) atau 'lh' (Lavallee-Hidiroglou:
+            pencarian iteratif per batas, dimulai dari DH, meminimalkan total n)
+        take_all: Tambah strata teratas yang diperiksa 100% bila menurunkan n
+        hist: Hasil histogram_strata (opsional, agar tidak dihitung ulang)
+
+    Returns:
+        Dict 'batas' (nilai batas antar strata, naik), 'n' (total sampel),
+        'take_all' (bool, strata terakhir take-all) dan 'metode'
+    """
+    if metode not in METODE_STRATA:
+        raise ValueError(f"Metode stratifikasi tidak dikenal: {metode}")
+    if hist is None:
+        hist = histogram_strata(values, n_bins)
+    n_bins = len(hist['tepi']) - 1
+    if n_bins < n_strata + (1 if take_all else 0):
+        raise ValueError("Variasi nilai populasi terlalu kecil untuk jumlah strata ini")
+    ur = get_ur_coefficient(confidence_level)
+
+    # Titik awal: DH tanpa take-all, atau DH di bawah setiap kandidat batas
+    # take-all lalu dipilih n terkecil (seluruh kandidat dievaluasi sekaligus)
+    if take_all:
+        kandidat_akhir = np.arange(n_strata, n_bins + 1)
+        kandidat = np.array([np.append(_batas_dh(hist, n_strata, a), a) for a in kandidat_akhir])
+        n_kandidat = _n_strata_kandidat(hist, kandidat, n_strata, ur, sst)
+        batas = kandidat[np.argmin(n_kandidat)]
+    else:
+        batas = _batas_dh(hist, n_strata)
+    n_terbaik = _n_strata_kandidat(hist, batas[None, :], n_strata, ur, sst)[0]
+
+    if metode == 'lh':
+        # Lavallee-Hidiroglou: perbaiki satu batas per langkah dengan mencoba
+        # semua posisi di antara kedua tetangganya, ulangi sampai stabil
+        for _ in range(max_iter):
+            berubah = False
+            for j in range(len(batas)):
+                kiri = batas[j - 1] + 1 if j > 0 else 1
+                terakhir = take_all and j == len(batas) - 1
+                if terakhir:
+                    kanan = n_bins + 1
+                else:
+                    kanan = batas[j + 1] if j + 1 < len(batas) else n_bins
+                posisi = np.arange(kiri, kanan)
+                if len(posisi) == 0:
+                    continue
+                kandidat = np.repeat(batas[None, :], len(posisi), axis=0)
+                kandidat[:, j] = posisi
+                n_kandidat = _n_strata_kandidat(hist, kandidat, n_strata, ur, sst)
+                i = np.argmin(n_kandidat)
+                if n_kandidat[i] < n_terbaik:
+                    n_terbaik, batas, berubah = n_kandidat[i], kandidat[i], True
+            if not berubah:
+                break
+
+    batas_nilai = hist['tepi'][batas]
+    # Strata take-all kosong berarti tidak ada take-all
+    ada_take_all = bool(take_all and batas[-1] < n_bins)
+    if take_all and not ada_take_all:
+        batas_nilai = batas_nilai[:-1]
+    return {
+        'batas': batas_nilai,
+        'n': int(n_terbaik),
+        'take_all': ada_take_all,
+        'metode': metode,
+    }
+
+
+def tetapkan_strata(values, batas, tutup_kanan=False):
+    """
+    Indeks strata (0..len(batas)) setiap nilai; nilai = batas masuk strata atas,
+    atau strata bawah bila tutup_kanan (interval (a, b] seperti pd.qcut).
+    NaN mendapat indeks -1.
+    """
+    values = np.asarray(values, dtype=float)
+    kode = np.searchsorted(np.asarray(batas, dtype=float), values, side='left' if tutup_kanan else 'right')
+    kode[np.isnan(values)] = -1
+    return kode
+
+
+class IndeksNilaiUrut:
+    """
+    Salinan nilai populasi yang sudah diurutkan beserta prefix sum dan prefix
+    sum kuadrat (terpusat). Count/mean/SD setiap strata untuk sembarang batas
+    cukup dihitung dengan searchsorted, O(k log N), tanpa qcut/groupby ulang
+    atas seluruh populasi setiap kali jumlah strata diubah.
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=float)
+        self.urut = np.sort(values[~np.isnan(values)])
+        if self.urut.size == 0:
+            raise ValueError("Populasi kosong")
+        # Pusatkan nilai agar total kuadrat tidak kehilangan presisi
+        self.pusat = float(self.urut.mean())
+        d = self.urut - self.pusat
+        nol = np.zeros(1)
+        self.p_sum = np.concatenate([nol, np.cumsum(d)])
+        self.p_sumsq = np.concatenate([nol, np.cumsum(d * d)])
+
+    def __len__(self):
+        return self.urut.size
+
+    @property
+    def min(self):
+        return float(self.urut[0])
+
+    @property
+    def max(self):
+        return float(self.urut[-1])
+
+    def kuantil(self, q):
+        """
+        Kuantil q (0..1) dengan interpolasi linear dari array terurut,
+        identik dengan Series.quantile (np.percentile atas q * 100).
+        """
+        return np.percentile(self.urut, np.atleast_1d(np.asarray(q, dtype=float)) * 100)
+
+    def tepi_kuantil(self, n_bins):
+        """Tepi bin kuantil sama banyak (seperti pd.qcut, tepi kembar dibuang)."""
+        tepi = np.unique(self.kuantil(np.linspace(0, 1, n_bins + 1)))
+        if tepi.size < 2:
+            raise ValueError("Nilai populasi seragam, tidak dapat dibagi menjadi strata")
+        return tepi
+
+    def posisi(self, batas, tutup_kanan=False):
+        """Jumlah nilai di bawah setiap batas (dengan aturan tepi tetapkan_strata)."""
+        return np.searchsorted(self.urut, np.asarray(batas, dtype=float),
+                               side='right' if tutup_kanan else 'left')
+
+    def statistik(self, batas, tutup_kanan=False):
+        """
+        Statistik per strata untuk batas antar strata (naik).
+
+        Returns:
+            Dict array 'count', 'mean', 'std' (ddof 1, 0 bila count <= 1)
+            sepanjang len(batas) + 1
+        """
+        pos = np.concatenate([[0], self.posisi(batas, tutup_kanan), [self.urut.size]])
+        awal, akhir = pos[:-1], pos[1:]
+        cnt = (akhir - awal).astype(float)
+        jml = self.p_sum[akhir] - self.p_sum[awal]
+        kdr = self.p_sumsq[akhir] - self.p_sumsq[awal]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(cnt > 0, jml / cnt, 0.0)
+            var = np.where(cnt > 1, (kdr - cnt * mean * mean) / (cnt - 1), 0.0)
+        return {
+            'count': cnt.astype(np.int64),
+            'mean': np.where(cnt > 0, mean + self.pusat, np.nan),
+            'std': np.sqrt(np.maximum(var, 0.0)),
+        }
+
+    def histogram(self, n_bins=STRATA_N_BINS):
+        """
+        Histogram seperti histogram_strata, dibentuk dari prefix sum
+        (O(n_bins log N)); nilai pada tepi bin masuk bin atas.
+        """
+        x_min, x_max = self.min, self.max
+        t_max = math.log1p(x_max - x_min)
+        if t_max == 0:
+            n_bins = 1
+        tepi = x_min + np.expm1(np.linspace(0.0, t_max, n_bins + 1))
+        tepi[-1] = x_max
+        pos = np.concatenate([[0], self.posisi(tepi[1:-1]), [self.urut.size]])
+        return {
+            'tepi': tepi,
+            'pusat': self.pusat,
+            'p_count': pos.astype(float),
+            'p_sum': self.p_sum[pos],
+            'p_sumsq': self.p_sumsq[pos],
+        }
+
+
+METODE_ALOKASI = ('proporsional', 'neyman', 'optimum')
+
+
+def _bobot_alokasi(counts, std_devs, metode, biaya):
+    """Bobot alokasi per strata: N_h, N_h*S_h atau N_h*S_h/sqrt(c_h)."""
+    if metode == 'proporsional':
+        return counts.copy()
+    if std_devs is None:
+        raise ValueError("Alokasi Neyman/optimum membutuhkan SD per strata")
+    bobot = counts * np.maximum(np.asarray(std_devs, dtype=float), 0.0)
+    if metode == 'optimum':
+        biaya = np.ones_like(counts) if biaya is None else np.asarray(biaya, dtype=float)
+        if np.any(biaya <= 0):
+            raise ValueError("Biaya per item harus lebih dari 0")
+        bobot = bobot / np.sqrt(biaya)
+    return bobot
+
+
+def _isi_alokasi(n, bobot, bawah, atas):
+    """
+    Alokasi kontinu clip(lambda * bobot, bawah, atas) dengan total n.
+    Total naik linear sepotong-sepotong terhadap lambda, sehingga lambda
+    dicari tepat di antara titik patah bawah/bobot dan atas/bobot (kelebihan
+    strata yang mentok batas atas otomatis terbagi ke strata lain).
+    """
+    if n <= bawah.sum():
+        return bawah.copy()
+    if n >= atas.sum():
+        return atas.copy()
+    # Kemiringan total bertambah bobot_h di bawah_h/bobot_h dan berkurang di atas_h/bobot_h
+    titik = np.concatenate([bawah / bobot, atas / bobot])
+    urutan = np.argsort(titik, kind='stable')
+    titik = titik[urutan]
+    kemiringan = np.cumsum(np.concatenate([bobot, -bobot])[urutan])
+    total = bawah.sum() + np.concatenate([[0.0], np.cumsum(kemiringan[:-1] * np.diff(titik))])
+    i = min(max(int(np.searchsorted(total, n, side='left')), 1), len(total) - 1)
+    lam = titik[i - 1] + (n - total[i - 1]) / kemiringan[i - 1]
+    return np.clip(lam * bobot, bawah, atas)
+
+
+def alokasi_sampel(n_total, counts, std_devs=None, metode='neyman', biaya=None, take_all=None, n_min=0):
+    """
+    Alokasi n sampel ke strata secara vektor (ratusan strata sekaligus).
+
+    Strata take-all diambil seluruhnya. Sisa n dibagi sebanding bobot
+    (proporsional N_h, Neyman N_h*S_h, optimum N_h*S_h/sqrt(c_h)) dengan
+    batas bawah min(n_min, N_h) dan batas atas N_h; kelebihan strata yang
+    mentok populasi dibagikan ulang ke strata lain. Pembulatan memakai
+    largest remainder sehingga total tepat n_total (dibatasi 0..sum N_h).
+
+    Returns:
+        Array int64 jumlah sampel per strata
+    """
+    if metode not in METODE_ALOKASI:
+        raise ValueError(f"Metode alokasi tidak dikenal: {metode}")
+    counts = np.asarray(counts, dtype=float)
+    take_all = np.zeros(counts.shape, dtype=bool) if take_all is None else np.asarray(take_all, dtype=bool)
+    bobot = _bobot_alokasi(counts, std_devs, metode, biaya)
+
+    batas_atas = np.where(take_all, counts, np.floor(counts))
+    batas_bawah = np.where(take_all, counts, np.minimum(max(int(n_min), 0), batas_atas))
+    n_total = min(max(int(n_total), int(batas_bawah.sum())), int(batas_atas.sum()))
+
+    # Strata berbobot dulu; bila semuanya penuh, sisa dibagi ke strata
+    # berbobot nol (misal SD nol) sebanding populasi
+    alokasi = batas_bawah.copy()
+    positif = ~take_all & (bobot > 0)
+    nol = ~take_all & ~positif & (batas_atas > 0)
+    if positif.any():
+        sisa = n_total - alokasi[~positif].sum()
+        alokasi[positif] = _isi_alokasi(sisa, bobot[positif], batas_bawah[positif], batas_atas[positif])
+    if nol.any():
+        sisa = n_total - alokasi[~nol].sum()
+        alokasi[nol] = _isi_alokasi(sisa, counts[nol], batas_bawah[nol], batas_atas[nol])
+
+    # Largest remainder: bulatkan ke bawah lalu tambah 1 pada sisa pecahan terbesar
+    hasil = np.minimum(np.floor(alokasi + 1e-9), batas_atas)
+    kurang = n_total - int(hasil.sum())
+    if kurang > 0:
+        pecahan = np.where(hasil < batas_atas, alokasi - hasil, -np.inf)
+        urutan = np.argsort(-pecahan, kind='stable')[:kurang]
+        hasil[urutan] += 1
+    return hasil.astype(np.int64)
+
+
+# --- AKUMULATOR STATISTIK STREAMING ---
+
+
+class RunningStats:
+    """
+    Akumulator statistik satu lintasan (Welford/Chan) yang dapat digabung.
+    Dipakai untuk data yang dibaca per chunk sehingga nilai populasi
+    tidak perlu dimuat seluruhnya ke memori.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        """Tambahkan satu chunk nilai (NaN diabaikan)."""
+        arr = np.asarray(values, dtype=float)
+        arr = arr[~np.isnan(arr)]
+        if arr.size == 0:
+            return self
+
+        chunk = RunningStats()
+        chunk.count = int(arr.size)
+        chunk.total = float(arr.sum())
+        chunk.mean = chunk.total / chunk.count
+        chunk.m2 = float(((arr - chunk.mean) ** 2).sum())
+        chunk.min = float(arr.min())
+        chunk.max = float(arr.max())
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """Gabungkan state akumulator lain (misal hasil chunk/shard lain)."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.total, self.mean = other.count, other.total, other.mean
+            self.m2, self.min, self.max = other.m2, other.min, other.max
+            return self
+
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + (delta ** 2) * self.count * other.count / n
+        self.count = n
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def kurangi(self, other):
+        """
+        Keluarkan state akumulator lain yang nilainya bagian dari state ini
+        (kebalikan merge, dipakai untuk pembaruan inkremental). Min/max tidak
+        dapat dikurangi sehingga harus diperbarui pemanggil.
+        """
+        if other.count == 0:
+            return self
+        n = self.count - other.count
+        if n <= 0:
+            self.__init__()
+            return self
+
+        mean = (self.count * self.mean - other.count * other.mean) / n
+        delta = other.mean - mean
+        self.m2 = max(self.m2 - other.m2 - (delta ** 2) * n * other.count / self.count, 0.0)
+        self.mean = mean
+        self.count = n
+        self.total -= other.total
+        return self
+
+    def variance(self, ddof=1):
+        if self.count - ddof <= 0:
+            return 0.0
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof=1):
+        """Standar deviasi (default ddof=1, sama dengan pandas .std())."""
+        return math.sqrt(self.variance(ddof))
+
+
+class QuantileSketch:
+    """
+    Sketsa kuantil log-bucket (gaya DDSketch) dengan galat relatif terbatas.
+    Setiap nilai masuk ke bucket [gamma^(i-1), gamma^i], sehingga estimasi
+    kuantil berada dalam relative_accuracy dari nilai sebenarnya. Memori
+    sebanding dengan rentang orde besaran data, bukan jumlah nilai, dan
+    state dari chunk/shard lain dapat digabung.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _add_buckets(self, buckets, magnitudes):
+        if magnitudes.size == 0:
+            return
+        keys = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        keys, counts = np.unique(keys, return_counts=True)
+        for key, cnt in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + cnt
+
+    def update(self, values):
+        """Tambahkan satu chunk nilai (NaN diabaikan)."""
+        arr = np.asarray(values, dtype=float)
+        arr = arr[~np.isnan(arr)]
+        self.count += int(arr.size)
+        self.zero_count += int((arr == 0).sum())
+        self._add_buckets(self.positive, arr[arr > 0])
+        self._add_buckets(self.negative, -arr[arr < 0])
+        return self
+
+    def merge(self, other):
+        """Gabungkan sketsa lain dengan akurasi yang sama."""
+        if other.gamma != self.gamma:
+            raise ValueError("Akurasi relatif sketsa berbeda, tidak dapat digabung")
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, cnt in theirs.items():
+                mine[key] = mine.get(key, 0) + cnt
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def _bucket_value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def _urutan(self):
+        """Nilai representatif bucket (naik) beserta jumlah kumulatifnya."""
+        # Urutan naik: negatif (magnitudo terbesar dulu), nol, lalu positif
+        neg = sorted(self.negative, reverse=True)
+        pos = sorted(self.positive)
+        nilai = np.concatenate([
+            [-self._bucket_value(key) for key in neg],
+            [0.0] if self.zero_count else [],
+            [self._bucket_value(key) for key in pos],
+        ])
+        jumlah = [self.negative[key] for key in neg]
+        jumlah += [self.zero_count] if self.zero_count else []
+        jumlah += [self.positive[key] for key in pos]
+        return nilai, np.cumsum(jumlah)
+
+    def quantile(self, q):
+        """
+        Estimasi kuantil q (0..1); 0 jika sketsa kosong. Seperti np.quantile,
+        rank pecahan q * (n - 1) diinterpolasi linear antara nilai pada dua
+        rank bersebelahan (misal median jumlah data genap).
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        bawah = math.floor(rank)
+        atas = min(bawah + 1, self.count - 1)
+        nilai, kumulatif = self._urutan()
+        v_bawah, v_atas = nilai[np.searchsorted(kumulatif, [bawah, atas], side='right')]
+        return float(v_bawah + (rank - bawah) * (v_atas - v_bawah))
+
+    def median(self):
+        return self.quantile(0.5)
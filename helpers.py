@@ -6,116 +6,307 @@ import pandas as pd
 import numpy as np
 import csv
 import re
-import chardet
+import hashlib
+import threading
+import pyarrow as pa
+import pyarrow.compute as pc
+from collections import OrderedDict
+from chardet.universaldetector import UniversalDetector
 from io import BytesIO
 from openpyxl.styles import Font, PatternFill, Alignment
 
 import pendapatan_analyzer as pend_analyzer
 
 
-def detect_encoding(uploaded_file):
+SNIFF_MAX_BYTES = 64 * 1024
+SNIFF_BLOCK_SIZE = 8 * 1024
+SNIFF_MIN_LINES = 20
+CSV_DELIMITERS = ';,\t|'
+
+# Cache hasil sniffing per signature file agar rerun Streamlit tidak mengulang
+_SNIFF_CACHE = OrderedDict()
+_SNIFF_CACHE_MAX_ENTRIES = 128
+# Sesi Streamlit berjalan di thread terpisah; OrderedDict dijaga lock
+_SNIFF_CACHE_LOCK = threading.Lock()
+
+
+def _read_prefix(uploaded_file, max_bytes):
+    """Baca byte mentah prefix file (maksimal max_bytes)."""
+    uploaded_file.seek(0)
+    prefix = uploaded_file.read(max_bytes)
+    uploaded_file.seek(0)
+    return prefix
+
+
+def _detect_prefix(prefix):
+    """
+    Beri makan detektor encoding inkremental per blok prefix. Berhenti
+    begitu detektor yakin dan baris contoh cukup.
+
+    Returns:
+        Tuple (bagian prefix yang dibaca detektor, hasil detektor)
+    """
+    detector = UniversalDetector()
+    n_read = 0
+    n_lines = 0
+
+    while n_read < len(prefix):
+        block = prefix[n_read:n_read + SNIFF_BLOCK_SIZE]
+        n_read += len(block)
+        n_lines += block.count(b'\n')
+        if not detector.done:
+            detector.feed(block)
+        if detector.done and n_lines >= SNIFF_MIN_LINES:
+            break
+
+    detector.close()
+    return prefix[:n_read], detector.result
+
+
+def _normalize_encoding(encoding):
+    """
+    Prefix murni ASCII dibaca sebagai utf-8 (superset ASCII) karena byte
+    non-ASCII bisa muncul setelah batas prefix.
+    """
+    if not encoding:
+        return 'utf-8'
+    encoding = encoding.lower()
+    if encoding == 'ascii':
+        return 'utf-8'
+    return encoding
+
+
+def _sniff_delimiter(sample):
     """
-    Deteksi encoding file CSV.
+    Deteksi delimiter dari teks contoh tanpa parsing ulang dengan pandas.
     """
+    lines = [ln for ln in sample.splitlines() if ln.strip()]
+    # Buang baris terakhir yang mungkin terpotong batas prefix
+    if len(lines) > 2 and not sample.endswith(('\n', '\r')):
+        lines = lines[:-1]
+    if not lines:
+        return ','
+
     try:
+        return csv.Sniffer().sniff('\n'.join(lines), delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        pass
+
+    # Fallback: delimiter yang jumlahnya paling konsisten di setiap baris
+    best_delim, best_score = ',', 0
+    for delim in CSV_DELIMITERS:
+        counts = [ln.count(delim) for ln in lines]
+        header_count = counts[0]
+        if header_count == 0:
+            continue
+        score = sum(1 for c in counts if c == header_count)
+        if score > best_score:
+            best_delim, best_score = delim, score
+    return best_delim
+
+
+def sniff_csv(uploaded_file, max_bytes=SNIFF_MAX_BYTES):
+    """
+    Deteksi encoding dan delimiter CSV sekaligus dalam satu lintasan
+    atas prefix file (maksimal max_bytes). Hasil di-cache per signature
+    file (nama, ukuran, hash prefix mentah) yang dicek sebelum deteksi
+    encoding sehingga rerun tidak menjalankan detektor lagi.
+
+    Returns:
+        Tuple (delimiter, encoding)
+    """
+    try:
+        prefix = _read_prefix(uploaded_file, max_bytes)
+    except Exception:
         uploaded_file.seek(0)
-        raw_data = uploaded_file.read()
-        
-        result = chardet.detect(raw_data)
-        encoding = result.get('encoding', 'utf-8')
-        
-        uploaded_file.seek(0)
-        return encoding if encoding else 'utf-8'
-    except Exception as e:
-        uploaded_file.seek(0)
-        return 'latin-1'
+        return ',', 'latin-1'
+
+    signature = (getattr(uploaded_file, 'name', None),
+                 getattr(uploaded_file, 'size', None),
+                 hashlib.blake2b(prefix, digest_size=16).hexdigest())
+    with _SNIFF_CACHE_LOCK:
+        if signature in _SNIFF_CACHE:
+            _SNIFF_CACHE.move_to_end(signature)
+            return _SNIFF_CACHE[signature]
+
+    prefix, result = _detect_prefix(prefix)
+    encoding = _normalize_encoding(result.get('encoding'))
+    try:
+        sample = prefix.decode(encoding, errors='ignore')
+    except LookupError:
+        encoding = 'latin-1'
+        sample = prefix.decode(encoding, errors='ignore')
+
+    delimiter = _sniff_delimiter(sample)
+
+    with _SNIFF_CACHE_LOCK:
+        _SNIFF_CACHE[signature] = (delimiter, encoding)
+        if len(_SNIFF_CACHE) > _SNIFF_CACHE_MAX_ENTRIES:
+            _SNIFF_CACHE.popitem(last=False)
+    return delimiter, encoding
+
 
+def detect_encoding(uploaded_file):
+    """
+    Deteksi encoding file CSV (berdasarkan prefix file, lihat sniff_csv).
+    """
+    return sniff_csv(uploaded_file)[1]
 
-def detect_csv_delimiter(uploaded_file, sample_size=5000):
+
+def detect_csv_delimiter(uploaded_file, sample_size=SNIFF_MAX_BYTES):
     """
     Deteksi delimiter CSV secara otomatis.
     """
-    encoding = detect_encoding(uploaded_file)
-    
-    try:
-        uploaded_file.seek(0)
-        sample = uploaded_file.read(sample_size).decode(encoding, errors='ignore')
-        
-        delimiter = csv.Sniffer().sniff(sample).delimiter
-        uploaded_file.seek(0)
-        return delimiter, encoding
-    except Exception as e:
-        delimiters = [';', ',', '\t', '|']
-        
-        for delim in delimiters:
-            try:
-                uploaded_file.seek(0)
-                test_df = pd.read_csv(uploaded_file, sep=delim, nrows=5, encoding=encoding)
-                if len(test_df.columns) > 1:
-                    uploaded_file.seek(0)
-                    return delim, encoding
-            except:
-                continue
-        
-        uploaded_file.seek(0)
-        return ',', encoding
+    return sniff_csv(uploaded_file, max_bytes=sample_size)
+
+
+RUPIAH_PLAN_SAMPLE_SIZE = 5
+RIBUAN_TITIK_SAMPLE_SIZE = 100
+_NUMERIC_PATTERN = r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$'
 
+# Format yang dikenali: 'indo' (1.250.000,00) dan 'desimal_koma' (1250,5)
+_RUPIAH_FORMAT_LABELS = {
+    'indo': 'Format Rupiah (Indo)',
+    'desimal_koma': 'Desimal Koma',
+}
 
-def convert_rupiah_to_numeric(df):
+
+def _spread_samples(series, sample_size):
     """
-    Konversi kolom Rupiah ke numerik dengan perlindungan ketat.
+    Ambil contoh nilai non-null: 5 baris pertama ditambah contoh yang
+    tersebar merata di seluruh kolom (bukan hanya head).
     """
-    print("--- Memulai Cek Konversi Data ---")
+    valid = series.dropna()
+    if valid.empty:
+        return []
+    step = max(len(valid) // sample_size, 1)
+    idx = sorted(set(range(min(RUPIAH_PLAN_SAMPLE_SIZE, len(valid)))) | set(range(0, len(valid), step)[:sample_size]))
+    return valid.iloc[idx].astype(str).tolist()
 
+
+def _decide_rupiah_format(samples):
+    """
+    Tentukan format konversi satu kolom dari contoh nilainya.
+    Returns 'indo', 'desimal_koma', atau None (bukan kolom Rupiah).
+    """
+    if not samples:
+        return None
+    # Kolom teks jika ada huruf di 5 contoh pertama
+    for s in samples[:RUPIAH_PLAN_SAMPLE_SIZE]:
+        clean_check = s.lower().replace('rp', '').replace('.', '').replace(',', '').replace('-', '').strip()
+        if re.search('[a-z]', clean_check):
+            return None
+
+    # Format diputuskan dari contoh pertama (aturan yang sama dengan versi lama)
+    sample = samples[0]
+    if '.' in sample and ',' in sample:
+        if sample.rfind('.') < sample.rfind(','):
+            return 'indo'
+    elif ',' in sample and '.' not in sample:
+        if sample.replace(',', '').strip().isdigit():
+            return 'desimal_koma'
+    return None
+
+
+def plan_rupiah_conversion(df):
+    """
+    Susun rencana konversi per kolom (sekali saja) dari 5 nilai non-null
+    pertamanya (lihat _decide_rupiah_format). Rencana yang sama dapat
+    diterapkan ke chunk berikutnya dari file yang sama.
+
+    Returns:
+        Dict {nama_kolom: 'indo' | 'desimal_koma'}
+    """
+    plan = {}
     for col in df.columns:
         try:
             if df[col].dtype != 'object':
                 continue
+            samples = df[col].dropna().head(RUPIAH_PLAN_SAMPLE_SIZE).astype(str).tolist()
+            fmt = _decide_rupiah_format(samples)
+            if fmt:
+                plan[col] = fmt
+        except Exception:
+            pass
+    return plan
 
-            valid_samples = df[col].dropna().head(5).astype(str).tolist()
-            
-            if not valid_samples:
-                continue
 
-            is_text_column = False
-            for s in valid_samples:
-                clean_check = s.lower().replace('rp', '').replace('.', '').replace(',', '').replace('-', '').strip()
-                
-                if re.search('[a-z]', clean_check):
-                    is_text_column = True
-                    break
-            
-            if is_text_column:
-                continue
+def _to_arrow_string(series):
+    try:
+        return pa.array(series, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array(series.astype(str), type=pa.string(), from_pandas=True)
+
 
-            sample = valid_samples[0]
-            
-            if '.' in sample and ',' in sample:
-                last_dot = sample.rfind('.')
-                last_comma = sample.rfind(',')
-                
-                if last_dot < last_comma:
-                    df[col] = (df[col]
-                               .astype(str)
-                               .str.replace('Rp', '', regex=False)
-                               .str.replace(' ', '', regex=False)
-                               .str.replace('.', '', regex=False)
-                               .str.replace(',', '.', regex=False)
-                               .apply(pd.to_numeric, errors='coerce'))
-                    print(f"✅ Konversi '{col}': Format Rupiah (Indo)")
-
-            elif ',' in sample and '.' not in sample:
-                clean_sample = sample.replace(',', '').strip()
-                if clean_sample.isdigit():
-                    df[col] = (df[col]
-                               .astype(str)
-                               .str.replace(',', '.', regex=False)
-                               .apply(pd.to_numeric, errors='coerce'))
-                    print(f"✅ Konversi '{col}': Desimal Koma")
-
-        except Exception as e:
+_RIBUAN_TITIK_PATTERN = re.compile(r'^(rp\.?)?\s*-?\d{1,3}(\.\d{3})*(,\d+)?$', re.IGNORECASE)
+
+
+def konversi_kolom_nilai(series, sample_size=RIBUAN_TITIK_SAMPLE_SIZE):
+    """
+    Konversi satu kolom yang dipilih pengguna sebagai kolom nilai Rupiah.
+    Selain format yang dikenali plan_rupiah_conversion, nilai seperti
+    'Rp 934.609' (titik ribuan tanpa koma) juga dianggap format Indonesia
+    bila seluruh contoh cocok dengan pola tersebut. Sisanya memakai
+    pd.to_numeric (nilai tidak valid menjadi NaN).
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    series = series.astype(object)
+    samples = _spread_samples(series, sample_size)
+    fmt = _decide_rupiah_format(samples)
+    if (fmt is None and any('.' in s for s in samples)
+            and all(_RIBUAN_TITIK_PATTERN.match(s.strip()) for s in samples)):
+        fmt = 'indo'
+    if fmt is not None:
+        return _convert_rupiah_column(series, fmt)
+    return pd.to_numeric(series, errors='coerce')
+
+
+def _convert_rupiah_column(series, fmt):
+    """
+    Konversi satu kolom dalam satu lintasan kernel Arrow.
+    Nilai yang tidak valid menjadi NaN (setara errors='coerce').
+    """
+    arr = _to_arrow_string(series)
+    # Spasi/tab/NBSP di tepi diabaikan seperti pd.to_numeric
+    arr = pc.utf8_trim_whitespace(arr)
+    if fmt == 'indo':
+        arr = pc.replace_substring_regex(arr, 'Rp|[ \u00a0]|\\.', '')
+    arr = pc.replace_substring(arr, ',', '.')
+    valid = pc.match_substring_regex(arr, _NUMERIC_PATTERN)
+    values = pc.cast(pc.if_else(valid, arr, None), pa.float64())
+    return pd.Series(values.to_numpy(zero_copy_only=False), index=series.index, name=series.name)
+
+
+def apply_rupiah_plan(df, plan):
+    """
+    Terapkan rencana konversi ke DataFrame (atau chunk). Kolom di luar
+    rencana atau yang sudah numerik tidak disentuh.
+    """
+    for col, fmt in plan.items():
+        if col not in df.columns or df[col].dtype != 'object':
+            continue
+        try:
+            df[col] = _convert_rupiah_column(df[col], fmt)
+        except Exception:
             pass
-    
+    return df
+
+
+def convert_rupiah_to_numeric(df, plan=None):
+    """
+    Konversi kolom Rupiah ke numerik dengan perlindungan ketat.
+    Setiap kolom diputuskan sekali (lihat plan_rupiah_conversion) lalu
+    dikonversi dalam satu lintasan vektor.
+    """
+    print("--- Memulai Cek Konversi Data ---")
+
+    if plan is None:
+        plan = plan_rupiah_conversion(df)
+    df = apply_rupiah_plan(df, plan)
+    for col, fmt in plan.items():
+        print(f"✅ Konversi '{col}': {_RUPIAH_FORMAT_LABELS[fmt]}")
+
     print("--- Selesai Cek Konversi ---")
     return df
 
@@ -387,23 +578,33 @@ def generate_template_pendapatan():
 
 
 # --- FUNGSI UNTUK LAPORAN PENDAPATAN (EXCEL) ---
-def generate_laporan_pendapatan_xlsx(df_original, anomali_list, bulan_cols):
+def _ringkasan_pendapatan(df_original, anomali_list, bulan_cols, analisis):
+    """Ambil (statistik, total realisasi anomali, % realisasi anomali) dari hasil analisis bersama."""
+    if analisis is None:
+        statistik = pend_analyzer.hitung_statistik_pendapatan(df_original, bulan_cols)
+        anomalous_total = float(anomali_list['total_realisasi'].sum())
+        total_pendapatan = statistik.get('total_pendapatan', 0)
+        anomalous_pct = (anomalous_total / total_pendapatan * 100) if total_pendapatan > 0 else 0
+        return statistik, anomalous_total, anomalous_pct
+    return analisis['statistik'], analisis['total_anomali'], analisis['pct_realisasi_anomali']
+
+
+def generate_laporan_pendapatan_xlsx(df_original, anomali_list, bulan_cols, analisis=None):
     """
     Generate laporan analisis anomali Pendapatan dalam format Excel.
+    analisis: hasil pend_analyzer.analisis_pendapatan (opsional) agar statistik
+    tidak dihitung ulang.
     """
     from openpyxl import Workbook
     
     buff = BytesIO()
     
-    # Hitung statistik
-    statistik = pend_analyzer.hitung_statistik_pendapatan(df_original, bulan_cols)
+    # Statistik dan total realisasi WP anomali
+    statistik, anomalous_total, anomalous_pct = _ringkasan_pendapatan(
+        df_original, anomali_list, bulan_cols, analisis)
     
     with pd.ExcelWriter(buff, engine='openpyxl') as writer:
         # === SHEET 1: RINGKASAN ===
-        # Hitung total realisasi untuk WP anomali
-        anomalous_total = sum([item.get('total_realisasi', 0) for item in anomali_list]) if anomali_list else 0
-        total_pendapatan = statistik.get('total_pendapatan', 0)
-        anomalous_pct = (anomalous_total / total_pendapatan * 100) if total_pendapatan > 0 else 0
 
         ringkasan_data = {
             'Keterangan': [
@@ -439,25 +640,45 @@ def generate_laporan_pendapatan_xlsx(df_original, anomali_list, bulan_cols):
         df_ringkasan.to_excel(writer, sheet_name='Ringkasan', index=False)
         
         # === SHEET 2: DAFTAR ANOMALI ===
-        if anomali_list:
-            df_anomali = pd.DataFrame(anomali_list)
-            # Rename kolom untuk tampilan yang lebih baik
-            df_anomali = df_anomali.rename(columns={
+        if len(anomali_list):
+            # Tabel anomali dipakai langsung; kode bitmask aturan tidak ditampilkan
+            df_anomali = anomali_list.drop(columns=['kode']).rename(columns={
                 'nomor': 'No',
                 'nama_wp': 'Nama WP',
                 'npwpd': 'NPWPD',
                 'jenis_anomali': 'Jenis Anomali',
+                'skor_risiko': 'Skor Risiko',
                 'bulan_terisi': 'Bulan Terisi',
                 'rata_rata': 'Rata-rata (Rp)',
                 'min': 'Min (Rp)',
                 'max': 'Max (Rp)',
-                'std_dev': 'Std Dev (Rp)'
+                'std_dev': 'Std Dev (Rp)',
+                'total_realisasi': 'Total Realisasi (Rp)'
             })
-            # Jika analyzer mengembalikan total_realisasi, tambahkan kolom untuk ditampilkan
-            if 'total_realisasi' in df_anomali.columns:
-                df_anomali = df_anomali.rename(columns={'total_realisasi': 'Total Realisasi (Rp)'})
             df_anomali.to_excel(writer, sheet_name='Daftar Anomali', index=False)
         
+        # === SHEET 3: KLASTER DERET IDENTIK ANTAR WP ===
+        hasil_klaster = analisis.get('klaster') if analisis else None
+        if hasil_klaster is not None and len(hasil_klaster['ringkasan']):
+            df_klaster = hasil_klaster['ringkasan'].rename(columns={
+                'klaster': 'Klaster',
+                'jumlah_wp': 'Jumlah WP',
+                'bulan_terisi': 'Bulan Terisi',
+                'total_per_wp': 'Total per WP (Rp)',
+                'total_realisasi': 'Total Realisasi (Rp)'
+            })
+            df_klaster.to_excel(writer, sheet_name='Klaster Identik', index=False)
+            # Anggota setiap klaster di bawah tabel ringkasan
+            df_anggota = hasil_klaster['anggota'].rename(columns={
+                'klaster': 'Klaster',
+                'nomor': 'No',
+                'nama_wp': 'Nama WP',
+                'npwpd': 'NPWPD',
+                'total_realisasi': 'Total Realisasi (Rp)'
+            })
+            df_anggota.to_excel(writer, sheet_name='Klaster Identik', index=False,
+                                startrow=len(df_klaster) + 3)
+        
         # === FORMATTING ===
         workbook = writer.book
         
@@ -487,15 +708,25 @@ def generate_laporan_pendapatan_xlsx(df_original, anomali_list, bulan_cols):
             for cell in ws_anomali[1]:
                 cell.fill = fill_header
                 cell.font = font_header
+        
+        # Format Klaster Identik (header ringkasan dan header anggota)
+        if 'Klaster Identik' in workbook.sheetnames:
+            ws_klaster = workbook['Klaster Identik']
+            for row_idx in (1, len(hasil_klaster['ringkasan']) + 4):
+                for cell in ws_klaster[row_idx]:
+                    if cell.value is not None:
+                        cell.fill = fill_header
+                        cell.font = font_header
     
     buff.seek(0)
     return buff
 
 
 # --- FUNGSI UNTUK LAPORAN PENDAPATAN (DOCX) ---
-def generate_laporan_pendapatan_docx(df_original, anomali_list, bulan_cols):
+def generate_laporan_pendapatan_docx(df_original, anomali_list, bulan_cols, analisis=None):
     """
     Generate laporan analisis anomali Pendapatan dalam format Word.
+    analisis: hasil pend_analyzer.analisis_pendapatan (opsional).
     """
     from docx import Document
     from docx.shared import Pt
@@ -514,16 +745,13 @@ def generate_laporan_pendapatan_docx(df_original, anomali_list, bulan_cols):
     p.add_run(pd.Timestamp.now().strftime("%d-%m-%Y %H:%M:%S"))
     
     # Statistik Umum
-    statistik = pend_analyzer.hitung_statistik_pendapatan(df_original, bulan_cols)
+    statistik, anomalous_total, anomalous_pct = _ringkasan_pendapatan(
+        df_original, anomali_list, bulan_cols, analisis)
     
     doc.add_heading('Ringkasan Hasil Analisis', level=2)
     doc.add_paragraph(f"Total WP dalam Populasi: {statistik['total_wp']} WP")
     doc.add_paragraph(f"WP dengan Anomali Terdeteksi: {len(anomali_list)} WP")
     doc.add_paragraph(f"Persentase WP Anomali: {(len(anomali_list) / statistik['total_wp'] * 100):.2f}%")
-    # Hitung total realisasi anomali dan persentasenya
-    anomalous_total = sum([item.get('total_realisasi', 0) for item in anomali_list]) if anomali_list else 0
-    total_pendapatan = statistik.get('total_pendapatan', 0)
-    anomalous_pct = (anomalous_total / total_pendapatan * 100) if total_pendapatan > 0 else 0
     doc.add_paragraph(f"Total Realisasi Anomali: Rp {anomalous_total:,.2f}")
     doc.add_paragraph(f"Persentase Realisasi Anomali: {anomalous_pct:.2f}%")
     
@@ -538,25 +766,33 @@ def generate_laporan_pendapatan_docx(df_original, anomali_list, bulan_cols):
     # Daftar WP dengan Anomali
     doc.add_heading('Daftar WP dengan Anomali', level=2)
     
-    if anomali_list:
+    if len(anomali_list):
         # Buat tabel (tambah kolom Total Realisasi)
-        tbl = doc.add_table(rows=1, cols=6)
+        tbl = doc.add_table(rows=1, cols=7)
         hdr_cells = tbl.rows[0].cells
         hdr_cells[0].text = 'No'
         hdr_cells[1].text = 'Nama WP'
         hdr_cells[2].text = 'NPWPD'
         hdr_cells[3].text = 'Jenis Anomali'
-        hdr_cells[4].text = 'Rata-rata Pendapatan'
-        hdr_cells[5].text = 'Total Realisasi'
-
-        for item in anomali_list[:100]:  # Limit 100 baris untuk dokumen
+        hdr_cells[4].text = 'Skor Risiko'
+        hdr_cells[5].text = 'Rata-rata Pendapatan'
+        hdr_cells[6].text = 'Total Realisasi'
+
+        # Limit 100 baris untuk dokumen; teks kolom diformat sekaligus
+        top = anomali_list.head(100)
+        kolom_teks = [
+            top['nomor'].astype(str),
+            top['nama_wp'].astype(str),
+            top['npwpd'].astype(str),
+            top['jenis_anomali'].astype(str),
+            top['skor_risiko'].map('{:.1f}'.format),
+            'Rp ' + top['rata_rata'].map('{:,.2f}'.format),
+            'Rp ' + top['total_realisasi'].map('{:,.2f}'.format),
+        ]
+        for baris in zip(*kolom_teks):
             row_cells = tbl.add_row().cells
-            row_cells[0].text = str(item.get('nomor', ''))
-            row_cells[1].text = str(item.get('nama_wp', ''))
-            row_cells[2].text = str(item.get('npwpd', ''))
-            row_cells[3].text = str(item.get('jenis_anomali', ''))
-            row_cells[4].text = f"Rp {item.get('rata_rata', 0):,.2f}"
-            row_cells[5].text = f"Rp {item.get('total_realisasi', 0):,.2f}"
+            for cell, teks in zip(row_cells, baris):
+                cell.text = teks
         
         if len(anomali_list) > 100:
             doc.add_paragraph(f"... dan {len(anomali_list) - 100} WP lainnya (lihat laporan Excel untuk lengkapnya)")
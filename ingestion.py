@@ -0,0 +1,983 @@
+"""
+Modul ingestion data populasi.
+- Cache hasil parsing upload berdasarkan hash konten (lintas rerun Streamlit)
+- Cache kolumnar di disk (Arrow IPC) untuk upload ulang file yang sama
+- Pembacaan Excel cepat hanya untuk kolom yang dibutuhkan (proyeksi kolom)
+- Mode hemat memori (string Arrow, kategori, downcast numerik)
+- Penggabungan banyak file / ZIP / sheet secara paralel (process pool)
+- Parquet dengan predicate pushdown, proyeksi kolom dan streaming row group
+- Membaca CSV/Parquet per chunk sehingga memori puncak tetap walaupun file sangat besar
+"""
+
+import io
+import os
+import datetime
+import json
+import zipfile
+import hashlib
+import threading
+import importlib.util
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pandas.io.parsers import TextParser
+
+from calculations import RunningStats
+from pendapatan_analyzer import jalankan_paralel
+from helpers import (detect_csv_delimiter, convert_rupiah_to_numeric,
+                     plan_rupiah_conversion, apply_rupiah_plan)
+
+
+DEFAULT_CHUNKSIZE = 200_000
+
+# Encoding cadangan bila hasil sniffing prefix gagal mendekode sisa file
+# (misal byte cp1252 baru muncul setelah batas prefix)
+CSV_ENCODING_FALLBACK = ('cp1252', 'latin-1')
+
+# Batas total ukuran DataFrame hasil parsing yang disimpan di memori proses
+PARSED_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+FORMAT_LABELS = {'csv': 'CSV', 'parquet': 'Parquet', 'xlsx': 'Excel'}
+
+# Cache disk: hasil parsing CSV/Excel disimpan sebagai Arrow IPC dan dibuka
+# memory-mapped saat file yang sama diupload ulang.
+INGEST_CACHE_DIR = os.environ.get(
+    'INGEST_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ingest_cache'))
+INGEST_CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+INGEST_CACHE_FORMATS = ('csv', 'xlsx')
+# Naikkan bila logika parsing berubah agar cache lama tidak dipakai
+INGEST_CACHE_VERSION = 2
+
+# Cache modul dipakai bersama oleh thread sesi Streamlit; setiap
+# OrderedDict dijaga lock (hanya selama operasi dict, bukan saat parsing)
+_PARSED_CACHE = OrderedDict()
+_parsed_cache_bytes = 0
+_PARSED_CACHE_LOCK = threading.Lock()
+
+# Hash konten per upload (file_id Streamlit) agar rerun tidak menghash ulang
+_HASH_MEMO = OrderedDict()
+_HASH_MEMO_MAX_ENTRIES = 256
+_HASH_MEMO_LOCK = threading.Lock()
+
+
+# --- CACHE HASIL PARSING UPLOAD ---
+
+
+def detect_file_format(filename):
+    """Format file berdasarkan ekstensi: 'csv', 'parquet' atau 'xlsx'."""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith('.parquet'):
+        return 'parquet'
+    return 'xlsx'
+
+
+def content_hash(uploaded_file):
+    """
+    Hash konten file (BLAKE2b). Untuk UploadedFile Streamlit hasilnya
+    diingat per file_id sehingga rerun widget tidak menghash ulang.
+    """
+    memo_key = None
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id is not None:
+        memo_key = (file_id, getattr(uploaded_file, 'size', None))
+        with _HASH_MEMO_LOCK:
+            if memo_key in _HASH_MEMO:
+                return _HASH_MEMO[memo_key]
+
+    hasher = hashlib.blake2b(digest_size=20)
+    if hasattr(uploaded_file, 'getbuffer'):
+        hasher.update(uploaded_file.getbuffer())
+    else:
+        uploaded_file.seek(0)
+        for block in iter(lambda: uploaded_file.read(1 << 20), b''):
+            hasher.update(block)
+        uploaded_file.seek(0)
+    digest = hasher.hexdigest()
+
+    if memo_key is not None:
+        with _HASH_MEMO_LOCK:
+            _HASH_MEMO[memo_key] = digest
+            if len(_HASH_MEMO) > _HASH_MEMO_MAX_ENTRIES:
+                _HASH_MEMO.popitem(last=False)
+    return digest
+
+
+def _parsed_cache_get(key):
+    with _PARSED_CACHE_LOCK:
+        if key not in _PARSED_CACHE:
+            return None
+        _PARSED_CACHE.move_to_end(key)
+        return _PARSED_CACHE[key]
+
+
+def _parsed_cache_put(key, df, info):
+    """Simpan hasil parsing; entri terlama dibuang bila melewati batas byte."""
+    global _parsed_cache_bytes
+
+    nbytes = int(df.memory_usage(deep=True).sum())
+    if nbytes > PARSED_CACHE_MAX_BYTES:
+        return
+    with _PARSED_CACHE_LOCK:
+        if key in _PARSED_CACHE:
+            _parsed_cache_bytes -= _PARSED_CACHE.pop(key)[2]
+
+        _PARSED_CACHE[key] = (df, info, nbytes)
+        _parsed_cache_bytes += nbytes
+        while _parsed_cache_bytes > PARSED_CACHE_MAX_BYTES and _PARSED_CACHE:
+            _, (_, _, old_bytes) = _PARSED_CACHE.popitem(last=False)
+            _parsed_cache_bytes -= old_bytes
+
+
+def _encoding_candidates(encoding):
+    """Encoding hasil sniffing diikuti encoding cadangan (tanpa duplikasi)."""
+    encoding = (encoding or 'utf-8').lower()
+    return [encoding] + [e for e in CSV_ENCODING_FALLBACK if e != encoding]
+
+
+def _read_csv_fallback(buffer, encoding, **kwargs):
+    """
+    pd.read_csv dengan encoding hasil sniffing; bila gagal mendekode,
+    ulangi dengan encoding cadangan. Returns (DataFrame, encoding dipakai).
+    """
+    candidates = _encoding_candidates(encoding)
+    for i, enc in enumerate(candidates):
+        buffer.seek(0)
+        try:
+            return pd.read_csv(buffer, encoding=enc, **kwargs), enc
+        except UnicodeDecodeError:
+            if i == len(candidates) - 1:
+                raise
+
+
+def _parse_upload(uploaded_file, file_format, sniff_csv, convert_rupiah):
+    info = {'format': file_format}
+    uploaded_file.seek(0)
+
+    if file_format == 'csv':
+        if sniff_csv:
+            delimiter, encoding = detect_csv_delimiter(uploaded_file)
+            df, encoding = _read_csv_fallback(uploaded_file, encoding, sep=delimiter)
+            info.update(delimiter=delimiter, encoding=encoding)
+        else:
+            df = pd.read_csv(uploaded_file)
+    elif file_format == 'parquet':
+        df = pd.read_parquet(uploaded_file)
+    else:
+        df = pd.read_excel(uploaded_file)
+
+    if convert_rupiah:
+        try:
+            df = convert_rupiah_to_numeric(df)
+        except Exception:
+            print("⚠️ Gagal menjalankan convert_rupiah_to_numeric; melewatkan konversi.")
+
+    uploaded_file.seek(0)
+    return df, info
+
+
+# --- MODE HEMAT MEMORI ---
+
+# Kolom teks dengan rasio nilai unik <= batas ini dijadikan categorical
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def _downcast_numeric(series):
+    """
+    Downcast integer tanpa kehilangan nilai. Integer tidak diturunkan di
+    bawah int32 agar aritmetika lanjutan tidak mudah overflow. Float tetap
+    float64: pandas menjumlahkan float32 dalam float32 sehingga total nilai
+    buku dan standar deviasi menjadi tidak eksak.
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        info32 = np.iinfo(np.int32)
+        if series.size and series.min() >= info32.min and series.max() <= info32.max:
+            return series.astype(np.int32)
+    return series
+
+
+def compact_dataframe(df, category_max_ratio=CATEGORY_MAX_UNIQUE_RATIO):
+    """
+    Perkecil memori DataFrame populasi:
+    - kolom teks berkardinalitas rendah (SKPD, jenis belanja, rekening) -> category
+    - kolom teks lainnya -> string berbasis Arrow
+    - numerik di-downcast bila aman (lihat _downcast_numeric)
+    Kolom object campuran (angka & teks) tidak diubah.
+
+    Returns:
+        Tuple (DataFrame, bytes_sebelum, bytes_sesudah)
+    """
+    bytes_before = int(df.memory_usage(deep=True).sum())
+    result = {}
+
+    for col in df.columns:
+        series = df[col]
+        try:
+            if series.dtype == 'object':
+                if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+                    result[col] = series
+                    continue
+                n_unique = series.nunique(dropna=True)
+                if len(series) and n_unique / len(series) <= category_max_ratio:
+                    result[col] = series.astype('category')
+                else:
+                    result[col] = series.astype(pd.StringDtype('pyarrow'))
+            elif pd.api.types.is_numeric_dtype(series):
+                result[col] = _downcast_numeric(series)
+            else:
+                result[col] = series
+        except Exception:
+            result[col] = series
+
+    compact = pd.DataFrame(result, index=df.index)
+    compact.columns = df.columns
+    bytes_after = int(compact.memory_usage(deep=True).sum())
+    return compact, bytes_before, bytes_after
+
+
+# --- CACHE KOLUMNAR DI DISK ---
+
+
+def _disk_cache_path(key):
+    name = hashlib.blake2b(repr((INGEST_CACHE_VERSION,) + key).encode(),
+                           digest_size=20).hexdigest()
+    return os.path.join(INGEST_CACHE_DIR, f"{name}.arrow")
+
+
+def _disk_cache_load(key):
+    """
+    Buka hasil parsing dari cache disk secara memory-mapped.
+    Returns (DataFrame, info) atau None bila belum ada / gagal dibaca.
+    """
+    path = _disk_cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata or {}
+        info = json.loads(metadata.get(b'ingest_info', b'{}'))
+        df = table.to_pandas(split_blocks=True)
+        os.utime(path)  # tandai baru dipakai (untuk pemangkasan LRU)
+        return df, info
+    except Exception as e:
+        print(f"⚠️ Cache disk tidak dapat dibaca ({e}); parsing ulang.")
+        return None
+
+
+def _disk_cache_store(key, df, info):
+    """
+    Simpan hasil parsing sebagai Arrow IPC (ditulis ke file sementara lalu
+    di-rename agar atomik). Kolom yang tidak bisa dikonversi ke Arrow
+    (misal object campuran angka/teks) membuat cache dilewati.
+    """
+    try:
+        os.makedirs(INGEST_CACHE_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'ingest_info'] = json.dumps(info).encode()
+        table = table.replace_schema_metadata(metadata)
+
+        path = _disk_cache_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        _prune_disk_cache()
+    except Exception as e:
+        print(f"⚠️ Gagal menyimpan cache disk ({e}); melewatkan.")
+
+
+def _prune_disk_cache():
+    """Buang file cache yang paling lama tidak dipakai bila melewati batas."""
+    entries = []
+    for name in os.listdir(INGEST_CACHE_DIR):
+        if not name.endswith('.arrow'):
+            continue
+        path = os.path.join(INGEST_CACHE_DIR, name)
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= INGEST_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def load_uploaded_dataframe(uploaded_file, sniff_csv=True, convert_rupiah=True,
+                            compact=False, use_cache=True):
+    """
+    Baca file upload (CSV/Parquet/Excel) menjadi DataFrame. Hasil parsing
+    di-cache berdasarkan hash konten + opsi parsing, sehingga perubahan
+    widget (confidence level, teknik, dll) tidak memicu parsing ulang.
+
+    Args:
+        uploaded_file: File upload (UploadedFile Streamlit / file-like)
+        sniff_csv: Deteksi delimiter & encoding CSV otomatis
+        convert_rupiah: Konversi kolom format Rupiah ke numerik
+        compact: Mode hemat memori (lihat compact_dataframe)
+        use_cache: False = hasil tidak disimpan di cache memori proses (cache
+            disk tetap dipakai), untuk pemanggil yang hanya butuh bentuk
+            turunan data (misal panel Pendapatan)
+
+    Returns:
+        Tuple (DataFrame, info). DataFrame adalah salinan dangkal sehingga
+        penambahan kolom (misal 'Strata') tidak mengubah isi cache.
+        info berisi 'format', 'from_cache', 'cache_source' ('memori'/'disk'),
+        (CSV) 'delimiter'/'encoding' dan (compact) 'bytes_before'/'bytes_after'.
+    """
+    file_format = detect_file_format(uploaded_file.name)
+    key = (content_hash(uploaded_file), file_format, sniff_csv, convert_rupiah, compact)
+
+    cached = _parsed_cache_get(key) if use_cache else None
+    if cached is not None:
+        df, info, _ = cached
+        return df.copy(deep=False), dict(info, from_cache=True, cache_source='memori')
+
+    use_disk = file_format in INGEST_CACHE_FORMATS
+    loaded = _disk_cache_load(key) if use_disk else None
+    if loaded is not None:
+        df, info = loaded
+        if use_cache:
+            _parsed_cache_put(key, df, info)
+        return df.copy(deep=False), dict(info, from_cache=True, cache_source='disk')
+
+    df, info = _parse_upload(uploaded_file, file_format, sniff_csv, convert_rupiah)
+    if compact:
+        df, info['bytes_before'], info['bytes_after'] = compact_dataframe(df)
+    if use_cache:
+        _parsed_cache_put(key, df, info)
+    if use_disk:
+        _disk_cache_store(key, df, info)
+    return df.copy(deep=False), dict(info, from_cache=False, cache_source=None)
+
+
+# --- GABUNGAN BANYAK FILE / SHEET ---
+
+SOURCE_FILE_COL = 'Sumber File'
+SOURCE_SHEET_COL = 'Sumber Sheet'
+MULTI_SUPPORTED_FORMATS = ('.csv', '.parquet', '.xlsx')
+
+
+def expand_upload_sources(uploaded_files):
+    """
+    Ubah daftar upload (termasuk arsip .zip) menjadi list (nama, bytes)
+    untuk setiap file data yang didukung.
+    """
+    sources = []
+    for uploaded_file in uploaded_files:
+        name = uploaded_file.name
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(uploaded_file.getvalue())) as archive:
+                for member in archive.infolist():
+                    member_name = member.filename
+                    if member.is_dir() or member_name.startswith('__MACOSX/'):
+                        continue
+                    if member_name.lower().endswith(MULTI_SUPPORTED_FORMATS):
+                        sources.append((member_name, archive.read(member)))
+        else:
+            sources.append((name, uploaded_file.getvalue()))
+    return sources
+
+
+def _parse_source_worker(task):
+    """
+    Worker process pool: parse satu file. Workbook Excel dibaca sekali
+    (seluruh sheet sekaligus bila all_sheets). Konversi Rupiah tidak
+    dilakukan di sini agar diputuskan sekali untuk seluruh sumber.
+    Didefinisikan di level modul agar bisa di-pickle.
+
+    Returns:
+        List (nama_sheet atau None, DataFrame)
+    """
+    name, data, all_sheets = task
+    try:
+        buffer = io.BytesIO(data)
+        buffer.name = name
+        file_format = detect_file_format(name)
+        if file_format == 'csv':
+            delimiter, encoding = detect_csv_delimiter(buffer)
+            df, _ = _read_csv_fallback(buffer, encoding, sep=delimiter)
+        elif file_format == 'parquet':
+            df = pd.read_parquet(buffer)
+        elif all_sheets:
+            return list(pd.read_excel(buffer, sheet_name=None).items())
+        else:
+            df = pd.read_excel(buffer)
+        return [(None, df)]
+    except Exception as e:
+        raise ValueError(f"{name}: {e}") from e
+
+
+def load_multi_population(uploaded_files, all_sheets=True, compact=False,
+                          max_workers=None):
+    """
+    Gabungkan banyak file (atau isi ZIP) dan seluruh sheet Excel menjadi
+    satu populasi. Parsing berjalan paralel di process pool (satu tugas per
+    file); hasil digabung sesuai urutan upload dengan kolom 'Sumber File'
+    (dan 'Sumber Sheet' untuk Excel). Rencana konversi Rupiah disusun sekali
+    dari gabungan kolom teks semua sumber lalu diterapkan ke setiap sumber,
+    sehingga satu kolom tidak numerik di satu sheet dan teks di sheet lain.
+
+    Returns:
+        Tuple (DataFrame, info) dengan info 'n_files', 'n_sources',
+        'n_workers', 'from_cache' dan (compact) 'bytes_before'/'bytes_after'.
+    """
+    file_keys = tuple((f.name, content_hash(f)) for f in uploaded_files)
+    key = (file_keys, 'multi', all_sheets, compact)
+    cached = _parsed_cache_get(key)
+    if cached is not None:
+        df, info, _ = cached
+        return df.copy(deep=False), dict(info, from_cache=True)
+
+    tasks = [(name, data, all_sheets and detect_file_format(name) == 'xlsx')
+             for name, data in expand_upload_sources(uploaded_files)]
+    if not tasks:
+        raise ValueError("Tidak ada file CSV/Excel/Parquet yang dapat dibaca.")
+
+    n_workers = min(len(tasks), max_workers or os.cpu_count() or 1)
+    if n_workers > 1:
+        results = jalankan_paralel(_parse_source_worker, tasks, n_workers)
+    else:
+        results = [_parse_source_worker(task) for task in tasks]
+
+    sources = [(name, sheet, frame) for (name, _, _), sheets in zip(tasks, results)
+               for sheet, frame in sheets]
+    frames = [frame for _, _, frame in sources if not frame.empty]
+    if not frames:
+        raise ValueError("Seluruh file/sheet kosong.")
+    teks = pd.concat([frame.select_dtypes(include='object') for frame in frames], ignore_index=True)
+    plan = plan_rupiah_conversion(teks)
+    del teks
+
+    parts = []
+    for name, sheet, frame in sources:
+        if frame.empty:
+            continue
+        frame = apply_rupiah_plan(frame, plan)
+        frame.insert(0, SOURCE_FILE_COL, name)
+        if sheet is not None:
+            frame.insert(1, SOURCE_SHEET_COL, sheet)
+        parts.append(frame)
+    df = pd.concat(parts, ignore_index=True)
+
+    info = {'format': 'multi', 'n_files': len(uploaded_files),
+            'n_sources': len(sources), 'n_workers': n_workers}
+    if compact:
+        df, info['bytes_before'], info['bytes_after'] = compact_dataframe(df)
+    _parsed_cache_put(key, df, info)
+    return df.copy(deep=False), dict(info, from_cache=False)
+
+
+# --- EXCEL CEPAT DENGAN PROYEKSI KOLOM ---
+
+# Nomor baris sumber di sheet (header di baris 1), dipakai untuk menelusuri
+# sampel ke file asli dan mengambil baris lengkap saat ekspor.
+EXCEL_ROW_COL = 'Baris Excel'
+
+_EXCEL_HEADER_MEMO = OrderedDict()
+_EXCEL_HEADER_MEMO_MAX_ENTRIES = 64
+_EXCEL_HEADER_MEMO_LOCK = threading.Lock()
+
+
+def excel_engine():
+    """Gunakan calamine (Rust) bila terpasang, selain itu openpyxl read-only."""
+    if importlib.util.find_spec('python_calamine') is not None:
+        return 'calamine'
+    return 'openpyxl'
+
+
+def _convert_excel_value(value):
+    """Samakan konversi nilai sel dengan pembaca openpyxl milik pandas."""
+    from openpyxl.cell.cell import ERROR_CODES
+
+    if value is None:
+        return ""
+    if isinstance(value, str) and value in ERROR_CODES:
+        return np.nan
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        as_int = int(value)
+        return as_int if as_int == value else float(value)
+    return value
+
+
+def _convert_calamine_value(value):
+    """Samakan konversi nilai sel dengan pembaca calamine milik pandas."""
+    if isinstance(value, float):
+        as_int = int(value)
+        return as_int if as_int == value else value
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return pd.Timestamp(value)
+    if isinstance(value, datetime.timedelta):
+        return pd.Timedelta(value)
+    return value
+
+
+def _iter_excel_rows(uploaded_file):
+    """
+    Baris sheet pertama mulai dari baris 1 (termasuk baris kosong, sel
+    kosong = "") dengan konversi nilai seperti pd.read_excel. Kedua engine
+    memakai urutan baris yang sama sehingga nomor baris sheet dapat dihitung
+    dari posisi.
+    """
+    uploaded_file.seek(0)
+    if excel_engine() == 'calamine':
+        from python_calamine import CalamineWorkbook
+        sheet = CalamineWorkbook.from_filelike(uploaded_file).get_sheet_by_index(0)
+        for row in sheet.to_python(skip_empty_area=False):
+            yield [_convert_calamine_value(v) for v in row]
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield [_convert_excel_value(v) for v in row]
+    finally:
+        wb.close()
+
+
+def _excel_header_names(header_row):
+    """Nama kolom seperti pd.read_excel (termasuk 'Unnamed: i' & dedup)."""
+    row = list(header_row)
+    while row and row[-1] == "":
+        row.pop()
+    if not row:
+        return []
+    return TextParser([row], header=0).read().columns.tolist()
+
+
+def read_excel_header(uploaded_file):
+    """
+    Baca nama kolom sheet pertama tanpa memuat baris data.
+    Hasil diingat per hash konten file.
+    """
+    key = content_hash(uploaded_file)
+    with _EXCEL_HEADER_MEMO_LOCK:
+        if key in _EXCEL_HEADER_MEMO:
+            return _EXCEL_HEADER_MEMO[key]
+
+    rows = _iter_excel_rows(uploaded_file)
+    try:
+        columns = _excel_header_names(next(rows, ()))
+    finally:
+        rows.close()
+    uploaded_file.seek(0)
+
+    with _EXCEL_HEADER_MEMO_LOCK:
+        _EXCEL_HEADER_MEMO[key] = columns
+        if len(_EXCEL_HEADER_MEMO) > _EXCEL_HEADER_MEMO_MAX_ENTRIES:
+            _EXCEL_HEADER_MEMO.popitem(last=False)
+    return columns
+
+
+def _read_excel_projected(uploaded_file, columns):
+    """
+    Baca sheet pertama baris demi baris; hanya sel pada kolom terpilih yang
+    disimpan sehingga memori tidak bergantung lebar sheet. Nomor baris sheet
+    asli dicatat di kolom 'Baris Excel' (baris kosong di tengah tetap
+    dipertahankan, baris kosong di akhir dibuang seperti pd.read_excel).
+    """
+    rows = _iter_excel_rows(uploaded_file)
+    header = _excel_header_names(next(rows, ()))
+    positions = [header.index(c) for c in columns]
+
+    data = []
+    last_row_with_data = -1
+    for row in rows:
+        projected = [row[i] if i < len(row) else "" for i in positions]
+        # Baris dianggap berisi bila ada sel apa pun (bukan hanya kolom terpilih)
+        if any(v != "" for v in row):
+            last_row_with_data = len(data)
+        data.append(projected)
+
+    data = data[: last_row_with_data + 1]
+    if not data:
+        df = pd.DataFrame(columns=columns)
+    else:
+        df = TextParser(data, header=None, names=columns, skip_blank_lines=False).read()
+    # Header di baris 1, data mulai baris 2
+    df.insert(0, EXCEL_ROW_COL, np.arange(2, len(df) + 2))
+    return df
+
+
+def load_excel_projection(uploaded_file, columns, convert_rupiah=True, compact=False):
+    """
+    Muat hanya kolom tertentu dari sheet pertama file Excel, ditambah kolom
+    'Baris Excel' (nomor baris di sheet). Hasil di-cache seperti
+    load_uploaded_dataframe. Dengan columns=None seluruh kolom dimuat
+    (dipakai saat ekspor).
+    """
+    if columns is None:
+        columns = read_excel_header(uploaded_file)
+    columns = list(dict.fromkeys(columns))
+    key = (content_hash(uploaded_file), 'xlsx-proyeksi', tuple(columns), convert_rupiah, compact)
+
+    cached = _parsed_cache_get(key)
+    if cached is not None:
+        return cached[0].copy(deep=False)
+
+    df = _read_excel_projected(uploaded_file, columns)
+    uploaded_file.seek(0)
+
+    if convert_rupiah:
+        try:
+            df = convert_rupiah_to_numeric(df)
+        except Exception:
+            print("⚠️ Gagal menjalankan convert_rupiah_to_numeric; melewatkan konversi.")
+    if compact:
+        df = compact_dataframe(df)[0]
+
+    _parsed_cache_put(key, df, {'format': 'xlsx'})
+    return df.copy(deep=False)
+
+
+def expand_excel_rows(uploaded_file, sampled_df):
+    """
+    Ambil baris lengkap (semua kolom) untuk sampel hasil mode Excel cepat,
+    berdasarkan kolom 'Baris Excel'. Seluruh sheet baru dimuat di sini.
+    """
+    if sampled_df.empty or EXCEL_ROW_COL not in sampled_df.columns:
+        return sampled_df
+
+    full_df = load_excel_projection(uploaded_file, None)
+    full_df = full_df.set_index(EXCEL_ROW_COL)
+    result = full_df.loc[sampled_df[EXCEL_ROW_COL].to_numpy()].reset_index()
+    if 'Strata' in sampled_df.columns:
+        result['Strata'] = sampled_df['Strata'].to_numpy()
+    return result
+
+
+# --- PARQUET: PREDICATE PUSHDOWN, PROYEKSI & STREAMING ROW GROUP ---
+
+PARQUET_FILTER_OPERATORS = ['==', '!=', '>', '>=', '<', '<=', 'in']
+
+
+def _parquet_fragment(uploaded_file):
+    """
+    Fragment dataset Arrow untuk file Parquet yang diupload. Filter pada
+    fragment memangkas row group berdasarkan statistik min/max sehingga
+    row group yang tidak relevan tidak dibaca sama sekali.
+    """
+    return ds.ParquetFileFormat().make_fragment(pa.BufferReader(pa.py_buffer(uploaded_file.getbuffer())))
+
+
+def read_parquet_schema(uploaded_file):
+    """
+    Skema kolom Parquet (tanpa membaca data).
+    Returns dict {nama_kolom: tipe Arrow}; kolom index pandas diabaikan.
+    """
+    schema = _parquet_fragment(uploaded_file).physical_schema
+    return {field.name: field.type for field in schema
+            if not field.name.startswith('__index_level_')}
+
+
+def _coerce_filter_value(arrow_type, text):
+    text = str(text).strip()
+    if pa.types.is_integer(arrow_type):
+        try:
+            return int(text)
+        except ValueError:
+            value = float(text)
+        # Nilai pecahan ditolak, bukan dipotong (filter 1.5 tidak sama dengan 1)
+        if not value.is_integer():
+            raise ValueError(f"'{text}' bukan bilangan bulat")
+        return int(value)
+    if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return float(text)
+    if pa.types.is_boolean(arrow_type):
+        return text.lower() in ('1', 'true', 'ya', 'y')
+    if pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type):
+        value = pd.Timestamp(text)
+        return value.date() if pa.types.is_date(arrow_type) else value
+    return text
+
+
+def build_parquet_filters(filter_rows, schema):
+    """
+    Ubah input filter [(kolom, operator, teks_nilai), ...] menjadi filter
+    format pyarrow dengan nilai yang dikonversi sesuai tipe kolom.
+    Operator 'in' menerima daftar nilai dipisah koma. Baris tidak lengkap
+    diabaikan; semua filter digabung dengan AND.
+    """
+    filters = []
+    for col, op, text in filter_rows:
+        if not col or col not in schema or op not in PARQUET_FILTER_OPERATORS:
+            continue
+        if text is None or str(text).strip() == '':
+            continue
+        if op == 'in':
+            values = [_coerce_filter_value(schema[col], v) for v in str(text).split(',') if v.strip()]
+            filters.append((col, 'in', values))
+        else:
+            filters.append((col, op, _coerce_filter_value(schema[col], text)))
+    return filters
+
+
+def _parquet_scanner(uploaded_file, columns=None, filters=None,
+                     batch_size=DEFAULT_CHUNKSIZE):
+    fragment = _parquet_fragment(uploaded_file)
+    expression = pq.filters_to_expression(filters) if filters else None
+    if columns is None:
+        columns = list(read_parquet_schema(uploaded_file))
+    scanner = fragment.scanner(columns=list(columns), filter=expression, batch_size=batch_size)
+    if expression is not None:
+        row_groups_read = fragment.subset(expression).num_row_groups
+    else:
+        row_groups_read = fragment.num_row_groups
+    return scanner, row_groups_read, fragment.num_row_groups
+
+
+def load_parquet_filtered(uploaded_file, columns=None, filters=None,
+                          convert_rupiah=True, compact=False, use_cache=True):
+    """
+    Baca Parquet hanya untuk kolom dan baris yang dibutuhkan (filter
+    didorong ke pembaca sehingga row group yang tidak cocok dilewati).
+    Hasil di-cache seperti load_uploaded_dataframe (use_cache sama).
+
+    Args:
+        columns: Daftar kolom yang dibaca (None = semua)
+        filters: Filter format pyarrow, misal [('TAHUN', '==', 2024), ('NILAI', '>', 0)]
+
+    Returns:
+        Tuple (DataFrame, info) dengan info 'row_groups_read'/'row_groups_total'.
+    """
+    key = (content_hash(uploaded_file), 'parquet-dataset',
+           tuple(columns) if columns is not None else None,
+           repr(filters or []), convert_rupiah, compact)
+    cached = _parsed_cache_get(key) if use_cache else None
+    if cached is not None:
+        df, info, _ = cached
+        return df.copy(deep=False), dict(info, from_cache=True, cache_source='memori')
+
+    scanner, row_groups_read, row_groups_total = _parquet_scanner(uploaded_file, columns, filters)
+    table = scanner.to_table()
+    # Metadata index pandas tidak berlaku lagi setelah baris difilter
+    df = table.replace_schema_metadata(None).to_pandas()
+
+    info = {'format': 'parquet', 'row_groups_read': row_groups_read,
+            'row_groups_total': row_groups_total}
+    if convert_rupiah:
+        try:
+            df = convert_rupiah_to_numeric(df)
+        except Exception:
+            print("⚠️ Gagal menjalankan convert_rupiah_to_numeric; melewatkan konversi.")
+    if compact:
+        df, info['bytes_before'], info['bytes_after'] = compact_dataframe(df)
+
+    if use_cache:
+        _parsed_cache_put(key, df, info)
+    return df.copy(deep=False), dict(info, from_cache=False, cache_source=None)
+
+
+def _konversi_chunk(chunk, plan, diputuskan):
+    """
+    Terapkan konversi format Rupiah ke satu chunk. Kolom teks yang belum
+    punya contoh nilai di chunk sebelumnya (kosong, atau numerik lalu berubah
+    menjadi teks) direncanakan dari chunk ini; plan dan diputuskan
+    diperbarui di tempat.
+    """
+    baru = [col for col in chunk.columns
+            if col not in diputuskan and chunk[col].dtype == 'object' and chunk[col].notna().any()]
+    if baru:
+        plan.update(plan_rupiah_conversion(chunk[baru]))
+        diputuskan.update(baru)
+    return apply_rupiah_plan(chunk, plan)
+
+
+def iter_parquet_chunks(uploaded_file, columns=None, filters=None,
+                        batch_size=DEFAULT_CHUNKSIZE):
+    """
+    Generator chunk DataFrame dari Parquet (per batch row group) dengan
+    filter dan proyeksi kolom. Index chunk melanjutkan nomor baris hasil
+    filter, sama seperti iter_csv_chunks.
+    """
+    scanner, _, _ = _parquet_scanner(uploaded_file, columns, filters, batch_size)
+    plan, diputuskan = {}, set()
+    offset = 0
+    for batch in scanner.to_batches():
+        if batch.num_rows == 0:
+            continue
+        chunk = batch.to_pandas()
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield _konversi_chunk(chunk, plan, diputuskan)
+
+
+# --- STREAMING PER CHUNK (CSV / PARQUET) ---
+
+
+def read_csv_header(uploaded_file, delimiter, encoding):
+    """
+    Baca nama kolom CSV saja (tanpa memuat baris data).
+    """
+    header, _ = _read_csv_fallback(uploaded_file, encoding, sep=delimiter, nrows=0)
+    uploaded_file.seek(0)
+    return header.columns.tolist()
+
+
+def _to_numeric_chunk(chunk, value_col):
+    """
+    Konversi kolom nilai pada satu chunk ke numerik.
+    """
+    if value_col in chunk.columns and not pd.api.types.is_numeric_dtype(chunk[value_col]):
+        chunk[value_col] = pd.to_numeric(chunk[value_col], errors='coerce')
+    return chunk
+
+
+def iter_csv_chunks(uploaded_file, delimiter, encoding, usecols=None,
+                    chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Generator chunk DataFrame dari CSV. Setiap chunk sudah melalui
+    konversi format Rupiah; rencana tiap kolom diputuskan dari chunk
+    pertama yang memuat nilainya (lihat _konversi_chunk) lalu dipakai untuk
+    chunk berikutnya. Index chunk melanjutkan nomor baris file. Bila encoding gagal mendekode di tengah file, pembacaan
+    dilanjutkan dari baris berikutnya dengan encoding cadangan.
+    """
+    plan, diputuskan = {}, set()
+    n_yielded = 0
+    candidates = _encoding_candidates(encoding)
+    try:
+        for i, enc in enumerate(candidates):
+            offset = n_yielded
+            uploaded_file.seek(0)
+            reader = pd.read_csv(uploaded_file, sep=delimiter, encoding=enc, usecols=usecols,
+                                 chunksize=chunksize,
+                                 skiprows=range(1, offset + 1) if offset else None)
+            try:
+                with reader:
+                    for chunk in reader:
+                        if offset:
+                            chunk.index += offset
+                        n_yielded += len(chunk)
+                        yield _konversi_chunk(chunk, plan, diputuskan)
+                return
+            except UnicodeDecodeError:
+                if i == len(candidates) - 1:
+                    raise
+    finally:
+        uploaded_file.seek(0)
+
+
+def stream_statistics(chunks, value_col):
+    """
+    Hitung total nilai buku, jumlah baris, dan varians kolom nilai dari
+    iterator chunk (CSV atau Parquet) tanpa menyimpan seluruh nilai.
+
+    Returns:
+        Dict berisi 'n_rows', 'stats' (RunningStats), 'total_positive'
+        (total nilai positif, dipakai sebagai bobot PPS) dan 'n_kosong'
+        (baris dengan nilai kosong atau tidak valid).
+    """
+    n_rows = 0
+    n_kosong = 0
+    total_positive = 0.0
+    stats = RunningStats()
+
+    for chunk in chunks:
+        chunk = _to_numeric_chunk(chunk, value_col)
+        values = chunk[value_col].to_numpy(dtype=float, na_value=np.nan)
+        n_rows += len(values)
+        n_kosong += int(np.isnan(values).sum())
+        stats.update(values)
+        total_positive += float(np.clip(np.nan_to_num(values), 0, None).sum())
+
+    return {
+        'n_rows': n_rows,
+        'stats': stats,
+        'total_positive': total_positive,
+        'n_kosong': n_kosong,
+    }
+
+
+def select_positions_from_chunks(chunks, positions, value_col=None):
+    """
+    Ambil baris pada posisi tertentu (0-based) dengan satu lintasan streaming.
+    Hanya baris terpilih yang disimpan di memori.
+    """
+    positions = np.unique(np.asarray(positions, dtype=np.int64))
+    parts = []
+
+    for chunk in chunks:
+        start = chunk.index[0] if len(chunk) else 0
+        stop = start + len(chunk)
+        lo, hi = np.searchsorted(positions, [start, stop])
+        if hi > lo:
+            parts.append(chunk.iloc[positions[lo:hi] - start])
+        if hi >= len(positions):
+            break
+
+    if not parts:
+        return pd.DataFrame()
+    result = pd.concat(parts)
+    if value_col is not None:
+        result = _to_numeric_chunk(result, value_col)
+    return result
+
+
+def select_pps_from_chunks(chunks, value_col, n, total_positive, random_state=42):
+    """
+    PPS (Monetary Unit) secara streaming: n unit moneter acak dipilih pada
+    rentang [0, total_positive), lalu baris yang memuat unit tersebut diambil
+    sambil membaca kumulatif nilai per chunk. Item bernilai besar yang terkena
+    lebih dari satu unit hanya diambil sekali.
+    """
+    if n <= 0 or total_positive <= 0:
+        return pd.DataFrame()
+
+    rng = np.random.default_rng(random_state)
+    units = np.sort(rng.uniform(0, total_positive, size=n))
+    parts = []
+    offset = 0.0
+
+    for chunk in chunks:
+        chunk = _to_numeric_chunk(chunk, value_col)
+        weights = np.clip(np.nan_to_num(chunk[value_col].to_numpy(dtype=float, na_value=np.nan)), 0, None)
+        cumsum = offset + np.cumsum(weights)
+        chunk_end = cumsum[-1] if len(cumsum) else offset
+
+        lo, hi = np.searchsorted(units, [offset, chunk_end], side='left')
+        if hi > lo:
+            hit_rows = np.unique(np.searchsorted(cumsum, units[lo:hi], side='right'))
+            hit_rows = hit_rows[hit_rows < len(chunk)]
+            parts.append(chunk.iloc[hit_rows])
+
+        offset = chunk_end
+        if offset >= units[-1]:
+            break
+
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts)
+
+
+def random_positions(n_rows, n, random_state=42):
+    """Posisi baris untuk Acak Sederhana (tanpa pengembalian)."""
+    n = min(n, n_rows)
+    rng = np.random.default_rng(random_state)
+    return np.sort(rng.choice(n_rows, size=n, replace=False))
+
+
+def systematic_positions(n_rows, n):
+    """Posisi baris untuk Sistematis (Interval), setara select_systematic."""
+    if n <= 0:
+        return np.array([], dtype=np.int64)
+    if n >= n_rows:
+        return np.arange(n_rows)
+    interval = n_rows // n
+    start = np.random.randint(0, interval + 1)
+    return np.arange(start, n_rows, interval)[:n]
@@ -1,136 +1,1001 @@
 """
 Modul untuk analisis anomali data pendapatan WP.
-Mendeteksi pelaporan identik dan variasi rendah (<=5%) antar bulan.
+Mendeteksi pelaporan identik dan variasi rendah (default <=5%) antar bulan,
+serta aturan opsional: bulan kosong, penurunan tajam, lonjakan dan CV rendah.
 """
 
+import os
+import sys
+import copy
+import types
+import hashlib
+import threading
+import contextlib
+import multiprocessing
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+from calculations import RunningStats, QuantileSketch
+from pendapatan_panel import PanelPendapatan
+
+# Mode shard hanya dipakai untuk register besar; di bawah ini overhead proses lebih mahal
+SHARD_MIN_ROWS = 200_000
+SHARD_ROWS = 100_000
+
+# Cache hasil analisis per (hash data, kolom bulan) agar dashboard dan kedua
+# laporan memakai satu hasil yang sama
+ANALISIS_CACHE_MAX_ENTRIES = 8
+_ANALISIS_CACHE = OrderedDict()
+# Sesi Streamlit berjalan di thread terpisah; OrderedDict dijaga lock
+_ANALISIS_CACHE_LOCK = threading.Lock()
+
+KOLOM_IDENTITAS = ['NOMOR', 'NAMA WP', 'NPWPD']
+
+# Aturan anomali beserta ambang default. Hanya dua aturan pertama yang aktif
+# secara default (perilaku analisis semula); sisanya dapat diaktifkan dari UI.
+#   identik         : semua bulan terisi bernilai sama
+#   variasi_rendah  : perubahan antar bulan terisi berurutan <= threshold (rasio)
+#   bulan_kosong    : jumlah bulan bernilai 0/kosong >= threshold (bulan)
+#   penurunan_tajam : penurunan antar bulan terisi berurutan >= threshold (rasio)
+#   lonjakan        : kenaikan antar bulan terisi berurutan >= threshold (rasio)
+#   cv_rendah       : koefisien variasi (std/|rata-rata|) <= threshold, min 3 bulan
+ATURAN_DEFAULT = {
+    'identik': {'aktif': True, 'threshold': None},
+    'variasi_rendah': {'aktif': True, 'threshold': 0.05},
+    'bulan_kosong': {'aktif': False, 'threshold': 12},
+    'penurunan_tajam': {'aktif': False, 'threshold': 0.5},
+    'lonjakan': {'aktif': False, 'threshold': 1.0},
+    'cv_rendah': {'aktif': False, 'threshold': 0.02},
+}
+
+# Deteksi klaster: banyak WP berbeda melaporkan deret bulanan yang sama persis.
+#   min_anggota : ukuran klaster minimal yang dilaporkan
+#   min_bulan   : minimal bulan terisi agar deret WP diikutkan (WP nihil diabaikan)
+#   pembulatan  : digit desimal untuk np.round sebelum di-hash (-3 = ribuan),
+#                 None berarti tanpa pembulatan
+KLASTER_DEFAULT = {'aktif': True, 'min_anggota': 3, 'min_bulan': 2, 'pembulatan': None}
+
+_HASH_PRIME = np.uint64(1099511628211)
+
+# Bobot risiko per aturan untuk skor_risiko (noisy-or atas aturan yang terpicu)
+BOBOT_RISIKO = {
+    'identik': 0.9,
+    'variasi_rendah': 0.7,
+    'bulan_kosong': 0.4,
+    'penurunan_tajam': 0.6,
+    'lonjakan': 0.5,
+    'cv_rendah': 0.6,
+}
+
+# Skema tabel hasil anomali (satu baris per WP beranomali)
+KOLOM_ANOMALI = {
+    'nomor': object,
+    'nama_wp': object,
+    'npwpd': object,
+    'jenis_anomali': object,
+    'skor_risiko': np.float64,
+    'kode': np.int64,
+    'bulan_terisi': np.int64,
+    'rata_rata': np.float64,
+    'min': np.float64,
+    'max': np.float64,
+    'std_dev': np.float64,
+    'total_realisasi': np.float64,
+}
+
+# Bit per aturan pada kode anomali (bitmask) setiap WP
+ATURAN_BIT = {kode: 1 << i for i, kode in enumerate(ATURAN_DEFAULT)}
+
+ATURAN_LABEL = {
+    'identik': 'Pelaporan Identik',
+    'variasi_rendah': 'Variasi Rendah',
+    'bulan_kosong': 'Bulan Kosong',
+    'penurunan_tajam': 'Penurunan Tajam',
+    'lonjakan': 'Lonjakan',
+    'cv_rendah': 'CV Rendah',
+}
+
+
+def susun_aturan(aturan=None):
+    """Gabungkan pengaturan aturan dengan ATURAN_DEFAULT."""
+    hasil = {kode: dict(cfg) for kode, cfg in ATURAN_DEFAULT.items()}
+    for kode, cfg in (aturan or {}).items():
+        if kode not in hasil:
+            raise ValueError(f"Aturan anomali tidak dikenal: {kode}")
+        hasil[kode].update(cfg)
+    return hasil
+
+
+def build_bulan_matrix(df, bulan_cols):
+    """
+    Susun matriks WP x bulan (float64) beserta mask nilai terisi (bukan NaN
+    dan bukan 0). Kolom bulan yang tidak ada dianggap 0. df dapat berupa
+    DataFrame wide atau PanelPendapatan.
+    
+    Returns:
+        Tuple (values, terisi) - values dengan NaN diganti 0
+    """
+    if isinstance(df, PanelPendapatan):
+        return df.matrix(bulan_cols)
+    n = len(df)
+    values = np.zeros((n, len(bulan_cols)), dtype=np.float64)
+    terisi = np.zeros((n, len(bulan_cols)), dtype=bool)
+    for j, col in enumerate(bulan_cols):
+        if col not in df.columns:
+            continue
+        series = df[col]
+        # Konversi gagal (teks non-angka) tetap memunculkan ValueError seperti float(val)
+        col_vals = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        notna = ~np.isnan(col_vals)
+        values[:, j] = np.where(notna, col_vals, 0.0)
+        terisi[:, j] = notna & (series != 0).to_numpy(dtype=bool)
+    return values, terisi
+
+
+def _compact_terisi(values, terisi):
+    """Geser nilai terisi ke kiri dengan urutan bulan tetap; kembalikan (matriks, jumlah terisi)."""
+    order = np.argsort(~terisi, axis=1, kind='stable')
+    return np.take_along_axis(values, order, axis=1), terisi.sum(axis=1)
+
+
+def _row_stats(compact, counts, rows):
+    """Rata-rata, min, max dan std (ddof 0) per baris atas k nilai terisi pertama."""
+    stats = {key: np.zeros(len(rows)) for key in ('rata_rata', 'min', 'max', 'std_dev')}
+    row_counts = counts[rows]
+    # Dikelompokkan per jumlah bulan terisi agar hasil np.mean/np.std sama persis
+    # dengan perhitungan per baris
+    for k in np.unique(row_counts):
+        if k == 0:
+            continue
+        pos = np.flatnonzero(row_counts == k)
+        sub = compact[rows[pos], :k]
+        stats['rata_rata'][pos] = np.mean(sub, axis=1)
+        stats['min'][pos] = np.min(sub, axis=1)
+        stats['max'][pos] = np.max(sub, axis=1)
+        if k > 1:
+            stats['std_dev'][pos] = np.std(sub, axis=1)
+    return stats
+
+
+def _first_pair(hit, metric):
+    """Nilai metrik pada pasangan pertama yang memenuhi (NaN jika tidak ada)."""
+    ada = hit.any(axis=1)
+    first = hit.argmax(axis=1)
+    out = np.full(hit.shape[0], np.nan)
+    out[ada] = metric[ada, first[ada]]
+    return out
+
+
+def analyze_bulan_matrix(values, terisi, aturan=None):
+    """
+    Evaluasi semua aturan anomali aktif pada matriks WP x bulan dalam satu
+    lintasan vektor.
+    
+    Returns:
+        Dict array per WP: kode (bitmask aturan yang terpenuhi), metrik tiap
+        aturan (variasi_pct, bulan_kosong, penurunan_pct, lonjakan_pct, cv),
+        anomali, bulan_terisi, total_realisasi, serta matriks terisi yang sudah
+        dirapatkan ke kiri (compact)
+    """
+    aturan = susun_aturan(aturan)
+    n, m = values.shape
+    compact, counts = _compact_terisi(values, terisi)
+    col_idx = np.arange(m)
+    in_range = col_idx[None, :] < counts[:, None]
+    kode = np.zeros(n, dtype=np.int64)
+
+    # Aturan identik: semua nilai terisi sama
+    sama = (compact == compact[:, :1]) | ~in_range
+    identik = (counts >= 2) & sama.all(axis=1)
+    if aturan['identik']['aktif']:
+        kode[identik] |= ATURAN_BIT['identik']
+
+    # Perubahan relatif antar pasangan bulan terisi berurutan (pembagi bertanda
+    # seperti perhitungan semula)
+    if m > 1:
+        prev = compact[:, :-1]
+        curr = compact[:, 1:]
+        pair_valid = in_range[:, 1:] & (prev != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel = (curr - prev) / prev
+            perubahan = np.abs(curr - prev) / prev
+
+    metrics = {
+        'variasi_pct': np.full(n, np.nan),
+        'bulan_kosong': m - counts,
+        'penurunan_pct': np.full(n, np.nan),
+        'lonjakan_pct': np.full(n, np.nan),
+        'cv': np.full(n, np.nan),
+    }
+
+    cfg = aturan['variasi_rendah']
+    if cfg['aktif'] and m > 1:
+        # Pasangan pertama dengan perubahan <= threshold; WP identik tidak dihitung
+        hit = pair_valid & (perubahan <= cfg['threshold'])
+        hit &= ~identik[:, None]
+        metrics['variasi_pct'] = _first_pair(hit, perubahan)
+        kode[~np.isnan(metrics['variasi_pct'])] |= ATURAN_BIT['variasi_rendah']
+
+    cfg = aturan['bulan_kosong']
+    if cfg['aktif']:
+        kode[metrics['bulan_kosong'] >= min(cfg['threshold'], m)] |= ATURAN_BIT['bulan_kosong']
+
+    cfg = aturan['penurunan_tajam']
+    if cfg['aktif'] and m > 1:
+        # Penurunan terbesar antar bulan terisi dengan basis positif
+        terbesar = np.where(pair_valid & (prev > 0), -rel, -np.inf).max(axis=1)
+        flag = terbesar >= cfg['threshold']
+        metrics['penurunan_pct'][flag] = terbesar[flag]
+        kode[flag] |= ATURAN_BIT['penurunan_tajam']
+
+    cfg = aturan['lonjakan']
+    if cfg['aktif'] and m > 1:
+        terbesar = np.where(pair_valid & (prev > 0), rel, -np.inf).max(axis=1)
+        flag = terbesar >= cfg['threshold']
+        metrics['lonjakan_pct'][flag] = terbesar[flag]
+        kode[flag] |= ATURAN_BIT['lonjakan']
+
+    cfg = aturan['cv_rendah']
+    if cfg['aktif']:
+        # Momen atas nilai terisi saja (nilai di luar rentang dibuat 0)
+        isi = np.where(in_range, compact, 0.0)
+        k = np.maximum(counts, 1)
+        mean = isi.sum(axis=1) / k
+        var = (np.where(in_range, compact - mean[:, None], 0.0) ** 2).sum(axis=1) / k
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cv = np.sqrt(var) / np.abs(mean)
+        flag = (counts >= 3) & ~identik & (cv <= cfg['threshold'])
+        metrics['cv'][flag] = cv[flag]
+        kode[flag] |= ATURAN_BIT['cv_rendah']
+
+    # Total realisasi dijumlahkan berurutan per bulan (sama dengan penjumlahan per baris)
+    total = np.zeros(n)
+    for j in range(m):
+        total += values[:, j]
+
+    hasil = {
+        'kode': kode,
+        'anomali': kode != 0,
+        'bulan_terisi': counts,
+        'total_realisasi': total,
+        'compact': compact,
+    }
+    hasil.update(metrics)
+    return hasil
+
+
+def _gabung_teks(hasil, aktif, teks):
+    """Tambahkan teks ke hasil (array object) pada baris aktif, dipisah ' | '."""
+    pemisah = np.where(hasil != '', ' | ', '')
+    return np.where(aktif, hasil + pemisah + teks, hasil)
+
 
+def jenis_anomali_text(kode, metrik, n_bulan):
+    """
+    Teks jenis anomali per WP (array object) dari bitmask dan array metrik
+    aturannya; angka hanya diformat untuk baris yang aturannya terpicu.
+    """
+    kode = np.asarray(kode)
+    hasil = np.full(len(kode), '', dtype=object)
 
-def detect_anomali_pendapatan(df, bulan_cols):
+    def _pct(key, aktif):
+        teks = np.full(len(kode), '', dtype=object)
+        teks[aktif] = np.char.mod('%.2f', np.asarray(metrik[key])[aktif] * 100).astype(object)
+        return teks
+
+    for aturan_kode, key, awalan, akhiran in (
+        ('identik', None, "Pelaporan Identik (0.00%)", ''),
+        ('variasi_rendah', 'variasi_pct', "Variasi Rendah: ", '%'),
+        ('bulan_kosong', 'bulan_kosong', "Bulan Kosong: ", f" dari {n_bulan} bulan"),
+        ('penurunan_tajam', 'penurunan_pct', "Penurunan Tajam: ", '%'),
+        ('lonjakan', 'lonjakan_pct', "Lonjakan: +", '%'),
+        ('cv_rendah', 'cv', "CV Rendah: ", '%'),
+    ):
+        aktif = (kode & ATURAN_BIT[aturan_kode]) != 0
+        if not aktif.any():
+            continue
+        if key is None:
+            teks = awalan
+        elif key == 'bulan_kosong':
+            teks = awalan + np.asarray(metrik[key]).astype(np.int64).astype(str).astype(object) + akhiran
+        else:
+            teks = awalan + _pct(key, aktif) + akhiran
+        hasil = _gabung_teks(hasil, aktif, teks)
+    return hasil
+
+
+def skor_risiko(kode):
+    """
+    Skor risiko 0-100 per WP dari aturan yang terpicu, digabung secara
+    noisy-or: 100 * (1 - prod(1 - bobot aturan)).
+    """
+    kode = np.asarray(kode)
+    lolos = np.ones(len(kode))
+    for aturan_kode, bobot in BOBOT_RISIKO.items():
+        lolos *= np.where(kode & ATURAN_BIT[aturan_kode], 1.0 - bobot, 1.0)
+    return np.round(100.0 * (1.0 - lolos), 1)
+
+
+KOLOM_METRIK_ATURAN = ('kode', 'variasi_pct', 'bulan_kosong', 'penurunan_pct', 'lonjakan_pct', 'cv')
+
+
+def _anomali_fields(values, terisi, aturan=None, offset=0):
+    """Ringkas hasil analyze_bulan_matrix menjadi array kolom untuk WP beranomali saja."""
+    hasil = analyze_bulan_matrix(values, terisi, aturan)
+    rows = np.flatnonzero(hasil['anomali'])
+    fields = _row_stats(hasil['compact'], hasil['bulan_terisi'], rows)
+    fields['rows'] = rows + offset
+    for key in KOLOM_METRIK_ATURAN + ('bulan_terisi', 'total_realisasi'):
+        fields[key] = hasil[key][rows]
+    return fields
+
+
+def ambil_identitas(df, rows):
+    """
+    Nomor, nama WP dan NPWPD untuk baris pada posisi rows (DataFrame atau
+    PanelPendapatan). Tanpa kolom NOMOR, nomor = index + 1.
+
+    Returns:
+        Tuple list (nomor, nama_wp, npwpd)
+    """
+    def _kolom(col, default):
+        if col not in df.columns:
+            return [default] * len(rows)
+        if isinstance(df, PanelPendapatan):
+            return df.kolom(col, rows)
+        return df[col].to_numpy(dtype=object)[rows].tolist()
+
+    nomor = (_kolom('NOMOR', None) if 'NOMOR' in df.columns
+             else [idx + 1 for idx in df.index[rows].tolist()])
+    return nomor, _kolom('NAMA WP', ''), _kolom('NPWPD', '')
+
+
+def tabel_anomali_kosong():
+    """Tabel anomali tanpa baris dengan skema KOLOM_ANOMALI."""
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in KOLOM_ANOMALI.items()})
+
+
+def _susun_hasil(df, fields, n_bulan):
+    """Bentuk tabel kolom hasil anomali (DataFrame berskema KOLOM_ANOMALI)."""
+    rows = fields['rows']
+    if len(rows) == 0:
+        return tabel_anomali_kosong()
+
+    nomor, nama_wp, npwpd = ambil_identitas(df, rows)
+    kode = fields['kode'].astype(np.int64)
+    kolom = {
+        'nomor': np.asarray(nomor, dtype=object),
+        'nama_wp': np.asarray(nama_wp, dtype=object),
+        'npwpd': np.asarray(npwpd, dtype=object),
+        'jenis_anomali': jenis_anomali_text(kode, fields, n_bulan),
+        'skor_risiko': skor_risiko(kode),
+        'kode': kode,
+        'bulan_terisi': fields['bulan_terisi'],
+        'rata_rata': fields['rata_rata'],
+        'min': fields['min'],
+        'max': fields['max'],
+        'std_dev': fields['std_dev'],
+        'total_realisasi': fields['total_realisasi'],
+    }
+    return pd.DataFrame({col: np.asarray(kolom[col]).astype(dtype, copy=False)
+                         for col, dtype in KOLOM_ANOMALI.items()})
+
+
+def detect_anomali_pendapatan(df, bulan_cols, aturan=None, matriks=None):
     """
     Deteksi anomali pada data pendapatan WP.
     
-    Kriteria:
+    Kriteria default:
     1. Pelaporan Identik: Nilai sama setiap bulan
-    2. Variasi Rendah: Perubahan antar bulan <= 10%
+    2. Variasi Rendah: Perubahan antar bulan terisi berurutan <= 5%
+    Aturan lain dan ambangnya diatur lewat `aturan` (lihat ATURAN_DEFAULT).
     
     Args:
         df: DataFrame dengan data WP
         bulan_cols: List kolom bulan yang akan dianalisis
+        aturan: Dict pengaturan aturan, misal {'variasi_rendah': {'threshold': 0.1}}
+        matriks: Tuple (values, terisi) hasil build_bulan_matrix bila sudah ada
         
     Returns:
-        List berisi dict dengan informasi anomali setiap WP
-    """
-    results = []
-
-    for index, row in df.iterrows():
-        # Ambil nilai bulan yang ada (anggap NaN sebagai 0 untuk total)
-        vals = []
-        for col in bulan_cols:
-            val = row.get(col, 0)
-            if pd.isna(val):
-                continue
-            # Keep zeros for total calculation but skip zeros for variation checks
-            vals.append(float(val))
-
-        # Skip jika data kurang dari 2 bulan non-NaN
-        non_na_vals = [v for v in vals if v != None]
-        if len(non_na_vals) < 2:
-            continue
+        DataFrame satu baris per WP beranomali (kolom KOLOM_ANOMALI, termasuk
+        skor_risiko), urut sesuai data asal
+    """
+    values, terisi = matriks if matriks is not None else build_bulan_matrix(df, bulan_cols)
+    return _susun_hasil(df, _anomali_fields(values, terisi, aturan), len(bulan_cols))
+
+
+def _analyze_shard_worker(task):
+    """Worker proses: baca potongan matriks dari shared memory lalu analisis."""
+    values_name, terisi_name, shape, start, stop, aturan = task
+    shm_values = shared_memory.SharedMemory(name=values_name)
+    shm_terisi = shared_memory.SharedMemory(name=terisi_name)
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=shm_values.buf)
+        terisi = np.ndarray(shape, dtype=bool, buffer=shm_terisi.buf)
+        fields = _anomali_fields(values[start:stop], terisi[start:stop], aturan, offset=start)
+        # Lepaskan view sebelum shared memory ditutup
+        del values, terisi
+        return fields
+    finally:
+        shm_values.close()
+        shm_terisi.close()
+
+
+def _to_shared(array):
+    """Salin array ke blok shared memory baru; kembalikan (shm, view)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[:] = array
+    return shm, view
+
+
+# Worker dibuat dengan start method spawn: proses server Streamlit
+# multi-thread tidak aman di-fork (lock milik thread lain ikut tersalin).
+_MAIN_SWAP_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def _tanpa_skrip_main():
+    """
+    Streamlit memasang skrip app sebagai __main__ (dengan __file__), sehingga
+    worker spawn akan menjalankan ulang seluruh UI sebagai __mp_main__.
+    Selama worker dibuat, __main__ diganti modul kosong; worker cukup
+    mengimpor modul tempat fungsi worker didefinisikan.
+    """
+    with _MAIN_SWAP_LOCK:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+
+def jalankan_paralel(fungsi, tasks, max_workers, progress_callback=None):
+    """
+    Jalankan fungsi (level modul, bisa di-pickle) untuk setiap task di
+    process pool spawn.
+
+    Returns:
+        List hasil sesuai urutan tasks
+    """
+    hasil = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        # Worker spawn dibuat saat submit; semua submit dilakukan di sini
+        with _tanpa_skrip_main():
+            futures = {executor.submit(fungsi, task): i for i, task in enumerate(tasks)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            hasil[futures[future]] = future.result()
+            if progress_callback is not None:
+                progress_callback(done, len(tasks))
+    return hasil
+
 
-        adalah_anomali = False
-        jenis_anomali = []
-
-        # Hitung total realisasi (jumlah seluruh bulan, NaN=0)
-        total_realisasi = 0.0
-        for col in bulan_cols:
-            v = row.get(col, 0)
-            try:
-                if pd.isna(v):
-                    v = 0
-                total_realisasi += float(v)
-            except Exception:
-                # jika bukan numeric, anggap 0
-                continue
-
-        # Kriteria 1: Pelaporan Identik (semua non-NaN sama)
-        nonzero_vals_for_check = [float(row[col]) for col in bulan_cols if pd.notna(row.get(col, None)) and row.get(col, None) != 0]
-        if len(nonzero_vals_for_check) >= 2 and len(set(nonzero_vals_for_check)) == 1:
-            adalah_anomali = True
-            jenis_anomali.append("Pelaporan Identik (0.00%)")
-
-        # Kriteria 2: Variasi Rendah (<= 5%) - tampilkan persentase variasi aktual
-        if len(nonzero_vals_for_check) >= 2 and not (len(set(nonzero_vals_for_check)) == 1):
-            variasi_rendah_pct = None
-            for i in range(len(nonzero_vals_for_check) - 1):
-                prev = nonzero_vals_for_check[i]
-                curr = nonzero_vals_for_check[i+1]
-                if prev != 0:
-                    perubahan = abs(curr - prev) / prev
-                    if perubahan <= 0.05:
-                        # ambil pertama kali ditemukan variasi rendah sebagai representative
-                        variasi_rendah_pct = perubahan
-                        break
-
-            if variasi_rendah_pct is not None:
-                adalah_anomali = True
-                pct_display = variasi_rendah_pct * 100
-                jenis_anomali.append(f"Variasi Rendah: {pct_display:.2f}%")
-
-        if adalah_anomali:
-            results.append({
-                'nomor': row.get('NOMOR', index + 1),
-                'nama_wp': row.get('NAMA WP', ''),
-                'npwpd': row.get('NPWPD', ''),
-                'jenis_anomali': ' | '.join(jenis_anomali),
-                'bulan_terisi': len([c for c in bulan_cols if pd.notna(row.get(c, None)) and row.get(c, None) != 0]),
-                'rata_rata': np.mean(nonzero_vals_for_check) if nonzero_vals_for_check else 0,
-                'min': np.min(nonzero_vals_for_check) if nonzero_vals_for_check else 0,
-                'max': np.max(nonzero_vals_for_check) if nonzero_vals_for_check else 0,
-                'std_dev': np.std(nonzero_vals_for_check) if len(nonzero_vals_for_check) > 1 else 0,
-                'total_realisasi': total_realisasi,
-            })
-
-    return results
-
-
-def hitung_statistik_pendapatan(df, bulan_cols):
+def detect_anomali_pendapatan_sharded(df, bulan_cols, aturan=None, max_workers=None,
+                                      shard_rows=SHARD_ROWS, progress_callback=None, matriks=None):
+    """
+    Deteksi anomali dengan membagi register WP menjadi beberapa shard yang
+    dianalisis paralel pada process pool. Matriks bulan dibagikan ke worker
+    lewat shared memory (tanpa pickle data), hasil digabung sesuai urutan asal.
+    Register kecil atau mesin satu core memakai detect_anomali_pendapatan biasa.
+    
+    Args:
+        df: DataFrame dengan data WP
+        bulan_cols: List kolom bulan yang akan dianalisis
+        aturan: Dict pengaturan aturan anomali (lihat ATURAN_DEFAULT)
+        max_workers: Jumlah proses (default: jumlah CPU)
+        shard_rows: Jumlah baris per shard
+        progress_callback: Fungsi opsional (shard_selesai, total_shard)
+        matriks: Tuple (values, terisi) hasil build_bulan_matrix bila sudah ada
+        
+    Returns:
+        Tabel anomali yang sama dengan detect_anomali_pendapatan
+    """
+    n_workers = max_workers or os.cpu_count() or 1
+    if len(df) < SHARD_MIN_ROWS or n_workers < 2:
+        results = detect_anomali_pendapatan(df, bulan_cols, aturan, matriks)
+        if progress_callback is not None:
+            progress_callback(1, 1)
+        return results
+
+    values, terisi = matriks if matriks is not None else build_bulan_matrix(df, bulan_cols)
+    bounds = [(start, min(start + shard_rows, len(df))) for start in range(0, len(df), shard_rows)]
+
+    shm_values, values_view = _to_shared(values)
+    shm_terisi, terisi_view = _to_shared(terisi)
+    del values, terisi
+    try:
+        tasks = [(shm_values.name, shm_terisi.name, values_view.shape, start, stop, aturan)
+                 for start, stop in bounds]
+        shard_results = jalankan_paralel(_analyze_shard_worker, tasks, min(n_workers, len(tasks)),
+                                         progress_callback)
+    finally:
+        del values_view, terisi_view
+        for shm in (shm_values, shm_terisi):
+            shm.close()
+            shm.unlink()
+
+    fields = {key: np.concatenate([res[key] for res in shard_results]) for key in shard_results[0]}
+    return _susun_hasil(df, fields, len(bulan_cols))
+
+
+class AkumulatorStatistikPendapatan:
+    """
+    Statistik pendapatan satu lintasan yang dapat digabung antar chunk/shard.
+    Momen dihitung dengan RunningStats (Welford/Chan), median dengan
+    QuantileSketch (galat relatif terbatas) sehingga nilai bulan tidak perlu
+    dikumpulkan dalam satu list. sketsa=False melewati sketsa bila median
+    eksak dihitung terpisah.
+    """
+
+    def __init__(self, relative_accuracy=0.01, sketsa=True):
+        self.total_wp = 0
+        self.moments = RunningStats()
+        self.sketch = QuantileSketch(relative_accuracy) if sketsa else None
+
+    def update_matrix(self, values, terisi):
+        """Tambahkan matriks WP x bulan (hanya nilai terisi yang dihitung)."""
+        self.total_wp += values.shape[0]
+        nonzero = values.T[terisi.T]
+        self.moments.update(nonzero)
+        if self.sketch is not None:
+            self.sketch.update(nonzero)
+        return self
+
+    def update(self, df, bulan_cols):
+        """Tambahkan satu chunk DataFrame WP."""
+        return self.update_matrix(*build_bulan_matrix(df, bulan_cols))
+
+    def merge(self, other):
+        self.total_wp += other.total_wp
+        self.moments.merge(other.moments)
+        if self.sketch is not None:
+            self.sketch.merge(other.sketch)
+        return self
+
+    def hasil(self, median=None):
+        """
+        Dict statistik dengan kunci yang sama dengan hitung_statistik_pendapatan.
+        median: nilai median eksak bila tersedia; default estimasi sketsa
+            (wajib diisi bila akumulator dibuat dengan sketsa=False).
+        """
+        if self.moments.count == 0:
+            return {
+                'total_wp': self.total_wp,
+                'rata_rata': 0,
+                'median': 0,
+                'min': 0,
+                'max': 0,
+                'std_dev': 0,
+                'total_pendapatan': 0
+            }
+        return {
+            'total_wp': self.total_wp,
+            'rata_rata': self.moments.mean,
+            'median': self.sketch.median() if median is None else median,
+            'min': self.moments.min,
+            'max': self.moments.max,
+            'std_dev': self.moments.std(ddof=0),
+            'total_pendapatan': self.moments.total
+        }
+
+
+def hitung_statistik_pendapatan(df, bulan_cols, exact_median=True):
     """
     Hitung statistik pendapatan keseluruhan.
     
     Args:
         df: DataFrame dengan data WP
         bulan_cols: List kolom bulan
+        exact_median: Hitung median eksak (data sudah di memori); False
+            memakai estimasi sketsa
         
     Returns:
         Dict dengan statistik keseluruhan
     """
-    # Gabungkan semua nilai bulan
-    all_values = []
-    for col in bulan_cols:
-        vals = df[col].dropna()
-        all_values.extend(vals[vals != 0].tolist())
+    values, terisi = build_bulan_matrix(df, bulan_cols)
+    acc = AkumulatorStatistikPendapatan(sketsa=not exact_median).update_matrix(values, terisi)
+    median = None
+    if exact_median and acc.moments.count:
+        median = float(np.median(values[terisi]))
+    return acc.hasil(median=median)
+
+
+def hitung_statistik_pendapatan_chunks(chunks, bulan_cols):
+    """
+    Statistik pendapatan dari iterable DataFrame (misal hasil
+    ingestion.iter_csv_chunks / iter_parquet_chunks) tanpa memuat seluruh data.
+    Median merupakan estimasi sketsa.
+    """
+    acc = AkumulatorStatistikPendapatan()
+    for chunk in chunks:
+        acc.update(chunk, bulan_cols)
+    return acc.hasil()
+
+
+def susun_klaster(klaster=None):
+    """Gabungkan pengaturan deteksi klaster dengan KLASTER_DEFAULT."""
+    hasil = dict(KLASTER_DEFAULT)
+    for kunci, nilai in (klaster or {}).items():
+        if kunci not in hasil:
+            raise ValueError(f"Pengaturan klaster tidak dikenal: {kunci}")
+        hasil[kunci] = nilai
+    return hasil
+
+
+def _bulatkan_deret(values, terisi, pembulatan=None):
+    """Deret bulanan yang dibandingkan antar WP (dibulatkan bila diminta, -0.0 -> 0.0)."""
+    if pembulatan is not None:
+        values = np.round(values, int(pembulatan))
+        terisi = terisi & (values != 0)
+    return values + 0.0, terisi
+
+
+def hash_deret(values, terisi, pembulatan=None):
+    """Hash uint64 per baris atas deret bulanan (setelah _bulatkan_deret)."""
+    values, _ = _bulatkan_deret(values, terisi, pembulatan)
+    h = np.zeros(values.shape[0], dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for j in range(values.shape[1]):
+            h = h * _HASH_PRIME ^ pd.util.hash_array(values[:, j])
+    return h
+
+
+def deteksi_klaster_identik(df, bulan_cols, min_anggota=3, min_bulan=2, pembulatan=None,
+                            matriks=None, deret=None):
+    """
+    Kelompokkan WP yang melaporkan deret bulanan identik. Setiap deret di-hash
+    (uint64 per kolom bulan digabung) lalu dikelompokkan lewat hash table
+    sehingga O(N); anggota dicek ulang terhadap deret wakil klaster agar
+    tabrakan hash tidak ikut terhitung. Kosong/NaN disamakan dengan 0.
+
+    Args:
+        matriks: Tuple (values, terisi) hasil build_bulan_matrix bila sudah ada
+        deret: Hash deret per baris (hash_deret dengan pembulatan yang sama)
+            bila sudah ada, misal dari indeks analisis sebelumnya
+
+    Returns:
+        Dict dengan 'ringkasan' (DataFrame per klaster: jumlah WP, total
+        realisasi dan pola bulanan, urut dari klaster terbesar) dan 'anggota'
+        (DataFrame WP anggota per klaster)
+    """
+    values, terisi = matriks if matriks is not None else build_bulan_matrix(df, bulan_cols)
+    if deret is None:
+        deret = hash_deret(values, terisi, pembulatan)
+    values, terisi = _bulatkan_deret(values, terisi, pembulatan)
+
+    rows = np.flatnonzero(terisi.sum(axis=1) >= max(int(min_bulan), 1))
+    sub = values[rows]
+    codes, uniq = pd.factorize(deret[rows])
+
+    # Wakil klaster = kemunculan pertama; anggota yang deretnya berbeda
+    # (tabrakan hash) dikeluarkan
+    wakil = np.full(len(uniq), -1, dtype=np.int64)
+    wakil[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+    sama = (sub == sub[wakil[codes]]).all(axis=1)
+    jumlah = np.bincount(codes[sama], minlength=len(uniq))
+    total_wp = sub.sum(axis=1)
+
+    besar = np.flatnonzero(jumlah >= max(int(min_anggota), 2))
+    # Urutan klaster: anggota terbanyak, lalu total realisasi terbesar
+    total_klaster = jumlah[besar] * total_wp[wakil[besar]]
+    besar = besar[np.lexsort((-total_klaster, -jumlah[besar]))]
+    peringkat = np.full(len(uniq), -1, dtype=np.int64)
+    peringkat[besar] = np.arange(1, len(besar) + 1)
+
+    ringkasan = pd.DataFrame({
+        'klaster': np.arange(1, len(besar) + 1),
+        'jumlah_wp': jumlah[besar],
+        'bulan_terisi': terisi[rows[wakil[besar]]].sum(axis=1),
+        'total_per_wp': total_wp[wakil[besar]],
+        'total_realisasi': jumlah[besar] * total_wp[wakil[besar]],
+    })
+    for j, col in enumerate(bulan_cols):
+        ringkasan[col] = sub[wakil[besar], j]
+
+    pos = np.flatnonzero(sama & (peringkat[codes] > 0))
+    pos = pos[np.argsort(peringkat[codes[pos]], kind='stable')]
+    nomor, nama_wp, npwpd = ambil_identitas(df, rows[pos])
+    anggota = pd.DataFrame({
+        'klaster': peringkat[codes[pos]],
+        'nomor': nomor,
+        'nama_wp': nama_wp,
+        'npwpd': npwpd,
+        'total_realisasi': total_wp[pos],
+    })
+    return {'ringkasan': ringkasan, 'anggota': anggota}
+
+
+def hash_data_pendapatan(df, bulan_cols, row_hash=None):
+    """
+    Hash BLAKE2b atas kolom identitas, kolom bulan dan index. row_hash hasil
+    hash_baris_pendapatan dapat diberikan agar data tidak dihash ulang.
+    """
+    cols = [c for c in KOLOM_IDENTITAS + list(bulan_cols) if c in df.columns]
+    if row_hash is None:
+        row_hash = hash_baris_pendapatan(df, bulan_cols)
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(repr(cols).encode())
+    hasher.update(row_hash.tobytes())
+    hasher.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def hash_baris_pendapatan(df, bulan_cols):
+    """Hash uint64 per baris atas kolom identitas dan kolom bulan (tanpa index)."""
+    if isinstance(df, PanelPendapatan):
+        return df.row_hash(bulan_cols)
+    cols = [c for c in KOLOM_IDENTITAS + list(bulan_cols) if c in df.columns]
+    return pd.util.hash_pandas_object(df[cols], index=False).to_numpy()
+
+
+def _npwpd_index(df):
+    """Index NPWPD bila kolomnya ada dan unik, selain itu None."""
+    if 'NPWPD' not in df.columns:
+        return None
+    npwpd = pd.Index(df['NPWPD'])
+    return npwpd if npwpd.is_unique else None
+
+
+def _urut_perbarui(urut, keluar, masuk):
+    """
+    Perbarui array terurut: buang satu kemunculan setiap nilai keluar lalu
+    sisipkan nilai masuk (biaya sebanding perubahan + satu memmove).
+    """
+    if keluar.size:
+        keluar = np.sort(keluar)
+        awal = np.flatnonzero(np.r_[True, keluar[1:] != keluar[:-1]])
+        # Nilai kembar dibuang dari kemunculan berturut-turut
+        ke = np.arange(keluar.size) - np.repeat(awal, np.diff(np.r_[awal, keluar.size]))
+        urut = np.delete(urut, np.searchsorted(urut, keluar) + ke)
+    if masuk.size:
+        masuk = np.sort(masuk)
+        urut = np.insert(urut, np.searchsorted(urut, masuk), masuk)
+    return urut
+
+
+def _statistik_dari_state(total_wp, moments, urut):
+    """
+    Dict statistik (kunci hitung_statistik_pendapatan) dari RunningStats dan
+    array terurut nilai terisi; median eksak diambil dari tengah array.
+    """
+    acc = AkumulatorStatistikPendapatan(sketsa=False)
+    acc.total_wp = total_wp
+    acc.moments = moments
+    median = None
+    if urut.size:
+        moments.min, moments.max = float(urut[0]), float(urut[-1])
+        median = float((urut[(urut.size - 1) // 2] + urut[urut.size // 2]) / 2)
+    return acc.hasil(median=median)
+
+
+def buat_indeks_npwpd(npwpd, bulan_cols, aturan, klaster, row_hash, nilai, anomali, baris_anomali,
+                      moments, urut, deret):
+    """
+    Indeks per NPWPD untuk analisis inkremental. Semua array sejajar dengan
+    urutan baris data: hash baris, matriks nilai bulan, posisi baris di
+    tabel anomali (-1 bila tidak beranomali) dan hash deret untuk klaster,
+    ditambah agregat statistik (RunningStats dan nilai terisi terurut) yang
+    diperbarui dengan delta WP baru/berubah/dihapus.
+    """
+    return {
+        'bulan_cols': tuple(bulan_cols),
+        'aturan': susun_aturan(aturan),
+        'pembulatan': klaster['pembulatan'],
+        'npwpd': npwpd,
+        'hash': row_hash,
+        'nilai': nilai,
+        'anomali': anomali,
+        'baris_anomali': baris_anomali,
+        'moments': moments,
+        'urut': urut,
+        'deret': deret,
+    }
+
+
+def indeks_cocok(indeks, bulan_cols, aturan):
+    """Cek apakah indeks sebelumnya dibuat dengan kolom bulan dan aturan yang sama."""
+    return (indeks is not None
+            and indeks['bulan_cols'] == tuple(bulan_cols)
+            and indeks['aturan'] == susun_aturan(aturan))
+
+
+def posisi_indeks(df, indeks):
+    """
+    Posisi setiap NPWPD data baru pada indeks sebelumnya (-1 untuk WP baru).
+    None bila kolom NPWPD tidak ada atau tidak unik; keunikan dicek dari
+    posisi hasil lookup sehingga NPWPD tidak dihash dua kali.
+    """
+    if 'NPWPD' not in df.columns:
+        return None, None
+    npwpd = pd.Index(df['NPWPD'])
+    pos = indeks['npwpd'].get_indexer(npwpd)
+    cocok = pos[pos >= 0]
+    if cocok.size and np.bincount(cocok).max() > 1:
+        return None, None
+    if not npwpd[pos < 0].is_unique:
+        return None, None
+    return npwpd, pos
+
+
+def detect_anomali_inkremental(df, bulan_cols, indeks, aturan=None, row_hash=None, pos=None):
+    """
+    Deteksi anomali hanya untuk WP yang baru atau berubah dibanding indeks
+    sebelumnya (dibandingkan lewat hash baris per NPWPD); hasil WP yang tidak
+    berubah diambil dari indeks. Urutan hasil sama dengan analisis penuh.
     
-    if not all_values:
-        return {
-            'total_wp': len(df),
-            'rata_rata': 0,
-            'median': 0,
-            'min': 0,
-            'max': 0,
-            'std_dev': 0,
-            'total_pendapatan': 0
-        }
+    Kolom NPWPD harus ada dan unik.
+    
+    Returns:
+        Tuple (tabel anomali, info) - info berisi jumlah WP baru, berubah,
+        tetap dan dihapus, serta 'delta' (matriks nilai baru, posisi baris
+        tabel anomali, baris yang dianalisis ulang dan baris indeks lama yang
+        keluar) untuk memperbarui indeks
+    """
+    if pos is None:
+        _, pos = posisi_indeks(df, indeks)
+    if row_hash is None:
+        row_hash = hash_baris_pendapatan(df, bulan_cols)
+    cocok = pos >= 0
+    pos_aman = np.where(cocok, pos, 0)
+    tetap = cocok & (indeks['hash'][pos_aman] == row_hash)
+
+    # Analisis ulang hanya baris yang baru/berubah
+    ubah_pos = np.flatnonzero(~tetap)
+    sub = df.take(ubah_pos) if isinstance(df, PanelPendapatan) else df.iloc[ubah_pos]
+    values, terisi = build_bulan_matrix(sub, bulan_cols)
+    fields = _anomali_fields(values, terisi, aturan)
+    hasil_baru = _susun_hasil(sub, fields, len(bulan_cols))
+    baru_pos = ubah_pos[fields['rows']]
+
+    # Hasil lama untuk WP yang tidak berubah dan sebelumnya beranomali
+    baris_lama = indeks['baris_anomali'][pos_aman]
+    lama_pos = np.flatnonzero(tetap & (baris_lama >= 0))
+    hasil_lama = indeks['anomali'].take(baris_lama[lama_pos]).reset_index(drop=True)
+    if 'NOMOR' not in df.columns:
+        # Nomor default mengikuti index baris pada upload terbaru
+        hasil_lama['nomor'] = (df.index[lama_pos] + 1).to_numpy(dtype=object)
+
+    gabungan = pd.concat([hasil_lama, hasil_baru], ignore_index=True)
+    semua_pos = np.concatenate([lama_pos, baru_pos])
+    urutan = np.argsort(semua_pos, kind='stable')
+    hasil = gabungan.take(urutan).reset_index(drop=True)
+    baris_anomali = np.full(len(df), -1, dtype=np.int64)
+    baris_anomali[semua_pos[urutan]] = np.arange(len(hasil))
+
+    # Matriks nilai data baru: baris tetap disalin dari indeks lama
+    tetap_pos = np.flatnonzero(tetap)
+    nilai = np.empty((len(df), len(bulan_cols)), dtype=np.float64)
+    nilai[tetap_pos] = indeks['nilai'][pos[tetap_pos]]
+    nilai[ubah_pos] = values
+    dipakai = np.zeros(len(indeks['hash']), dtype=bool)
+    dipakai[pos[tetap_pos]] = True
+
+    info = {
+        'baru': int((~cocok).sum()),
+        'berubah': int((cocok & ~tetap).sum()),
+        'tetap': int(tetap.sum()),
+        'dihapus': int(len(indeks['hash']) - cocok.sum()),
+        'delta': {
+            'nilai': nilai,
+            'baris_anomali': baris_anomali,
+            'ubah_pos': ubah_pos,
+            'tetap_pos': tetap_pos,
+            'lama_keluar': np.flatnonzero(~dipakai),
+        },
+    }
+    return hasil.astype(KOLOM_ANOMALI), info
+
+
+def analisis_pendapatan(df, bulan_cols, aturan=None, progress_callback=None, sebelumnya=None,
+                        klaster=None):
+    """
+    Hasil analisis Pendapatan bersama (statistik, daftar anomali dan agregat)
+    yang dipakai dashboard serta laporan xlsx/docx. Di-cache berdasarkan hash
+    data, kolom bulan dan pengaturan aturan sehingga setiap rerun hanya
+    menghitung sekali.
     
-    total_pendapatan = sum(all_values)
+    Args:
+        sebelumnya: Hasil analisis_pendapatan dari upload sebelumnya (opsional).
+            Jika indeksnya cocok, hanya WP baru/berubah yang dianalisis ulang;
+            statistik, matriks nilai dan hash deret klaster diperbarui dengan
+            delta dari indeks sebelumnya.
+        klaster: Pengaturan deteksi klaster deret identik antar WP (lihat
+            KLASTER_DEFAULT)
     
-    return {
-        'total_wp': len(df),
-        'rata_rata': np.mean(all_values),
-        'median': np.median(all_values),
-        'min': np.min(all_values),
-        'max': np.max(all_values),
-        'std_dev': np.std(all_values),
-        'total_pendapatan': total_pendapatan
+    Returns:
+        Dict dengan kunci 'statistik', 'anomali', 'total_anomali',
+        'pct_wp_anomali', 'pct_realisasi_anomali', 'key', 'indeks' (indeks
+        NPWPD untuk analisis berikutnya), 'inkremental' (info perubahan
+        atau None bila analisis penuh) dan 'klaster' (hasil
+        deteksi_klaster_identik atau None bila tidak aktif)
+    """
+    aturan = susun_aturan(aturan)
+    klaster = susun_klaster(klaster)
+    row_hash = hash_baris_pendapatan(df, bulan_cols)
+    key = (hash_data_pendapatan(df, bulan_cols, row_hash), tuple(bulan_cols), repr(sorted(aturan.items())),
+           repr(sorted(klaster.items())))
+    with _ANALISIS_CACHE_LOCK:
+        cached = _ANALISIS_CACHE.get(key)
+        if cached is not None:
+            _ANALISIS_CACHE.move_to_end(key)
+    if cached is not None:
+        if progress_callback is not None:
+            progress_callback(1, 1)
+        return cached
+
+    indeks_lama = sebelumnya.get('indeks') if sebelumnya else None
+    npwpd, pos = None, None
+    if indeks_cocok(indeks_lama, bulan_cols, aturan):
+        npwpd, pos = posisi_indeks(df, indeks_lama)
+
+    info_inkremental = None
+    if pos is not None:
+        anomali, info_inkremental = detect_anomali_inkremental(df, bulan_cols, indeks_lama, aturan,
+                                                               row_hash, pos)
+        delta = info_inkremental.pop('delta')
+        nilai, baris_anomali = delta['nilai'], delta['baris_anomali']
+        terisi = nilai != 0
+        # Statistik: keluarkan nilai WP lama yang berubah/dihapus, masukkan nilai baru
+        lama = indeks_lama['nilai'][delta['lama_keluar']]
+        keluar = lama[lama != 0]
+        baru = nilai[delta['ubah_pos']]
+        masuk = baru[baru != 0]
+        moments = copy.copy(indeks_lama['moments'])
+        moments.kurangi(RunningStats().update(keluar)).merge(RunningStats().update(masuk))
+        urut = _urut_perbarui(indeks_lama['urut'], keluar, masuk)
+        # Hash deret klaster: salin untuk WP tetap bila pembulatannya sama
+        deret = None
+        if klaster['aktif']:
+            if indeks_lama['deret'] is not None and indeks_lama['pembulatan'] == klaster['pembulatan']:
+                deret = np.empty(len(df), dtype=np.uint64)
+                deret[delta['tetap_pos']] = indeks_lama['deret'][pos[delta['tetap_pos']]]
+                deret[delta['ubah_pos']] = hash_deret(nilai[delta['ubah_pos']], terisi[delta['ubah_pos']],
+                                                      klaster['pembulatan'])
+            else:
+                deret = hash_deret(nilai, terisi, klaster['pembulatan'])
+        if progress_callback is not None:
+            progress_callback(1, 1)
+    else:
+        nilai, terisi = build_bulan_matrix(df, bulan_cols)
+        anomali = detect_anomali_pendapatan_sharded(df, bulan_cols, aturan, progress_callback=progress_callback,
+                                                     matriks=(nilai, terisi))
+        moments = RunningStats().update(nilai.T[terisi.T])
+        urut = np.sort(nilai[terisi])
+        deret = hash_deret(nilai, terisi, klaster['pembulatan']) if klaster['aktif'] else None
+        npwpd = _npwpd_index(df)
+        baris_anomali = None
+        if npwpd is not None:
+            baris_anomali = np.full(len(df), -1, dtype=np.int64)
+            baris_anomali[npwpd.get_indexer(anomali['npwpd'])] = np.arange(len(anomali))
+
+    statistik = _statistik_dari_state(len(df), moments, urut)
+    total_anomali = float(anomali['total_realisasi'].sum())
+    total_pendapatan = statistik.get('total_pendapatan', 0)
+
+    analisis = {
+        'key': key,
+        'aturan': aturan,
+        'statistik': statistik,
+        'anomali': anomali,
+        'total_anomali': total_anomali,
+        'pct_wp_anomali': (len(anomali) / statistik['total_wp'] * 100) if statistik['total_wp'] > 0 else 0,
+        'pct_realisasi_anomali': (total_anomali / total_pendapatan * 100) if total_pendapatan > 0 else 0,
+        'indeks': (buat_indeks_npwpd(npwpd, bulan_cols, aturan, klaster, row_hash, nilai, anomali,
+                                     baris_anomali, moments, urut, deret)
+                   if npwpd is not None else None),
+        'inkremental': info_inkremental,
+        'klaster': (deteksi_klaster_identik(df, bulan_cols, klaster['min_anggota'], klaster['min_bulan'],
+                                            klaster['pembulatan'], matriks=(nilai, terisi), deret=deret)
+                    if klaster['aktif'] else None),
     }
+    with _ANALISIS_CACHE_LOCK:
+        _ANALISIS_CACHE[key] = analisis
+        if len(_ANALISIS_CACHE) > ANALISIS_CACHE_MAX_ENTRIES:
+            _ANALISIS_CACHE.popitem(last=False)
+    return analisis
@@ -0,0 +1,307 @@
+"""
+Panel WP x bulan yang ringkas untuk data Pendapatan.
+
+Nilai bulan disimpan sebagai matriks kontigu dengan encoding terkecil yang
+tetap eksak (float32, int32 Rupiah bulat, int64 dalam sen, atau float64)
+plus bitmap validitas (bukan NaN). Register yang sebagian besar kosong
+disimpan dalam layout sparse (CSR per baris WP). Kolom identitas WP (NOMOR, NAMA WP, NPWPD) dan
+kolom tambahan (misal kelompok peer) disimpan sebagai tabel Arrow sehingga
+teks tidak menjadi objek Python per sel.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Layout sparse dipakai otomatis bila proporsi sel terisi (bukan 0/NaN) <= nilai ini
+SPARSE_MAX_DENSITY = 0.25
+
+# Batas aman int64 dalam sen (menghindari overflow saat dikali 100)
+_SEN_MAX_ABS = 9e15
+
+KOLOM_IDENTITAS = ('NOMOR', 'NAMA WP', 'NPWPD')
+
+BULAN_COLS = ['JANUARI', 'FEBRUARI', 'MARET', 'APRIL', 'MEI', 'JUNI',
+              'JULI', 'AGUSTUS', 'SEPTEMBER', 'OKTOBER', 'NOVEMBER', 'DESEMBER']
+
+# Singkatan 3 huruf (Indonesia dan Inggris) ke indeks bulan 0-11
+_BULAN_SINGKAT = {nama[:3]: i for i, nama in enumerate(BULAN_COLS)}
+_BULAN_SINGKAT.update({'MAY': 4, 'AUG': 7, 'OCT': 9, 'DEC': 11})
+
+_HASH_PRIME = np.uint64(1000003)
+
+
+def _pilih_encoding(values):
+    """
+    Pilih encoding nilai terkecil yang eksak: float32, int32 (Rupiah bulat),
+    sen (int64) atau float64.
+    """
+    as_f32 = values.astype(np.float32)
+    if np.array_equal(as_f32.astype(np.float64), values):
+        return 'float32', as_f32
+    info32 = np.iinfo(np.int32)
+    if values.size == 0 or (values.min() >= info32.min and values.max() <= info32.max):
+        as_i32 = values.astype(np.int32)
+        if np.array_equal(as_i32, values):
+            return 'int32', as_i32
+    if values.size == 0 or np.abs(values).max() < _SEN_MAX_ABS:
+        sen = np.round(values * 100)
+        if np.array_equal(sen / 100, values):
+            return 'sen', sen.astype(np.int64)
+    return 'float64', values
+
+
+def _decode(encoding, data):
+    if encoding == 'sen':
+        return data.astype(np.float64) / 100
+    return data.astype(np.float64)
+
+
+def _meta_array(series):
+    """Kolom identitas ke Arrow; kolom campuran disimpan sebagai string."""
+    try:
+        return pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array(series.astype(str), type=pa.string())
+
+
+def bulan_ke_indeks(series):
+    """
+    Konversi kolom bulan ke indeks 0-11. Mendukung angka 1-12, tanggal, nama
+    bulan atau singkatannya (JAN, MEI, AGU, OCT, ...). Nilai yang tidak
+    dikenali menjadi -1. Teks dikonversi per nilai unik (factorize), bukan per baris.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        idx = series.dt.month.to_numpy(dtype=np.float64, na_value=np.nan) - 1
+        return np.where(np.isnan(idx), -1, idx).astype(np.int64)
+    if pd.api.types.is_numeric_dtype(series):
+        num = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        ok = (num >= 1) & (num <= 12) & (num == np.floor(num))
+        return np.where(ok, num - 1, -1).astype(np.int64)
+
+    codes, uniques = pd.factorize(series)
+    lookup = np.full(len(uniques) + 1, -1, dtype=np.int64)
+    teks = pd.Series(uniques, dtype=object).astype(str).str.strip().str.upper()
+    for i, val in enumerate(teks):
+        if val[:3] in _BULAN_SINGKAT:
+            lookup[i] = _BULAN_SINGKAT[val[:3]]
+        elif val.isdigit() and 1 <= int(val) <= 12:
+            lookup[i] = int(val) - 1
+    # Sisanya dicoba sebagai tanggal: ISO (yyyy-mm-dd) dulu, lalu format hari-bulan-tahun
+    for kwargs in ({'format': 'ISO8601'}, {'format': 'mixed', 'dayfirst': True}):
+        sisa = np.flatnonzero(lookup[:-1] < 0)
+        if len(sisa) == 0:
+            break
+        tanggal = pd.to_datetime(teks.iloc[sisa], errors='coerce', **kwargs)
+        ok = tanggal.notna().to_numpy()
+        lookup[sisa[ok]] = tanggal[ok].dt.month.to_numpy() - 1
+    # Kode -1 (NaN) memakai slot terakhir lookup (-1)
+    return lookup[codes]
+
+
+def agregasi_long(df, npwpd_col, bulan_col, nilai_col, nama_col=None):
+    """
+    Agregasi data long (satu baris per transaksi) menjadi matriks WP x 12 bulan
+    dengan kode kategori (factorize) dan penjumlahan np.bincount. Transaksi
+    dari tahun berbeda digabung per bulan; bulan tanpa transaksi bernilai NaN.
+
+    Returns:
+        Tuple (identitas, values, notna, info) - identitas berupa dict kolom
+        NOMOR/NAMA WP/NPWPD, values float64 (n_wp x 12)
+    """
+    wp_codes, wp_uniques = pd.factorize(df[npwpd_col])
+    bulan_idx = bulan_ke_indeks(df[bulan_col])
+    nilai = pd.to_numeric(df[nilai_col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+    valid = (wp_codes >= 0) & (bulan_idx >= 0)
+    n_wp = len(wp_uniques)
+    flat = wp_codes[valid] * 12 + bulan_idx[valid]
+    bobot = np.nan_to_num(nilai[valid])
+    values = np.bincount(flat, weights=bobot, minlength=n_wp * 12).reshape(n_wp, 12)
+    notna = (np.bincount(flat[~np.isnan(nilai[valid])], minlength=n_wp * 12) > 0).reshape(n_wp, 12)
+
+    identitas = {'NOMOR': np.arange(1, n_wp + 1), 'NPWPD': np.asarray(wp_uniques, dtype=object)}
+    if nama_col is not None:
+        # Nama WP diambil dari transaksi pertama setiap WP
+        pos = np.flatnonzero(wp_codes >= 0)
+        first = np.empty(n_wp, dtype=np.int64)
+        first[wp_codes[pos][::-1]] = pos[::-1]
+        identitas['NAMA WP'] = df[nama_col].to_numpy(dtype=object)[first]
+
+    info = {
+        'n_transaksi': len(df),
+        'n_wp': n_wp,
+        'n_diabaikan': int((~valid).sum()),
+    }
+    return identitas, values, notna, info
+
+
+def pivot_long_pendapatan(df, npwpd_col, bulan_col, nilai_col, nama_col=None):
+    """
+    Pivot data long menjadi DataFrame wide sesuai template (NOMOR, NAMA WP,
+    NPWPD, JANUARI..DESEMBER) tanpa pivot_table generik.
+
+    Returns:
+        Tuple (DataFrame wide, info)
+    """
+    identitas, values, notna, info = agregasi_long(df, npwpd_col, bulan_col, nilai_col, nama_col)
+    wide = pd.DataFrame({col: identitas[col] for col in KOLOM_IDENTITAS if col in identitas})
+    wide[BULAN_COLS] = np.where(notna, values, np.nan)
+    return wide, info
+
+
+class PanelPendapatan:
+    """
+    Panel WP x bulan ringkas. Dibuat dengan PanelPendapatan.from_dataframe lalu
+    dapat dipakai langsung oleh fungsi di pendapatan_analyzer sebagai pengganti
+    DataFrame wide.
+    """
+
+    def __init__(self, meta, bulan_cols, index, n_rows, encoding, validity, dense=None, sparse=None):
+        self.meta = meta
+        self.bulan_cols = list(bulan_cols)
+        self.index = index
+        self.n_rows = n_rows
+        self.encoding = encoding
+        self.validity = validity
+        self.dense = dense
+        self.sparse = sparse
+
+    @classmethod
+    def from_dataframe(cls, df, bulan_cols, sparse=None, kolom_tambahan=()):
+        """
+        Bangun panel dari DataFrame wide. Kolom bulan yang tidak ada dianggap 0.
+
+        Args:
+            sparse: True/False untuk memaksa layout; None memilih otomatis
+                berdasarkan SPARSE_MAX_DENSITY
+            kolom_tambahan: Kolom non-bulan lain yang ikut disimpan di meta
+                (misal kolom kelompok peer untuk analisis tren)
+        """
+        n, m = len(df), len(bulan_cols)
+        values = np.zeros((n, m), dtype=np.float64)
+        notna = np.zeros((n, m), dtype=bool)
+        for j, col in enumerate(bulan_cols):
+            if col not in df.columns:
+                notna[:, j] = True
+                continue
+            col_vals = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            notna[:, j] = ~np.isnan(col_vals)
+            values[:, j] = np.where(notna[:, j], col_vals, 0.0)
+
+        kolom_meta = [col for col in KOLOM_IDENTITAS if col in df.columns]
+        kolom_meta += [col for col in kolom_tambahan if col in df.columns and col not in kolom_meta]
+        meta = pa.table({col: _meta_array(df[col]) for col in kolom_meta})
+        validity = np.packbits(notna, axis=1)
+
+        terisi = values != 0
+        if sparse is None:
+            sparse = n * m > 0 and terisi.mean() <= SPARSE_MAX_DENSITY
+
+        if sparse:
+            rows, cols = np.nonzero(terisi)
+            encoding, data = _pilih_encoding(values[rows, cols])
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(terisi.sum(axis=1), out=indptr[1:])
+            return cls(meta, bulan_cols, df.index, n, encoding, validity,
+                       sparse=(indptr, cols.astype(np.uint8), data))
+
+        encoding, data = _pilih_encoding(values)
+        return cls(meta, bulan_cols, df.index, n, encoding, validity, dense=np.ascontiguousarray(data))
+
+    @classmethod
+    def from_long(cls, df, npwpd_col, bulan_col, nilai_col, nama_col=None, sparse=None):
+        """Bangun panel langsung dari data long (lihat agregasi_long)."""
+        wide, _ = pivot_long_pendapatan(df, npwpd_col, bulan_col, nilai_col, nama_col)
+        return cls.from_dataframe(wide, BULAN_COLS, sparse=sparse)
+
+    def __len__(self):
+        return self.n_rows
+
+    @property
+    def columns(self):
+        return list(self.meta.column_names) + self.bulan_cols
+
+    @property
+    def is_sparse(self):
+        return self.sparse is not None
+
+    @property
+    def nbytes(self):
+        """Perkiraan memori panel (byte)."""
+        arrays = [self.validity] + ([self.dense] if self.dense is not None else list(self.sparse))
+        return sum(a.nbytes for a in arrays) + self.meta.nbytes
+
+    def __getitem__(self, col):
+        """Kolom meta (identitas atau kelompok) sebagai Series pandas (index mengikuti data asal)."""
+        return pd.Series(self.meta.column(col).to_pandas(), index=self.index, name=col)
+
+    def kolom(self, col, rows):
+        """Nilai kolom identitas pada posisi rows sebagai list objek Python."""
+        return self.meta.column(col).take(pa.array(rows, type=pa.int64())).to_pylist()
+
+    def matrix(self, bulan_cols=None, start=0, stop=None):
+        """
+        Matriks float64 (NaN = 0) dan mask terisi (bukan 0) untuk baris
+        [start, stop) dan kolom bulan yang diminta.
+        """
+        stop = self.n_rows if stop is None else stop
+        if self.dense is not None:
+            values = _decode(self.encoding, self.dense[start:stop])
+        else:
+            indptr, cols, data = self.sparse
+            lo, hi = indptr[start], indptr[stop]
+            values = np.zeros((stop - start, len(self.bulan_cols)), dtype=np.float64)
+            rows = np.repeat(np.arange(stop - start), np.diff(indptr[start:stop + 1]))
+            values[rows, cols[lo:hi]] = _decode(self.encoding, data[lo:hi])
+
+        if bulan_cols is not None and list(bulan_cols) != self.bulan_cols:
+            picked = np.zeros((values.shape[0], len(bulan_cols)), dtype=np.float64)
+            for j, col in enumerate(bulan_cols):
+                if col in self.bulan_cols:
+                    picked[:, j] = values[:, self.bulan_cols.index(col)]
+            values = picked
+        return values, values != 0
+
+    def take(self, positions):
+        """Panel baru berisi baris pada posisi tertentu."""
+        positions = np.asarray(positions, dtype=np.int64)
+        meta = self.meta.take(pa.array(positions))
+        validity = self.validity[positions]
+        if self.dense is not None:
+            return PanelPendapatan(meta, self.bulan_cols, self.index[positions], len(positions),
+                                   self.encoding, validity, dense=self.dense[positions])
+
+        indptr, cols, data = self.sparse
+        lengths = np.diff(indptr)[positions]
+        new_indptr = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_indptr[1:])
+        gather = np.repeat(indptr[positions] - new_indptr[:-1], lengths) + np.arange(new_indptr[-1])
+        return PanelPendapatan(meta, self.bulan_cols, self.index[positions], len(positions),
+                               self.encoding, validity, sparse=(new_indptr, cols[gather], data[gather]))
+
+    def row_hash(self, bulan_cols=None):
+        """
+        Hash uint64 per baris atas kolom identitas dan nilai bulan. NaN dan 0
+        dihash sama karena hasil analisis untuk keduanya identik.
+        """
+        h = np.zeros(self.n_rows, dtype=np.uint64)
+        identitas = [col for col in KOLOM_IDENTITAS if col in self.meta.column_names]
+        if identitas:
+            h ^= pd.util.hash_pandas_object(self.meta.select(identitas).to_pandas(), index=False).to_numpy()
+        values, _ = self.matrix(bulan_cols)
+        with np.errstate(over='ignore'):
+            for j in range(values.shape[1]):
+                h = h * _HASH_PRIME ^ pd.util.hash_array(values[:, j])
+        return h
+
+    def to_dataframe(self):
+        """Kembalikan ke DataFrame wide (NaN dipulihkan dari bitmap validitas)."""
+        values, _ = self.matrix()
+        notna = np.unpackbits(self.validity, axis=1, count=len(self.bulan_cols)).astype(bool)
+        values[~notna] = np.nan
+        df = self.meta.to_pandas()
+        df.index = self.index
+        for j, col in enumerate(self.bulan_cols):
+            df[col] = values[:, j]
+        return df
@@ -0,0 +1,264 @@
+"""
+Modul analisis tren dan musiman data pendapatan WP.
+Menandai WP dengan pendapatan yang menurun terus-menerus, penurunan tajam
+antar bulan kalender, atau pola bulanan yang menyimpang dari profil median
+kelompok sejenisnya (peer). Semua perhitungan berupa operasi matriks
+WP x bulan sekaligus, tanpa loop per WP.
+"""
+
+import numpy as np
+import pandas as pd
+
+from pendapatan_analyzer import build_bulan_matrix, ambil_identitas
+from pendapatan_panel import PanelPendapatan
+
+# Minimal bulan terisi agar slope dan profil WP dianggap bermakna
+MIN_BULAN_TREN = 6
+# Kelompok peer dengan anggota lebih sedikit tidak dipakai sebagai pembanding
+MIN_ANGGOTA_PEER = 5
+
+# Aturan tren beserta ambang default:
+#   tren_turun      : slope least-squares relatif <= -threshold per bulan
+#                     (rasio terhadap rata-rata bulan terisi)
+#   penurunan_mom   : penurunan bulan ke bulan (kalender) >= threshold (rasio);
+#                     bulan kosong setelah bulan terisi dihitung turun 100%
+#   deviasi_profil  : jarak profil bulanan WP ke profil median peer >= threshold
+#                     (total variation distance 0-1, atas bulan terisi saja)
+ATURAN_TREN_DEFAULT = {
+    'tren_turun': {'aktif': True, 'threshold': 0.05},
+    'penurunan_mom': {'aktif': False, 'threshold': 0.5},
+    'deviasi_profil': {'aktif': True, 'threshold': 0.35},
+}
+
+ATURAN_TREN_BIT = {kode: 1 << i for i, kode in enumerate(ATURAN_TREN_DEFAULT)}
+
+ATURAN_TREN_LABEL = {
+    'tren_turun': 'Tren Menurun',
+    'penurunan_mom': 'Penurunan Bulanan',
+    'deviasi_profil': 'Menyimpang dari Profil Peer',
+}
+
+
+def susun_aturan_tren(aturan=None):
+    """Gabungkan pengaturan aturan tren dengan ATURAN_TREN_DEFAULT."""
+    hasil = {kode: dict(cfg) for kode, cfg in ATURAN_TREN_DEFAULT.items()}
+    for kode, cfg in (aturan or {}).items():
+        if kode not in hasil:
+            raise ValueError(f"Aturan tren tidak dikenal: {kode}")
+        hasil[kode].update(cfg)
+    return hasil
+
+
+def _slope_terisi(values, terisi):
+    """Slope least-squares per baris atas bulan terisi (x = urutan bulan); bulan kosong bernilai 0."""
+    w = terisi.astype(np.float64)
+    x = np.arange(values.shape[1], dtype=np.float64)
+    n = w.sum(axis=1)
+    sx = w @ x
+    sxx = w @ (x * x)
+    sy = values.sum(axis=1)  # bulan kosong sudah bernilai 0
+    sxy = values @ x
+    denom = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denom > 0, (n * sxy - sx * sy) / denom, np.nan)
+        rata = np.where(n > 0, sy / n, np.nan)
+    return slope, rata
+
+
+def _penurunan_mom(values):
+    """Penurunan terbesar bulan ke bulan (rasio) dan indeks bulan terjadinya."""
+    if values.shape[1] < 2:
+        n = values.shape[0]
+        return np.zeros(n), np.full(n, -1)
+    prev = values[:, :-1]
+    cur = values[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turun = np.where(prev > 0, (prev - np.maximum(cur, 0.0)) / prev, 0.0)
+    idx = turun.argmax(axis=1)
+    maks = turun[np.arange(len(turun)), idx]
+    return maks, np.where(maks > 0, idx + 1, -1)
+
+
+def _median_per_grup(share, codes, n_grup):
+    """
+    Median per bulan untuk setiap grup. Baris diurutkan per grup sekali, lalu
+    median (partisi) dihitung per potongan grup atas seluruh kolom sekaligus.
+    """
+    counts = np.bincount(codes, minlength=n_grup)
+    median = np.full((n_grup, share.shape[1]), np.nan)
+    if n_grup == 1:
+        if counts[0]:
+            median[0] = np.median(share, axis=0)
+        return median, counts
+    urut = share[np.argsort(codes, kind='stable')]
+    batas = np.concatenate(([0], np.cumsum(counts)))
+    for g in np.flatnonzero(counts):
+        median[g] = np.median(urut[batas[g]:batas[g + 1]], axis=0)
+    return median, counts
+
+
+def _kode_grup(grup, n):
+    """Faktorisasi label grup; None berarti seluruh WP satu grup."""
+    if grup is None:
+        return np.zeros(n, dtype=np.int64), np.array(['(Semua WP)'], dtype=object)
+    arr = np.asarray(grup, dtype=object)
+    codes, labels = pd.factorize(np.where(pd.isna(arr), '(Kosong)', arr))
+    return codes.astype(np.int64), np.asarray(labels, dtype=object)
+
+
+def analyze_tren_matrix(values, terisi, grup=None, aturan=None, min_bulan=MIN_BULAN_TREN):
+    """
+    Hitung metrik tren untuk setiap baris matriks WP x bulan.
+
+    Args:
+        values: Matriks float64 (NaN sudah 0), hasil build_bulan_matrix
+        terisi: Mask bulan terisi
+        grup: Label kelompok peer per WP (array-like) atau None
+        aturan: Pengaturan aturan tren (lihat ATURAN_TREN_DEFAULT)
+        min_bulan: Minimal bulan terisi agar slope/profil dinilai
+
+    Returns:
+        Dict array per WP (slope, slope_pct, penurunan_mom, bulan_penurunan,
+        deviasi_profil, kode, anomali, ...) serta profil median per grup
+    """
+    aturan = susun_aturan_tren(aturan)
+    n = values.shape[0]
+    bulan_terisi = terisi.sum(axis=1)
+    cukup = bulan_terisi >= min_bulan
+    total = values.sum(axis=1)
+
+    # Profil bulanan = porsi tiap bulan terhadap total tahunan WP
+    codes, labels = _kode_grup(grup, n)
+    dinilai = cukup & (total > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = values / np.where(dinilai, total, 1.0)[:, None]
+    n_grup = len(labels)
+    median, anggota = _median_per_grup(share[dinilai], codes[dinilai], n_grup)
+    jumlah_median = median.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profil_peer = np.where(jumlah_median > 0, median / jumlah_median, np.nan)
+    peer_valid = (anggota >= MIN_ANGGOTA_PEER)[codes]
+    # Pembanding dibatasi pada bulan yang dilaporkan WP (bulan kosong sudah
+    # ditangani aturan bulan_kosong) lalu dinormalisasi ulang
+    peer_wp = np.where(terisi, profil_peer[codes], 0.0)
+    jumlah_peer = peer_wp.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        peer_wp = peer_wp / np.where(jumlah_peer > 0, jumlah_peer, 1.0)
+    deviasi = 0.5 * np.abs(share - peer_wp).sum(axis=1)
+    deviasi = np.where(dinilai & peer_valid, deviasi, np.nan)
+
+    # Slope dihitung atas nilai yang sudah disesuaikan musiman peer (nilai /
+    # indeks musiman grup) agar pola musiman normal tidak terbaca sebagai tren
+    n_bulan = values.shape[1]
+    indeks_musim = profil_peer[codes] * n_bulan
+    pakai_indeks = peer_valid[:, None] & (indeks_musim > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        disesuaikan = np.where(pakai_indeks, values / np.where(pakai_indeks, indeks_musim, 1.0), values)
+    slope, rata = _slope_terisi(disesuaikan, terisi)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope_pct = np.where(cukup & (rata != 0), slope / np.abs(rata), np.nan)
+
+    penurunan_mom, bulan_penurunan = _penurunan_mom(values)
+
+    kode = np.zeros(n, dtype=np.int64)
+    cfg = aturan['tren_turun']
+    if cfg['aktif']:
+        kode |= np.where(slope_pct <= -cfg['threshold'], ATURAN_TREN_BIT['tren_turun'], 0)
+    cfg = aturan['penurunan_mom']
+    if cfg['aktif']:
+        kode |= np.where(penurunan_mom >= cfg['threshold'], ATURAN_TREN_BIT['penurunan_mom'], 0)
+    cfg = aturan['deviasi_profil']
+    if cfg['aktif']:
+        kode |= np.where(deviasi >= cfg['threshold'], ATURAN_TREN_BIT['deviasi_profil'], 0)
+
+    return {
+        'kode': kode,
+        'anomali': kode != 0,
+        'bulan_terisi': bulan_terisi,
+        'total_realisasi': total,
+        'slope': slope,
+        'slope_pct': slope_pct,
+        'penurunan_mom': penurunan_mom,
+        'bulan_penurunan': bulan_penurunan,
+        'deviasi_profil': deviasi,
+        'grup_codes': codes,
+        'grup_labels': labels,
+        'profil_peer': profil_peer,
+        'anggota_peer': anggota,
+    }
+
+
+def _jenis_tren_text(kode, slope_pct, penurunan, bulan_penurunan, deviasi, bulan_cols):
+    """Teks jenis tren per WP (vektor string) dari bitmask dan metriknya."""
+    hasil = np.full(len(kode), '', dtype=object)
+    if len(kode) == 0:
+        return hasil
+    nama_bulan = np.asarray(list(bulan_cols) + [''], dtype=object)
+    for bit, teks in (
+        (ATURAN_TREN_BIT['tren_turun'],
+         'Tren Menurun: ' + pd.Series(slope_pct * 100).map('{:.2f}'.format) + '%/bulan'),
+        (ATURAN_TREN_BIT['penurunan_mom'],
+         'Penurunan Bulanan: ' + pd.Series(penurunan * 100).map('{:.2f}'.format)
+         + '% (' + pd.Series(nama_bulan[bulan_penurunan]) + ')'),
+        (ATURAN_TREN_BIT['deviasi_profil'],
+         'Menyimpang dari Profil Peer: ' + pd.Series(deviasi * 100).map('{:.2f}'.format) + '%'),
+    ):
+        aktif = (kode & bit) != 0
+        teks = teks.to_numpy(dtype=object)
+        pemisah = np.where(aktif & (hasil != ''), ' | ', '')
+        hasil = np.where(aktif, hasil + pemisah + teks, hasil)
+    return hasil
+
+
+def deteksi_tren_pendapatan(df, bulan_cols, grup=None, aturan=None, min_bulan=MIN_BULAN_TREN):
+    """
+    Deteksi WP dengan tren menurun, penurunan bulanan tajam atau pola musiman
+    yang menyimpang dari peer.
+
+    Args:
+        df: DataFrame wide atau PanelPendapatan
+        bulan_cols: List kolom bulan (urut kalender)
+        grup: Nama kolom kelompok peer pada df, array label per WP, atau None
+            (seluruh WP dibandingkan dengan satu profil median)
+        aturan: Pengaturan aturan tren (lihat ATURAN_TREN_DEFAULT)
+        min_bulan: Minimal bulan terisi agar slope/profil dinilai
+
+    Returns:
+        Tuple (DataFrame WP bertanda, DataFrame profil peer per grup)
+    """
+    values, terisi = build_bulan_matrix(df, bulan_cols)
+    if isinstance(grup, str):
+        if grup not in df.columns:
+            raise ValueError(f"Kolom grup '{grup}' tidak ditemukan")
+        grup = (df.kolom(grup, np.arange(len(df))) if isinstance(df, PanelPendapatan)
+                else df[grup].to_numpy(dtype=object))
+    elif grup is not None and len(grup) != len(values):
+        raise ValueError("Panjang label grup tidak sama dengan jumlah WP")
+
+    hasil = analyze_tren_matrix(values, terisi, grup, aturan, min_bulan)
+    rows = np.flatnonzero(hasil['anomali'])
+    nomor, nama_wp, npwpd = ambil_identitas(df, rows)
+    ambil = {key: hasil[key][rows] for key in (
+        'kode', 'bulan_terisi', 'total_realisasi', 'slope_pct',
+        'penurunan_mom', 'bulan_penurunan', 'deviasi_profil')}
+
+    tabel = pd.DataFrame({
+        'nomor': nomor,
+        'nama_wp': nama_wp,
+        'npwpd': npwpd,
+        'grup': hasil['grup_labels'][hasil['grup_codes'][rows]],
+        'jenis_tren': _jenis_tren_text(
+            ambil['kode'], ambil['slope_pct'], ambil['penurunan_mom'],
+            ambil['bulan_penurunan'], ambil['deviasi_profil'], bulan_cols),
+        'bulan_terisi': ambil['bulan_terisi'],
+        'slope_pct': ambil['slope_pct'],
+        'penurunan_mom': ambil['penurunan_mom'],
+        'deviasi_profil': ambil['deviasi_profil'],
+        'total_realisasi': ambil['total_realisasi'],
+        'kode': ambil['kode'],
+    })
+
+    profil = pd.DataFrame(hasil['profil_peer'], columns=list(bulan_cols))
+    profil.insert(0, 'grup', hasil['grup_labels'])
+    profil.insert(1, 'anggota', hasil['anggota_peer'])
+    return tabel, profil
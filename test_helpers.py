@@ -0,0 +1,286 @@
+"""
+Uji paritas konversi Rupiah (helpers.convert_rupiah_to_numeric) terhadap
+jalur pandas versi lama (.str.replace berantai + pd.to_numeric), serta uji
+mesin numerik dan ingestion yang dipakai dashboard.
+"""
+
+import io
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import calculations as calc
+import ingestion as ingest
+from helpers import convert_rupiah_to_numeric
+
+
+def _konversi_lama(df):
+    """Salinan logika convert_rupiah_to_numeric sebelum mesin Arrow."""
+    for col in df.columns:
+        if df[col].dtype != 'object':
+            continue
+        valid_samples = df[col].dropna().head(5).astype(str).tolist()
+        if not valid_samples:
+            continue
+        if any(re.search('[a-z]', s.lower().replace('rp', '').replace('.', '').replace(',', '')
+                         .replace('-', '').strip()) for s in valid_samples):
+            continue
+        sample = valid_samples[0]
+        if '.' in sample and ',' in sample:
+            if sample.rfind('.') < sample.rfind(','):
+                df[col] = (df[col].astype(str)
+                           .str.replace('Rp', '', regex=False)
+                           .str.replace(' ', '', regex=False)
+                           .str.replace('.', '', regex=False)
+                           .str.replace(',', '.', regex=False)
+                           .apply(pd.to_numeric, errors='coerce'))
+        elif ',' in sample and '.' not in sample:
+            if sample.replace(',', '').strip().isdigit():
+                df[col] = (df[col].astype(str)
+                           .str.replace(',', '.', regex=False)
+                           .apply(pd.to_numeric, errors='coerce'))
+    return df
+
+
+KASUS = {
+    'indo': ['1.250.000,00', 'Rp 2.000,50', '2.000,50\t', ' 3.000,00', 'Rp. 4.500,25',
+             '-1.000,00', '7,5', None, '', 'abc', '1.2.3,4,5', '\n10.000,00\r'],
+    'desimal_koma': ['12,5', ' 12,5', '12,5\t', '7', '-3,25', None, '', '1,2,3', 'x', '+4,0'],
+    'ribuan_saja': ['1.000', '1.250,00', '2.000', '3.500'],
+    'teks': ['SKPD A', '1.000,00', 'SKPD B', 'SKPD C', 'SKPD D'],
+}
+
+
+@pytest.mark.parametrize('kolom', list(KASUS))
+def test_paritas_dengan_jalur_pandas_lama(kolom):
+    df = pd.DataFrame({kolom: pd.Series(KASUS[kolom], dtype=object)})
+    lama = _konversi_lama(df.copy())
+    baru = convert_rupiah_to_numeric(df.copy())
+    assert lama[kolom].dtype == baru[kolom].dtype
+    if pd.api.types.is_numeric_dtype(lama[kolom]):
+        np.testing.assert_array_equal(baru[kolom].to_numpy(dtype=float), lama[kolom].to_numpy(dtype=float))
+    else:
+        assert baru[kolom].tolist() == lama[kolom].tolist()
+
+
+def test_nbsp_di_tepi_dan_ribuan_diabaikan():
+    df = pd.DataFrame({'nilai': ['1.250,00', '\xa02.000,50', '3\xa0000,00\xa0']})
+    hasil = convert_rupiah_to_numeric(df)
+    assert hasil['nilai'].tolist() == [1250.0, 2000.5, 3000.0]
+
+
+def test_format_diputuskan_dari_contoh_pertama():
+    # '1.000' tanpa koma di contoh pertama: kolom tidak dikonversi (aturan lama)
+    df = pd.DataFrame({'nilai': ['1.000', '1.250,00', '2.000']})
+    hasil = convert_rupiah_to_numeric(df)
+    assert hasil['nilai'].tolist() == ['1.000', '1.250,00', '2.000']
+
+
+def test_mode_hemat_tidak_menurunkan_float():
+    # Total nilai buku harus eksak: float tetap float64, hanya integer di-downcast
+    rng = np.random.default_rng(0)
+    nilai = rng.integers(0, 16_000_000, 200_000)
+    df = pd.DataFrame({'float': nilai.astype(float), 'int': nilai})
+    hasil, _, _ = ingest.compact_dataframe(df)
+    assert hasil['float'].dtype == np.float64
+    assert hasil['int'].dtype == np.int32
+    assert hasil['float'].sum() == df['float'].sum()
+    assert hasil['int'].sum() == df['int'].sum()
+    assert hasil['float'].std() == df['float'].std()
+
+
+@pytest.mark.parametrize('metode', ['juknis', 'poisson'])
+def test_rf_skalar_sama_dengan_array(metode):
+    cl = np.array([90, 95, 99, 97.5])[:, None]
+    k = np.array([0, 1, 0, 3, 25])[None, :]
+    grid = calc.get_reliability_factor_array(cl, k, metode)
+    for i, c in enumerate(cl[:, 0]):
+        for j, e in enumerate(k[0]):
+            assert grid[i, j] == pytest.approx(calc.get_reliability_factor(c, int(e), metode), rel=1e-12)
+    # RF juknis nol kesalahan tidak bergantung pada elemen lain di array
+    if metode == 'juknis':
+        assert calc.get_reliability_factor_array(95, [0, 1, 0])[0] == 3.00
+        assert calc.get_reliability_factor_array(99, [0, 1])[0] == 3.70
+
+
+def test_mus_grid_sama_dengan_skalar():
+    cl = np.array([90, 95, 99])[:, None, None]
+    ef = np.array([1, 5, 10])[None, :, None]
+    k = np.array([0, 1, 2])[None, None, :]
+    grid = calc.calculate_mus_grid(5e9, cl, 1e8, 1e7, ef, k)
+    for idx in np.ndindex(grid.shape):
+        n, _ = calc.calculate_mus(5e9, int(cl[idx[0], 0, 0]), 1e8, 1e7, int(ef[0, idx[1], 0]),
+                                  int(k[0, 0, idx[2]]))
+        assert grid[idx] == n
+
+
+def test_evaluasi_mus_basic_precision_stabil():
+    tanpa = calc.evaluasi_mus(1e6, 100, [], [], 99)
+    dengan = calc.evaluasi_mus(1e6, 100, [1000], [500], 99)
+    assert tanpa['basic_precision'] == dengan['basic_precision'] == 3.70 * 10_000
+
+
+def test_rf_tabel_juknis_dan_poisson():
+    from scipy.special import gammaincinv
+
+    for cl, rf in calc.RF_JUKNIS.items():
+        assert calc.get_reliability_factor(cl, 0, 'juknis') == rf
+    # Poisson: RF = gammaincinv(k + 1, CL), termasuk k di luar cache tabel
+    for cl in (80, 90, 95, 97.5, 99):
+        for k in (0, 1, 5, calc.RF_MAKS_KESALAHAN, calc.RF_MAKS_KESALAHAN + 5):
+            assert calc.get_reliability_factor(cl, k, 'poisson') == pytest.approx(
+                gammaincinv(k + 1, cl / 100), rel=1e-12)
+    with pytest.raises(ValueError):
+        calc.get_reliability_factor_array(100, 0)
+
+
+def test_alokasi_neyman_total_tepat_dan_dibatasi_populasi():
+    # Bobot Neyman strata kedua (10 x 100) melebihi populasinya: kelebihan
+    # dibagikan ulang ke strata lain, total tetap n
+    alokasi = calc.alokasi_sampel(100, [50, 10, 1000], [1, 100, 1])
+    assert alokasi.tolist() == [4, 10, 86]
+
+    rng = np.random.default_rng(3)
+    counts = rng.integers(1, 500, 300)
+    sd = rng.gamma(2, 1e6, 300)
+    for metode in calc.METODE_ALOKASI:
+        for n in (1, 250, 5_000, int(counts.sum()) + 10):
+            alokasi = calc.alokasi_sampel(n, counts, sd, metode, biaya=rng.uniform(1, 4, 300))
+            assert alokasi.sum() == min(n, counts.sum())
+            assert np.all((alokasi >= 0) & (alokasi <= counts))
+
+
+def test_alokasi_take_all_dan_n_min():
+    counts = [50, 10, 1000, 3]
+    alokasi = calc.alokasi_sampel(100, counts, [1, 100, 1, 0], take_all=[False, True, False, False], n_min=5)
+    assert alokasi[1] == 10          # take-all diperiksa seluruhnya
+    assert alokasi[0] >= 5 and alokasi[2] >= 5
+    assert alokasi[3] == 3           # n_min dibatasi populasi strata
+    assert alokasi.sum() == 100
+    # n lebih kecil dari kebutuhan take-all + n_min: dinaikkan seperlunya
+    assert calc.alokasi_sampel(5, counts, metode='proporsional', take_all=[False, True, False, False],
+                               n_min=5).tolist() == [5, 10, 5, 3]
+
+
+@pytest.mark.parametrize('take_all', [False, True])
+def test_batas_strata_lh_tidak_lebih_buruk_dari_dh(take_all):
+    rng = np.random.default_rng(11)
+    values = rng.lognormal(15, 1.5, 20_000)
+    sst = values.sum() * 0.05
+    hist = calc.histogram_strata(values)
+    dh = calc.optimasi_batas_strata(values, 4, 95, sst, 'dh', take_all, hist=hist)
+    lh = calc.optimasi_batas_strata(values, 4, 95, sst, 'lh', take_all, hist=hist)
+    assert lh['n'] <= dh['n']
+    assert np.all(np.diff(lh['batas']) > 0)
+
+
+def test_quantile_sketch_gabungan_dalam_batas_galat():
+    rng = np.random.default_rng(5)
+    values = np.concatenate([rng.lognormal(13, 2, 30_000), np.zeros(500)])
+    rng.shuffle(values)
+    gabungan = calc.QuantileSketch(0.01)
+    for shard in np.array_split(values, 7):
+        gabungan.merge(calc.QuantileSketch(0.01).update(shard))
+    tunggal = calc.QuantileSketch(0.01).update(values)
+
+    assert gabungan.count == values.size
+    for q in (0.01, 0.1, 0.5, 0.9, 0.999):
+        eksak = np.quantile(values, q)
+        assert gabungan.quantile(q) == tunggal.quantile(q)
+        assert abs(gabungan.quantile(q) - eksak) <= 0.01 * abs(eksak) + 1e-9
+    with pytest.raises(ValueError):
+        gabungan.merge(calc.QuantileSketch(0.02))
+
+
+def _xlsx_baris_kosong():
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['ID', 'KETERANGAN', 'NILAI'])
+    ws.append(['A1', 'x', 100])
+    ws.append([None, None, None])            # baris kosong
+    ws.append([None, 'hanya keterangan', None])  # kosong di kolom terpilih
+    ws.append(['A4', None, 400])
+    ws.append([None, None, None])
+    ws.append(['A6', 'y', 600])
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
+
+
+def test_baris_excel_sesuai_nomor_baris_sheet():
+    buf = _xlsx_baris_kosong()
+    df = ingest.load_excel_projection(buf, ['ID', 'NILAI'])
+    isi = df.dropna(subset=['ID'])
+    assert isi[ingest.EXCEL_ROW_COL].tolist() == [2, 5, 7]
+    assert isi['ID'].tolist() == ['A1', 'A4', 'A6']
+
+    # Ekspor baris lengkap memakai nomor baris yang sama
+    lengkap = ingest.expand_excel_rows(buf, isi.iloc[[1, 2]])
+    assert lengkap['ID'].tolist() == ['A4', 'A6']
+    assert lengkap['NILAI'].tolist() == [400, 600]
+
+
+BULAN_UJI = ['JANUARI', 'FEBRUARI', 'MARET', 'APRIL', 'MEI', 'JUNI']
+
+
+def _register_pendapatan(n, rng):
+    nilai = np.round(rng.lognormal(12, 1, (n, len(BULAN_UJI))), -2)
+    nilai[rng.random(nilai.shape) < 0.1] = np.nan
+    nilai[:40] = np.tile(nilai[:4], (10, 1))  # deret identik untuk klaster
+    nilai[40:60] = 1_500_000.0                # pelaporan identik
+    df = pd.DataFrame(nilai, columns=BULAN_UJI)
+    df.insert(0, 'NPWPD', [f'P{i:05d}' for i in range(n)])
+    df.insert(0, 'NAMA WP', [f'WP {i}' for i in range(n)])
+    return df
+
+
+@pytest.mark.parametrize('pembulatan', [None, -3])
+@pytest.mark.parametrize('panel', [False, True])
+def test_analisis_inkremental_sama_dengan_penuh(pembulatan, panel):
+    import pendapatan_analyzer as pa
+    from pendapatan_panel import PanelPendapatan
+
+    rng = np.random.default_rng(7)
+    klaster = {'pembulatan': pembulatan}
+    lama = _register_pendapatan(2_000, rng)
+    baru = lama.drop(index=range(100, 130)).sample(frac=1, random_state=1).reset_index(drop=True)
+    ubah = rng.choice(len(baru), 25, replace=False)
+    baru.loc[ubah, 'MARET'] = baru.loc[ubah, 'MARET'].fillna(0) + 12_345
+    baru.loc[ubah[:5], BULAN_UJI] = 2_000_000.0
+    tambahan = _register_pendapatan(50, rng)
+    tambahan['NPWPD'] = [f'N{i}' for i in range(50)]
+    baru = pd.concat([baru, tambahan], ignore_index=True)
+    if panel:
+        lama = PanelPendapatan.from_dataframe(lama, BULAN_UJI)
+        baru = PanelPendapatan.from_dataframe(baru, BULAN_UJI)
+
+    pa._ANALISIS_CACHE.clear()
+    sebelumnya = pa.analisis_pendapatan(lama, BULAN_UJI, klaster=klaster)
+    inkremental = pa.analisis_pendapatan(baru, BULAN_UJI, sebelumnya=sebelumnya, klaster=klaster)
+    pa._ANALISIS_CACHE.clear()
+    penuh = pa.analisis_pendapatan(baru, BULAN_UJI, klaster=klaster)
+
+    assert inkremental['inkremental'] == {'baru': 50, 'berubah': 25, 'tetap': 1_945, 'dihapus': 30}
+    assert penuh['inkremental'] is None
+    pd.testing.assert_frame_equal(inkremental['anomali'], penuh['anomali'])
+    for bagian in ('ringkasan', 'anggota'):
+        pd.testing.assert_frame_equal(inkremental['klaster'][bagian], penuh['klaster'][bagian])
+    for kunci, nilai in penuh['statistik'].items():
+        assert inkremental['statistik'][kunci] == pytest.approx(nilai, rel=1e-12)
+    np.testing.assert_array_equal(inkremental['indeks']['urut'], penuh['indeks']['urut'])
+
+
+def test_sniff_csv_cache_dicek_sebelum_deteksi(monkeypatch):
+    import helpers
+
+    data = ('a;b;c\n' + ''.join(f'{i};nama é {i};{i},5\n' for i in range(500))).encode('cp1252')
+    hasil = helpers.sniff_csv(io.BytesIO(data))
+
+    def _gagal():
+        raise AssertionError("detektor encoding dijalankan ulang")
+    monkeypatch.setattr(helpers, 'UniversalDetector', _gagal)
+    assert helpers.sniff_csv(io.BytesIO(data)) == hasil